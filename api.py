@@ -0,0 +1,298 @@
+"""API JSON somente leitura para integrações dos compradores.
+
+Os sistemas de compra consultavam a tela do Streamlit, e cada consulta
+custava uma execução inteira do script. Esta API roda ao lado do app
+(sozinha pela linha de comando ou numa thread do balanceador) e lê o mesmo
+``database.db`` pelo ``GerenciadorBanco``:
+
+- ``GET /api/hortas?especie=alface&cursor=120&limite=50``: hortas ativas em
+  ordem de ``horta_id``; ``proximo`` é o cursor da página seguinte (ou null)
+- ``GET /api/feed?desde=3400&limite=100``: postagens com ``feed_id`` maior
+  que ``desde``, da mais antiga para a mais nova; ``ultimo`` vai no próximo ``desde``
+
+O ETag e o Last-Modified vêm das gerações das tabelas lidas (tabela
+``alteracoes``), então uma consulta repetida sem escrita no meio recebe
+``304 Not Modified`` sem tocar no banco. Os corpos saem em gzip quando o
+cliente aceita, e a resposta codificada fica em cache até a geração mudar.
+
+As respostas trazem endereço, contato e localização dos produtores, que no
+app só aparecem com login. Por isso a API só sobe com um segredo
+compartilhado configurado, exigido em todo pedido
+(``Authorization: Bearer <segredo>``; sem ele, 401), e por padrão só
+escuta em 127.0.0.1: para expô-la, passe por um proxy com HTTPS.
+
+Variáveis de ambiente:
+
+- ``CAMPOCIDADE_TOKEN_API``: segredo dos integradores (sem ele a API não sobe)
+- ``CAMPOCIDADE_PORTA_API``: porta da API (padrão 8503; 0 desliga)
+- ``CAMPOCIDADE_HOST_API``: interface em que escuta (padrão 127.0.0.1)
+
+Para rodar sozinha, inclusive contra um banco temporário de teste:
+
+    CAMPOCIDADE_TOKEN_API=segredo python api.py [--porta 8503] [--banco /tmp/teste.db]
+    curl -i --compressed -H "Authorization: Bearer segredo" "http://localhost:8503/api/hortas?especie=alface"
+"""
+
+import argparse
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from banco import CacheConsultas
+
+PORTA_API = int(os.environ.get("CAMPOCIDADE_PORTA_API", 8503))
+HOST_API = os.environ.get("CAMPOCIDADE_HOST_API", "127.0.0.1")
+TOKEN_API = os.environ.get("CAMPOCIDADE_TOKEN_API", "")
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+# Corpos menores que isto não compensam o gzip
+MINIMO_GZIP = 512
+# Respostas prontas (JSON já codificado) guardadas por ETag
+RESPOSTAS_EM_CACHE = 256
+
+SQL_HORTAS = """
+    SELECT horta_id, nome_horta, especie, dias_colheita, data_plantio, data_colheita,
+           endereco, latitude, longitude, contato
+    FROM hortas
+    WHERE ativa = 1 AND horta_id > ? {filtro}
+    ORDER BY horta_id
+    LIMIT ?
+"""
+
+SQL_FEED = """
+    SELECT feed_id, data_postagem, horta_id, nome_horta, especie, nome, descricao, foto
+    FROM feed_cards
+    WHERE feed_id > ?
+    ORDER BY feed_id
+    LIMIT ?
+"""
+
+
+class ErroConsulta(ValueError):
+    """Parâmetro inválido: vira um 400 com a mensagem."""
+
+
+def _inteiro(parametros, nome, padrao, minimo=0, maximo=None):
+    valor = parametros.get(nome, [None])[-1]
+    if valor in (None, ""):
+        return padrao
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErroConsulta(f"{nome} deve ser um número inteiro")
+    if numero < minimo or (maximo is not None and numero > maximo):
+        raise ErroConsulta(f"{nome} deve estar entre {minimo} e {maximo}" if maximo else f"{nome} deve ser >= {minimo}")
+    return numero
+
+
+def consultar_hortas(banco, parametros):
+    cursor = _inteiro(parametros, "cursor", 0)
+    limite = _inteiro(parametros, "limite", LIMITE_PADRAO, 1, LIMITE_MAXIMO)
+    especie = parametros.get("especie", [""])[-1].strip()
+
+    filtro, valores = "", [cursor]
+    if especie:
+        filtro = "AND lower(trim(especie)) = lower(trim(?))"  # usa idx_hortas_especie
+        valores.append(especie)
+    linhas = banco.consultar(SQL_HORTAS.format(filtro=filtro), (*valores, limite + 1), tabelas=("hortas",))
+
+    hortas = [dict(linha) for linha in linhas[:limite]]
+    proximo = hortas[-1]["horta_id"] if len(linhas) > limite else None
+    return {"hortas": hortas, "proximo": proximo}
+
+
+def consultar_feed(banco, parametros):
+    desde = _inteiro(parametros, "desde", 0)
+    limite = _inteiro(parametros, "limite", LIMITE_PADRAO, 1, LIMITE_MAXIMO)
+
+    # idx_feed_cards_id: faixa a partir do último feed_id que o cliente já tem
+    linhas = banco.consultar(SQL_FEED, (desde, limite), tabelas=("feed_hortas", "users", "hortas"))
+    postagens = [dict(linha) for linha in linhas]
+    return {"postagens": postagens, "ultimo": postagens[-1]["feed_id"] if postagens else desde}
+
+
+# caminho -> (função, tabelas lidas, parâmetros aceitos)
+ROTAS = {
+    "/api/hortas": (consultar_hortas, ("hortas",), ("especie", "cursor", "limite")),
+    "/api/feed": (consultar_feed, ("feed_hortas", "users", "hortas"), ("desde", "limite")),
+}
+
+
+def alterada_em(banco, tabelas):
+    """Última alteração (segundos desde 1970) das tabelas, ou None se nunca mudaram."""
+    marcadores = ", ".join("?" * len(tabelas))
+    linha = banco.consultar(
+        f"SELECT max(alterada_em) FROM alteracoes WHERE tabela IN ({marcadores})", tabelas,
+        tabelas=tabelas, um=True)
+    return linha[0]
+
+
+class ManipuladorApi(BaseHTTPRequestHandler):
+    """GET/HEAD das rotas JSON com ETag, Last-Modified, 304 e gzip."""
+
+    server_version = "CampoCidadeApi"
+
+    def do_HEAD(self):
+        self._responder(corpo=False)
+
+    def do_GET(self):
+        self._responder(corpo=True)
+
+    def _responder(self, corpo):
+        if not self._autorizado():
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Bearer realm="campocidade"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        url = urlsplit(self.path)
+        rota = ROTAS.get(url.path.rstrip("/"))
+        if rota is None:
+            self._json(404, {"erro": "rota desconhecida", "rotas": sorted(ROTAS)}, corpo)
+            return
+        consultar, tabelas, aceitos = rota
+        banco = self.server.banco
+
+        # A chave só leva os parâmetros aceitos, em ordem fixa
+        parametros = {nome: valores for nome, valores in parse_qs(url.query).items() if nome in aceitos}
+        consulta = urlencode(sorted((nome, valores[-1]) for nome, valores in parametros.items()))
+        geracoes = "-".join(str(banco.geracao(tabela)) for tabela in tabelas)
+        etag = f'W/"{geracoes}-{hashlib.sha1(f"{url.path}?{consulta}".encode()).hexdigest()[:16]}"'
+        modificado = alterada_em(banco, tabelas)
+
+        if self._nao_mudou(etag, modificado):
+            self.send_response(304)
+            self._cabecalhos_cache(etag, modificado)
+            self.end_headers()
+            return
+
+        gzip_aceito = "gzip" in self.headers.get("Accept-Encoding", "")
+        chave = (etag, gzip_aceito)
+        encontrado, pronta = self.server.respostas.obter(chave)
+        if not encontrado:
+            try:
+                dados = json.dumps(consultar(banco, parametros), ensure_ascii=False, default=str).encode()
+            except ErroConsulta as e:
+                self._json(400, {"erro": str(e)}, corpo)
+                return
+            compactado = gzip_aceito and len(dados) >= MINIMO_GZIP
+            pronta = (gzip.compress(dados, compresslevel=6) if compactado else dados, compactado)
+            self.server.respostas.guardar(chave, pronta)
+
+        dados, compactado = pronta
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.send_header("Vary", "Accept-Encoding")
+        if compactado:
+            self.send_header("Content-Encoding", "gzip")
+        self._cabecalhos_cache(etag, modificado)
+        self.end_headers()
+        if corpo:
+            self.wfile.write(dados)
+
+    def _autorizado(self):
+        tipo, _, segredo = self.headers.get("Authorization", "").partition(" ")
+        return tipo.lower() == "bearer" and hmac.compare_digest(segredo.strip().encode(), self.server.token.encode())
+
+    def _nao_mudou(self, etag, modificado):
+        # If-None-Match tem precedência; If-Modified-Since só vale sem ele
+        pedido = self.headers.get("If-None-Match")
+        if pedido is not None:
+            return pedido.strip() == "*" or etag in [valor.strip() for valor in pedido.split(",")]
+        desde = self.headers.get("If-Modified-Since")
+        if desde is None or modificado is None:
+            return False
+        try:
+            return int(modificado) <= parsedate_to_datetime(desde).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def _cabecalhos_cache(self, etag, modificado):
+        # O cliente pode guardar, mas confere a cada uso (barato: 304)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", etag)
+        if modificado is not None:
+            self.send_header("Last-Modified", formatdate(modificado, usegmt=True))
+
+    def _json(self, status, conteudo, corpo):
+        dados = json.dumps(conteudo, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        if corpo:
+            self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass  # cada consulta dos integradores só atrapalharia o log do Streamlit
+
+
+def criar_servidor(banco, host=HOST_API, porta=PORTA_API, token=TOKEN_API):
+    """Servidor da API sobre ``banco``, ainda parado (``serve_forever`` inicia).
+
+    Com ``porta=0`` o SO escolhe uma porta livre (``servidor.server_port``).
+    """
+    if not token:
+        raise ValueError("Defina CAMPOCIDADE_TOKEN_API para subir a API.")
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorApi)
+    servidor.daemon_threads = True
+    servidor.banco = banco
+    servidor.token = token
+    servidor.respostas = CacheConsultas(max_entradas=RESPOSTAS_EM_CACHE)
+    return servidor
+
+
+_servidor = None
+_lock_servidor = threading.Lock()
+
+
+def iniciar_api(banco, porta=PORTA_API, host=HOST_API, token=TOKEN_API):
+    """Sobe a API numa thread, uma vez por processo; retorna a porta ou None.
+
+    Sem ``token`` (ou com porta 0) a API fica desligada. Se a porta já
+    estiver em uso, não faz nada: quem a ocupa lê o mesmo banco.
+    """
+    global _servidor
+
+    if not porta or not token:
+        return None
+    with _lock_servidor:
+        if _servidor is None:
+            try:
+                _servidor = criar_servidor(banco, host, porta, token)
+            except OSError as e:
+                print(f"API não iniciada na porta {porta}: {e}", file=sys.stderr)
+                return porta
+            threading.Thread(target=_servidor.serve_forever, name="servidor-api", daemon=True).start()
+    return porta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--porta", type=int, default=PORTA_API or 8503, help="porta da API")
+    parser.add_argument("--host", default=HOST_API, help="interface em que escuta")
+    parser.add_argument("--banco", default=None, help="caminho do banco (padrão: database.db)")
+    args = parser.parse_args()
+    if not TOKEN_API:
+        parser.error("defina CAMPOCIDADE_TOKEN_API com o segredo dos integradores")
+
+    from banco import DATABASE, GerenciadorBanco, migrar
+
+    banco = GerenciadorBanco(args.banco or DATABASE)
+    migrar(banco)
+    servidor = criar_servidor(banco, args.host, args.porta)
+    print(f"API em http://{args.host}:{servidor.server_port}/api/hortas e /api/feed")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,26 +1,29 @@
 import streamlit as st
-import sqlite3
-import time
-import pandas as pd
-import matplotlib.pyplot as plt
 import os
-from PIL import Image
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+import re
+from datetime import date, datetime, timedelta
+from arquivamento import RETENCAO_DIAS, arquivar_feed, feed_arquivado, meses_arquivados
+from banco import TIMEOUT_POOL, EscritorLote, GerenciadorBanco, migrar
+from demandas import RAIO_PADRAO_KM, UNIDADES, corresponder_hortas, registrar_demanda
+from desempenho import ARQUIVO_PROMETHEUS, iniciar_exportacao, instalar, medir_pagina, registro
+from estaticos import PORTA_IMAGENS, SOB_BALANCEADOR, base_imagens, iniciar_servidor, url_imagem
+from geo import geocodificar, hortas_proximas
+from lote import EXPORTACOES, exportar_para_arquivo, importar_hortas, ler_planilha
+from midia import (
+    bytes_para_exibir, cache_imagens, coletar_lixo, iniciar_verificacao, metadados_fotos, registrar_imagem, salvar_conteudo,
+    verificar_imagens,
+)
+from senhas import PoolOcupado, aguardar_tentativa, gerar_hash, precisa_rehash, verificar_senha
+
+# Módulos pesados (pandas, matplotlib, PIL) são importados dentro das funções
+# que os usam, para não pesar no início de cada processo.
+# Custo de importação: python relatorio_importacao.py
 
 # ========================== CONFIGURAÇÃO DE DIRETÓRIOS ==========================
 UPLOAD_FOLDER = "uploads"
 IMAGENS_FOLDER = "imagens"
 DEFAULT_USER_IMG = os.path.join(IMAGENS_FOLDER, "default-user.jpg")
-
-# Criar diretórios caso não existam
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(IMAGENS_FOLDER, exist_ok=True)
-
-# Criar um placeholder para a imagem padrão se ela não existir
-if not os.path.exists(DEFAULT_USER_IMG):
-    with open(DEFAULT_USER_IMG, "wb") as f:
-        f.write(b"")  # Cria um arquivo vazio para evitar erro
+DEFAULT_HORTA_IMG = os.path.join(IMAGENS_FOLDER, "default-horta.jpg")
 
 # ========================== FUNÇÕES DO BANCO DE DADOS ==========================
 
@@ -28,99 +31,135 @@ if not os.path.exists(DEFAULT_USER_IMG):
 DATABASE = "database.db"
 UPLOAD_FOLDER = "uploads"
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def coluna_existe(nome_tabela, nome_coluna):
-    if not nome_tabela.isidentifier():
-        raise ValueError("Nome de tabela inválido.")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute(f"PRAGMA table_info({nome_tabela})")  # PRAGMA não aceita `?`
-    colunas = [row["name"] for row in cursor.fetchall()]
-    conn.close()
-    return nome_coluna in colunas
-
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            idade INTEGER,
-            telefone TEXT NOT NULL,
-            endereco TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            senha TEXT NOT NULL,
-            is_admin INTEGER NOT NULL DEFAULT 0
-        );
-    ''')
-
-    if not coluna_existe("users", "foto_perfil"):
-        cursor.execute("ALTER TABLE users ADD COLUMN foto_perfil TEXT DEFAULT '';")
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS hortas (
-            horta_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome_horta TEXT NOT NULL,
-            usuario_id INTEGER NOT NULL,
-            foto TEXT NOT NULL,
-            especie TEXT NOT NULL,
-            dias_colheita INTEGER NOT NULL,
-            contato TEXT NOT NULL,
-            endereco TEXT NOT NULL,
-            email TEXT NOT NULL,
-            FOREIGN KEY (usuario_id) REFERENCES users(user_id)
-        );
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS feed_hortas (
-            feed_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            horta_id INTEGER NOT NULL,
-            usuario_id INTEGER NOT NULL,
-            foto TEXT NOT NULL,
-            descricao TEXT,
-            data_postagem DATETIME NOT NULL,
-            FOREIGN KEY (horta_id) REFERENCES hortas(horta_id),
-            FOREIGN KEY (usuario_id) REFERENCES users(user_id)
-        );
-    ''')
-
-    conn.commit()
-    conn.close()
+@st.cache_resource
+def get_banco():
+    """Gerenciador de conexões compartilhado por todas as sessões do processo."""
+    return GerenciadorBanco(DATABASE)
+
+def conexao():
+    """Conexão do pool para leituras: `with conexao() as conn:`."""
+    return get_banco().conexao()
+
+def transacao(*tabelas):
+    """Transação explícita para escritas: `with transacao("hortas") as conn:`.
+
+    As tabelas informadas têm o cache de consultas invalidado no COMMIT.
+    """
+    return get_banco().transacao(*tabelas)
+
+def consultar(sql, parametros=(), tabelas=(), um=False):
+    """SELECT com cache, invalidado quando alguma das `tabelas` é escrita."""
+    return get_banco().consultar(sql, parametros, tabelas=tabelas, um=um)
+
+@st.cache_resource
+def get_escritor():
+    """Escritor único do processo: as postagens no feed são gravadas em lote."""
+    return EscritorLote(get_banco())
+
+def guardar_imagem(dados):
+    """Grava a imagem pelo hash do conteúdo e registra os metadados. Retorna o caminho.
+
+    O caminho nunca é sobrescrito por outro upload; postagens antigas que o
+    citam continuam mostrando a mesma foto.
+    """
+    caminho = salvar_conteudo(dados, UPLOAD_FOLDER)
+    with transacao("imagens") as conn:
+        registrar_imagem(conn, caminho)
+    return caminho
+
+def fotos_da_pagina(caminhos):
+    """Metadados das fotos exibidas numa página, sem consultar o disco."""
+    with conexao() as conn:
+        return metadados_fotos(conn, caminhos)
+
+def imagem_para_exibir(caminho, metadados, largura=None, padrao=None):
+    """O que passar ao `st.image`: a URL estática da foto ou, sem URL configurada, os bytes.
+
+    Pela URL o navegador guarda a imagem em cache e o rerun não a reenvia.
+    Sem a foto, usa a imagem `padrao` (se informada); sem nenhuma, None.
+    """
+    base = base_imagens() if iniciar_imagens() else None
+    for foto in (caminho, padrao):
+        if not foto:
+            continue
+        exibir = url_imagem(base, foto, metadados, largura) or bytes_para_exibir(foto, metadados, largura)
+        if exibir:
+            return exibir
+    return None
+
+def ip_cliente():
+    """IP de quem acessa, ou None.
+
+    Atrás do balanceador a conexão vem de 127.0.0.1 (o Streamlit devolve None)
+    e o IP real chega em X-Forwarded-For, que o balanceador sempre reescreve.
+    """
+    ip = st.context.ip_address
+    if ip is None:
+        ip = (st.context.headers.get("X-Forwarded-For") or "").split(",")[-1].strip() or None
+    return ip
+
+def ler_data(valor):
+    """`date` de uma coluna DATE do SQLite (texto ISO), ou None."""
+    return date.fromisoformat(valor[:10]) if valor else None
 
 def criar_usuario_admin():
     email_admin = "ADM@123"
     senha_admin = "123456"
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT user_id FROM users WHERE email = ?", (email_admin,))
-    admin_exists = cursor.fetchone()
+    with conexao() as conn:
+        admin_exists = conn.execute("SELECT user_id FROM users WHERE email = ?", (email_admin,)).fetchone()
 
     if admin_exists:
-        conn.close()
         return
 
-    senha_hash = generate_password_hash(senha_admin)
-    cursor.execute('''
-        INSERT INTO users (email, senha, nome, is_admin, telefone, endereco, idade) 
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (email_admin, senha_hash, "Administrador", 1, "61986221356", "SAD", 32))
+    senha_hash = gerar_hash(senha_admin)
+    with transacao("users") as conn:
+        conn.execute('''
+            INSERT OR IGNORE INTO users (email, senha, nome, is_admin, telefone, endereco, idade) 
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (email_admin, senha_hash, "Administrador", 1, "61986221356", "SAD", 32))
+
+@st.cache_resource
+def iniciar_instrumentacao():
+    """Liga a coleta de desempenho antes da primeira conexão do pool."""
+    instalar()
+    iniciar_exportacao()
 
-    conn.commit()
-    conn.close()
+iniciar_instrumentacao()
+
+@st.cache_resource
+def init_db():
+    """Prepara diretórios, esquema e admin uma única vez por processo."""
+    # Criar diretórios caso não existam
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(IMAGENS_FOLDER, exist_ok=True)
+
+    # Criar um placeholder para a imagem padrão se ela não existir
+    if not os.path.exists(DEFAULT_USER_IMG):
+        with open(DEFAULT_USER_IMG, "wb") as f:
+            f.write(b"")  # Cria um arquivo vazio para evitar erro
+
+    # Migrações versionadas por PRAGMA user_version, sob lock de arquivo
+    versao = migrar(get_banco())
+    criar_usuario_admin()
+    # Arquivos ausentes/vazios são marcados em segundo plano, não a cada página
+    iniciar_verificacao(get_banco(), UPLOAD_FOLDER)
+    return versao
 
 init_db()
-criar_usuario_admin()
+
+@st.cache_resource
+def iniciar_imagens():
+    """Servidor HTTP das imagens, uma vez por processo; retorna a porta (None = desligado).
+
+    Só sobe com CAMPOCIDADE_URL_IMAGENS: sem endereço público as fotos vão em bytes.
+    Atrás do balanceador o servidor já roda nele, e os processos não disputam a porta.
+    """
+    if base_imagens() is None:
+        return None
+    if SOB_BALANCEADOR:
+        return PORTA_IMAGENS
+    return iniciar_servidor()
 
 # ========================== GERENCIAMENTO DE LOGIN ==========================
 
@@ -138,12 +177,35 @@ def login():
     senha = st.text_input("Senha", type="password", key="login_senha")
 
     if st.button("Entrar"):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        user = cursor.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
-        conn.close()
+        # Limita tentativas por IP e por email antes de gastar CPU com o hash
+        espera = aguardar_tentativa(email, ip_cliente())
+        if espera:
+            st.error(f"Muitas tentativas. Aguarde {espera} segundos e tente novamente.")
+            return
+
+        with conexao() as conn:
+            user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+
+        try:
+            senha_ok = bool(user) and verificar_senha(user["senha"], senha)
+        except PoolOcupado as e:
+            st.error(str(e))
+            return
+
+        if senha_ok:
+            # Refaz o hash se os parâmetros configurados mudaram
+            if precisa_rehash(user["senha"]):
+                try:
+                    # O hash sai antes da transação: o lock de escrita não espera o scrypt
+                    novo = gerar_hash(senha)
+                except PoolOcupado:
+                    novo = None  # tenta de novo no próximo login
+                if novo:
+                    with transacao("users") as conn:
+                        # Só troca se a senha não mudou enquanto o hash era calculado
+                        conn.execute("UPDATE users SET senha = ? WHERE user_id = ? AND senha = ?",
+                                     (novo, user["user_id"], user["senha"]))
 
-        if user and check_password_hash(user["senha"], senha):
             st.session_state["user"] = user
             st.success(f"Bem-vindo, {user['nome']}!")
             st.rerun()
@@ -162,14 +224,12 @@ def logout():
 
 # ========================== TELA PESSOAL DO USUÁRIO ==========================
 
-def salvar_foto(uploaded_file, nome_arquivo):
+def salvar_foto(uploaded_file):
     """Salva a foto no diretório correto e retorna o caminho do arquivo."""
     try:
         if uploaded_file is not None:
-            file_path = os.path.join(UPLOAD_FOLDER, nome_arquivo)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            return file_path
+            # Normaliza a orientação e grava os derivados (thumb, card, full)
+            return guardar_imagem(uploaded_file.getbuffer())
     except Exception as e:
         st.error(f"Erro ao salvar a imagem: {e}")
     return DEFAULT_USER_IMG  # Retorna a imagem padrão caso ocorra erro
@@ -181,11 +241,36 @@ def tela_usuario():
     # Converter para dicionário para permitir modificações
     st.session_state["user"] = dict(st.session_state["user"])
 
-    # Verifica se há uma foto de perfil cadastrada e se o arquivo existe
-    foto_perfil = st.session_state["user"].get("foto_perfil", None)
+    foto_de_perfil()
+
+    # Exibir informações do usuário
+    st.write(f"📧 **Email:** {st.session_state['user']['email']}")
+    st.write(f"📍 **Endereço:** {st.session_state['user']['endereco']}")
+    st.write(f"📞 **Telefone:** {st.session_state['user']['telefone']}")
+
+    # Buscar as hortas do usuário; cada card lê a própria horta
+    hortas = consultar(
+        "SELECT horta_id FROM hortas WHERE usuario_id = ?", (st.session_state["user"]["user_id"],), tabelas=("hortas",))
+
+    if not hortas:
+        st.warning(" 🌱  Ainda não cadastrou sua horta? ")
+        st.warning(" 🌱 VÁ ATÉ A BARRA DE NAVEGAÇAO AO LADO!")
+
+    else:
+        st.subheader("🌾 Minhas Hortas")
+        for horta in hortas:
+            cartao_horta(horta["horta_id"])
+
+
+# Os fragmentos abaixo rerodam sozinhos: um clique num card ou no upload da
+# foto não redesenha a página inteira. As mudanças de estado ficam nos
+# callbacks, que rodam antes do rerun (do fragmento ou, em testes, do app).
 
-    if not foto_perfil or not os.path.exists(foto_perfil) or os.path.getsize(foto_perfil) == 0:
-        foto_perfil = DEFAULT_USER_IMG  # Usa a imagem padrão caso a imagem esteja ausente ou vazia
+@st.fragment
+def foto_de_perfil():
+    # Foto de perfil pelos metadados registrados; sem ela, a imagem padrão
+    caminho_perfil = st.session_state["user"].get("foto_perfil", None)
+    foto_perfil = imagem_para_exibir(caminho_perfil, fotos_da_pagina([caminho_perfil]), 300, padrao=DEFAULT_USER_IMG)
 
     # Exibir imagem da foto de perfil responsivamente
     try:
@@ -194,101 +279,76 @@ def tela_usuario():
         st.warning(f"Erro ao carregar imagem, tente salvar alguma imagem: {e}")
         st.image("https://via.placeholder.com/150", caption="Imagem temporária")
 
+    if aviso := st.session_state.pop("aviso_foto_perfil", None):
+        st.success(aviso)
+
     # Opção para alterar a foto de perfil
-    if st.button("🔄 Alterar foto de perfil"):
-        st.session_state["alterar_foto"] = True
-        st.rerun()
+    st.button("🔄 Alterar foto de perfil", on_click=st.session_state.update, kwargs={"alterar_foto": True})
 
     # Upload de nova foto, se solicitado
     if st.session_state.get("alterar_foto", False):
-        uploaded_file = st.file_uploader("Envie sua foto de perfil", type=["jpg", "png", "jpeg"])
+        st.file_uploader(
+            "Envie sua foto de perfil", type=["jpg", "png", "jpeg"], key="upload_foto_perfil", on_change=trocar_foto_perfil)
 
-        if uploaded_file:
-            file_path = salvar_foto(uploaded_file, f"user_{st.session_state['user']['user_id']}.jpg")
 
-            # Atualizar o caminho da foto no banco de dados
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET foto_perfil = ? WHERE user_id = ?", (file_path, st.session_state["user"]["user_id"]))
-            conn.commit()
-            conn.close()
+def trocar_foto_perfil():
+    uploaded_file = st.session_state.get("upload_foto_perfil")
+    if not uploaded_file:
+        return
+    file_path = salvar_foto(uploaded_file)
 
-            # Atualizar o estado da sessão com a nova foto
-            st.session_state["user"]["foto_perfil"] = file_path
-            st.success("Foto de perfil atualizada com sucesso! Recarregando a página...")
-            
-            # Reseta a variável de controle e recarrega a página
-            st.session_state["alterar_foto"] = False
-            st.rerun()
+    # Atualizar o caminho da foto no banco de dados
+    with transacao("users") as conn:
+        conn.execute("UPDATE users SET foto_perfil = ? WHERE user_id = ?", (file_path, st.session_state["user"]["user_id"]))
 
-    # Exibir informações do usuário
-    st.write(f"📧 **Email:** {st.session_state['user']['email']}")
-    st.write(f"📍 **Endereço:** {st.session_state['user']['endereco']}")
-    st.write(f"📞 **Telefone:** {st.session_state['user']['telefone']}")
+    # Atualizar o estado da sessão com a nova foto e esconder o upload
+    st.session_state["user"]["foto_perfil"] = file_path
+    st.session_state["aviso_foto_perfil"] = "Foto de perfil atualizada com sucesso!"
+    st.session_state["alterar_foto"] = False
 
-    # Buscar as hortas do usuário
-    conn = get_db_connection()
-    hortas = conn.execute("SELECT * FROM hortas WHERE usuario_id = ?", (st.session_state["user"]["user_id"],)).fetchall()
-    conn.close()
 
-    if not hortas:
-        st.warning(" 🌱  Ainda não cadastrou sua horta? ")
-        st.warning(" 🌱 VÁ ATÉ A BARRA DE NAVEGAÇAO AO LADO!")
+@st.fragment
+def cartao_horta(horta_id):
+    horta = consultar("SELECT * FROM hortas WHERE horta_id = ?", (horta_id,), tabelas=("hortas",), um=True)
+    if not horta:
+        return
 
-    else:
-        st.subheader("🌾 Minhas Hortas")
-        for horta in hortas:
-            nome_horta = horta["nome_horta"]
-            especie = horta["especie"]
-            dias_colheita = horta["dias_colheita"]
-            foto = horta["foto"]
+    nome_horta = horta["nome_horta"]
+    foto = imagem_para_exibir(horta["foto"], fotos_da_pagina([horta["foto"]]), padrao=DEFAULT_HORTA_IMG)
 
-            # Verifica se a imagem existe e se tem conteúdo
-            if not foto or not os.path.exists(foto) or os.path.getsize(foto) == 0:
-                foto = "imagens/default-horta.jpg"
+    try:
+        st.image(foto, width="stretch")
+    except Exception as e:
+        st.warning(f"Erro ao carregar imagem da horta: {e}")
+        st.image("https://via.placeholder.com/300", width="stretch")
 
-            try:
-                st.image(foto, use_container_width=True)
-            except Exception as e:
-                st.warning(f"Erro ao carregar imagem da horta: {e}")
-                st.image("https://via.placeholder.com/300", use_container_width=True)
+    st.write(f"**Horta:** {nome_horta}")
+    st.write(f"**Espécie:** {horta['especie']}")
+    st.write(f"**Dias para Colheita:** {horta['dias_colheita']}")
+    if horta["data_colheita"]:
+        st.write(f"**Colheita prevista:** {ler_data(horta['data_colheita']):%d/%m/%Y}")
+    mostrar_aviso_horta(horta_id)
 
-            st.write(f"**Horta:** {nome_horta}")
-            st.write(f"**Espécie:** {especie}")
-            st.write(f"**Dias para Colheita:** {dias_colheita}")
+    # Botão para atualizar e postar no feed
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button(f"✏️ Atualizar {nome_horta}", key=f"update_{horta_id}",
+                  on_click=st.session_state.update, kwargs={"horta_em_edicao": horta_id})
 
-            # Botão para atualizar e postar no feed
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button(f"✏️ Atualizar {nome_horta}", key=f"update_{horta['horta_id']}"):
-                    st.session_state["horta_em_edicao"] = horta["horta_id"]
-                    st.rerun()
+    with col2:
+        if not horta["ativa"]:
+            st.caption("🚫 Horta desativada pela moderação: não aparece no feed nem nas buscas.")
+        elif st.button("📢 Postar no Feed", key=f"post_{horta_id}"):
+            mostrar_postagem(nome_horta, horta_id, horta["foto"])
+
+    # Se esta horta estiver sendo editada, o formulário aparece no próprio card
+    if st.session_state.get("horta_em_edicao") == horta_id:
+        editar_horta(horta_id)
 
-            with col2:
-                if st.button("📢 Postar no Feed", key=f"post_{horta['horta_id']}"):
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "INSERT INTO feed_hortas (horta_id, usuario_id, foto, descricao, data_postagem) VALUES (?, ?, ?, ?, ?)",
-                        (horta["horta_id"], st.session_state["user"]["user_id"], horta["foto"], f"Horta de {st.session_state['user']['nome']}", datetime.now())
-                    )
-                    conn.commit()
-                    conn.close()
-                    st.success(f"Horta '{nome_horta}' postada no feed!")
-
-    # Se uma horta estiver sendo editada, mostrar o formulário de edição
-    if "horta_em_edicao" in st.session_state:
-        editar_horta(st.session_state["horta_em_edicao"])
 
-            
 def editar_horta(horta_id):
     """ Função para editar uma horta existente """
-    # Armazena o ID da horta na sessão para rastreamento correto
-    st.session_state["horta_em_edicao"] = horta_id
-    
-    conn = get_db_connection()
-    horta = conn.execute("SELECT * FROM hortas WHERE horta_id = ?", (horta_id,)).fetchone()
-    conn.close()
+    horta = consultar("SELECT * FROM hortas WHERE horta_id = ?", (horta_id,), tabelas=("hortas",), um=True)
 
     if not horta:
         st.error("Horta não encontrada!")
@@ -296,171 +356,606 @@ def editar_horta(horta_id):
 
     st.subheader(f"✏️ Editar Horta: {horta['nome_horta']}")
 
-    # Campos do formulário
-    nome_horta = st.text_input("Nome da Horta", value=horta["nome_horta"])
-    especie = st.text_input("Espécie Plantada", value=horta["especie"])
-    dias_colheita = st.number_input("Dias para Colheita", min_value=1, step=1, value=horta["dias_colheita"])
-    endereco = st.text_input("Endereço da Horta", value=horta["endereco"])
+    # O formulário só é enviado no clique: digitar não gera rerun
+    with st.form(f"form_editar_{horta_id}"):
+        campos_horta(horta, "editar")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.form_submit_button("💾 Salvar Alterações", on_click=salvar_horta, args=(horta_id, "editar"))
+        with col2:
+            st.form_submit_button("❌ Cancelar", on_click=fechar_edicao)
+
+    # Postar no Feed
+    if st.button("📢 Postar no Feed", key=f"post_edicao_{horta_id}"):
+        mostrar_postagem(horta["nome_horta"], horta_id, horta["foto"])
+
+
+def campos_horta(horta, prefixo):
+    """Campos do formulário de edição; os valores ficam na sessão com chaves `{prefixo}_*_{horta_id}`."""
+    horta_id = horta["horta_id"]
+    st.text_input("🌿 Nome da Horta", value=horta["nome_horta"], key=f"{prefixo}_nome_{horta_id}")
+    st.text_input("📌 Espécie Plantada", value=horta["especie"], key=f"{prefixo}_especie_{horta_id}")
+    st.number_input("⏳ Dias para Colheita", min_value=1, step=1, value=horta["dias_colheita"],
+                    key=f"{prefixo}_dias_{horta_id}")
+    st.date_input("🌱 Data de Plantio", value=ler_data(horta["data_plantio"]), format="DD/MM/YYYY",
+                  key=f"{prefixo}_plantio_{horta_id}")
+    st.text_input("📍 Endereço da Horta", value=horta["endereco"], key=f"{prefixo}_endereco_{horta_id}")
+    st.file_uploader("📸 Atualize a foto da horta", type=["jpg", "png", "jpeg"], key=f"{prefixo}_foto_{horta_id}")
+
+
+def salvar_horta(horta_id, prefixo):
+    """Callback do formulário de edição: grava a horta e fecha o formulário."""
+    horta = consultar("SELECT * FROM hortas WHERE horta_id = ?", (horta_id,), tabelas=("hortas",), um=True)
+    if not horta:
+        fechar_edicao()
+        return
 
-    # Manipulação da foto
-    foto = st.file_uploader("Atualize a foto da horta", type=["jpg", "png", "jpeg"])
+    valores = {campo: st.session_state.get(f"{prefixo}_{campo}_{horta_id}")
+               for campo in ("nome", "especie", "dias", "plantio", "endereco", "foto")}
     file_path = horta["foto"]
-    
-    if foto:
-        file_path = salvar_foto(foto, f"horta_{horta_id}.jpg")
+    if valores["foto"]:
+        try:
+            file_path = guardar_imagem(valores["foto"].getbuffer())
+        except Exception as e:
+            st.session_state[f"aviso_horta_{horta_id}"] = ("error", f"⚠️ Erro ao salvar a nova imagem: {e}")
+            return
 
-    # Botões de ação
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("💾 Salvar Alterações"):
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE hortas 
-                SET nome_horta = ?, especie = ?, dias_colheita = ?, endereco = ?, foto = ?
-                WHERE horta_id = ?;
-            ''', (nome_horta, especie, dias_colheita, endereco, file_path, horta_id))
-            conn.commit()
-            conn.close()
-
-            st.success("Horta atualizada com sucesso!")
-            
-            # Remover estado de edição e recarregar a página
-            del st.session_state["horta_em_edicao"]
-            st.rerun()
-    
-    with col2:
-        if st.button("❌ Cancelar"):
-            del st.session_state["horta_em_edicao"]
-            st.rerun()
+    with transacao("hortas", "correspondencias") as conn:
+        conn.execute('''
+            UPDATE hortas 
+            SET nome_horta = ?, especie = ?, dias_colheita = ?, data_plantio = ?, endereco = ?, foto = ?
+            WHERE horta_id = ?;
+        ''', (valores["nome"], valores["especie"], valores["dias"], valores["plantio"], valores["endereco"],
+              file_path, horta_id))
+        atualizar_coordenadas(conn, horta, valores["endereco"])
+        corresponder_hortas(conn, [horta_id])
+
+    st.session_state[f"aviso_horta_{horta_id}"] = ("success", "✅ Horta atualizada com sucesso!")
+    fechar_edicao()
+
+
+def fechar_edicao():
+    st.session_state.pop("horta_em_edicao", None)
+
+
+def mostrar_aviso_horta(horta_id):
+    """Mostra (uma vez) o resultado do último salvamento da horta."""
+    if aviso := st.session_state.pop(f"aviso_horta_{horta_id}", None):
+        tipo, mensagem = aviso
+        getattr(st, tipo)(mensagem)
+
+
+def postar_no_feed(horta_id, foto):
+    """Envia a postagem da horta ao escritor em lote; retorna um Future.
+
+    O resultado é (feed_id, mesclada). Uma nova postagem da mesma horta
+    dentro de JANELA_REPOSTAGEM atualiza a anterior em vez de duplicá-la.
+    """
+    usuario = st.session_state["user"]
+    descricao = f"Horta de {usuario['nome']}"
+    agora = datetime.now()
+
+    def gravar(conn):
+        recente = conn.execute("""
+            SELECT feed_id FROM feed_hortas
+            WHERE horta_id = ? AND data_postagem >= ?
+            ORDER BY data_postagem DESC LIMIT 1
+        """, (horta_id, agora - JANELA_REPOSTAGEM)).fetchone()
+        if recente:
+            conn.execute(
+                "UPDATE feed_hortas SET foto = ?, descricao = ? WHERE feed_id = ?",
+                (foto, descricao, recente["feed_id"]),
+            )
+            return recente["feed_id"], True
+        cursor = conn.execute(
+            "INSERT INTO feed_hortas (horta_id, usuario_id, foto, descricao, data_postagem) VALUES (?, ?, ?, ?, ?)",
+            (horta_id, usuario["user_id"], foto, descricao, agora),
+        )
+        return cursor.lastrowid, False
 
-    # Postar no Feed
-    if st.button("📢 Postar no Feed"):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO feed_hortas (horta_id, usuario_id, foto, descricao, data_postagem)
-            VALUES (?, ?, ?, ?, ?)
-        """, (horta_id, st.session_state["user"]["user_id"], file_path, f"Horta de {st.session_state['user']['nome']}", datetime.now()))
-        conn.commit()
-        conn.close()
-        st.success("Horta postada no feed!")
-
-
-# ========================== EXCLUIR HORTA ==========================
-
-
-def excluir_horta(horta_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM hortas WHERE horta_id = ?", (horta_id,))
-    conn.commit()
-    conn.close()
-    st.success("✅ Horta excluída com sucesso!")
-    st.rerun()
+    # Cliques repetidos ainda na fila viram um só pedido
+    return get_escritor().enviar(gravar, ("feed_hortas",), chave=("feed", horta_id))
+
+
+def mostrar_postagem(nome_horta, horta_id, foto):
+    """Posta a horta no feed e confirma na tela quando o lote for gravado."""
+    try:
+        _, mesclada = postar_no_feed(horta_id, foto).result(timeout=TIMEOUT_POOL)
+    except Exception as e:
+        st.error(f"Não foi possível postar no feed: {e}")
+        return
+    if mesclada:
+        st.info(f"Horta '{nome_horta}' já estava no feed; a postagem recente foi atualizada.")
+    else:
+        st.success(f"Horta '{nome_horta}' postada no feed!")
+
+
+def atualizar_coordenadas(conn, horta, endereco):
+    """Geocodifica de novo a horta quando o endereço muda."""
+    if endereco == horta["endereco"]:
+        return
+    latitude, longitude = geocodificar(endereco) or (None, None)
+    conn.execute(
+        "UPDATE hortas SET latitude = ?, longitude = ? WHERE horta_id = ?",
+        (latitude, longitude, horta["horta_id"]),
+    )
 
 
 # ========================== ATUALIZAR HORTA ==========================
 
+@st.fragment
 def atualizar_horta(horta_id):
+    # Cancelar só reroda o fragmento, que então some
+    if st.session_state.get("horta_em_edicao") != horta_id:
+        return
+
     st.subheader("✏️ Atualizar Horta")
 
-    conn = get_db_connection()
-    horta = conn.execute("SELECT * FROM hortas WHERE horta_id = ?", (horta_id,)).fetchone()
-    conn.close()
+    horta = consultar("SELECT * FROM hortas WHERE horta_id = ?", (horta_id,), tabelas=("hortas",), um=True)
 
     if not horta:
         st.error("❌ Horta não encontrada!")
         return
 
-    nome_horta = st.text_input("🌿 Nome da Horta", value=horta["nome_horta"])
-    especie = st.text_input("📌 Espécie Plantada", value=horta["especie"])
-    dias_colheita = st.number_input("⏳ Dias para Colheita", min_value=1, step=1, value=horta["dias_colheita"])
-    endereco = st.text_input("📍 Endereço da Horta", value=horta["endereco"])
-
-    foto = st.file_uploader("📸 Atualize a foto da horta", type=["jpg", "png", "jpeg"])
-    file_path = horta["foto"]
-
-    if foto:
-        file_path = os.path.join("uploads", f"horta_{horta_id}.jpg")
-        try:
-            with open(file_path, "wb") as f:
-                f.write(foto.getbuffer())
-            st.success("✅ Nova imagem carregada com sucesso!")
-        except Exception as e:
-            st.error(f"⚠️ Erro ao salvar a nova imagem: {e}")
+    mostrar_aviso_horta(horta_id)
+    with st.form(f"form_atualizar_{horta_id}"):
+        campos_horta(horta, "atualizar")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.form_submit_button("💾 Salvar Alterações", key=f"save_{horta_id}",
+                                  on_click=salvar_horta_admin, args=(horta_id,))
+        with col2:
+            st.form_submit_button("❌ Cancelar", key=f"cancel_{horta_id}", on_click=fechar_edicao)
+
+
+def salvar_horta_admin(horta_id):
+    salvar_horta(horta_id, "atualizar")
+    if "horta_em_edicao" not in st.session_state:
+        # Salvou: a listagem precisa dos dados novos, então o rerun é da página toda
+        st.session_state.pop(f"aviso_horta_{horta_id}", None)
+        st.rerun()
 
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("💾 Salvar Alterações", key=f"save_{horta_id}"):
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE hortas 
-                SET nome_horta = ?, especie = ?, dias_colheita = ?, endereco = ?, foto = ?
-                WHERE horta_id = ?;
-            ''', (nome_horta, especie, dias_colheita, endereco, file_path, horta_id))
-            conn.commit()
-            conn.close()
-
-            st.success("✅ Horta atualizada com sucesso!")
-            del st.session_state["horta_em_edicao"]
-            st.rerun()
 
-    with col2:
-        if st.button("❌ Cancelar", key=f"cancel_{horta_id}"):
-            del st.session_state["horta_em_edicao"]
-            st.rerun()
+HORTAS_POR_PAGINA_ADMIN = 25
 
 
 def painel_administrador():
     st.subheader("🛠️ Painel do Administrador")
 
+    with st.expander("📈 Cache de consultas"):
+        estatisticas = get_banco().cache.estatisticas()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Hits", estatisticas["hits"])
+        col2.metric("Misses", estatisticas["misses"])
+        col3.metric("Taxa de acerto", f"{estatisticas['taxa_acerto']:.0%}")
+        col4.metric("Entradas", estatisticas["entradas"])
+
+    with st.expander("🖼️ Imagens"):
+        imagens_admin()
+
+    with st.expander("📥 Importar hortas em lote"):
+        importacao_em_lote()
+
+    with st.expander("📤 Exportar dados"):
+        exportacao_de_dados()
+
+    with st.expander("🗄️ Arquivo do feed"):
+        arquivo_feed_admin()
+
+    aba_hortas, aba_analises, aba_desempenho = st.tabs(["📋 Hortas", "📊 Análises", "⏱️ Desempenho"])
+    with aba_analises:
+        painel_analises()
+    with aba_desempenho:
+        painel_desempenho()
+    with aba_hortas:
+        listar_hortas_admin()
+
+
+def imagens_admin():
+    estatisticas = cache_imagens.estatisticas()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Taxa de acerto (bytes em memória)", f"{estatisticas['taxa_acerto']:.0%}")
+    col2.metric("Imagens em memória", estatisticas["entradas"])
+    col3.metric("Memória usada", f"{estatisticas['bytes'] / 1024 / 1024:.1f} MB")
+
+    problemas = consultar("""
+        SELECT caminho, status, verificado_em FROM imagens
+        WHERE status <> 'ok' ORDER BY verificado_em DESC LIMIT 100
+    """, tabelas=("imagens",))
+    if problemas:
+        st.warning(f"{len(problemas)} arquivo(s) ausente(s) ou vazio(s) na última verificação.")
+        st.dataframe([dict(linha) for linha in problemas], hide_index=True)
+    else:
+        st.caption("Nenhum arquivo ausente ou vazio na última verificação.")
+
+    col1, col2 = st.columns(2)
+    if col1.button("🔎 Verificar arquivos agora", key="verificar_imagens"):
+        contagem = verificar_imagens(get_banco(), UPLOAD_FOLDER)
+        st.success(", ".join(f"{situacao}: {quantidade}" for situacao, quantidade in sorted(contagem.items())) or "Nada a verificar.")
+    if col2.button("🗑️ Apagar fotos sem referência", key="coletar_imagens"):
+        removidas = coletar_lixo(get_banco(), UPLOAD_FOLDER)
+        st.success(f"{len(removidas)} foto(s) sem referência removida(s).")
+
 
+def listar_hortas_admin():
     # ================== LISTAGEM DE HORTAS CADASTRADAS ==================
     st.subheader("📋 Hortas Cadastradas")
 
-    conn = get_db_connection()
-    hortas = conn.execute("SELECT * FROM hortas").fetchall()
-    conn.close()
-
+    if st.session_state.get("horta_em_edicao"):
+        atualizar_horta(st.session_state["horta_em_edicao"])
+        st.write("---")
+
+    col1, col2, col3, col4 = st.columns(4)
+    especie = col1.text_input("Espécie", key="admin_filtro_especie")
+    produtor = col2.text_input("Produtor (nome ou email)", key="admin_filtro_produtor")
+    colheita = col3.date_input("Colheita prevista entre", value=(), format="DD/MM/YYYY", key="admin_filtro_colheita")
+    situacao = col4.selectbox("Situação", ["Todas", "Ativas", "Desativadas"], key="admin_filtro_situacao")
+    filtro, parametros = filtro_hortas_admin(especie, produtor, colheita, situacao)
+
+    # Filtros novos recomeçam da primeira página
+    if st.session_state.get("admin_filtros") != (filtro, parametros):
+        st.session_state["admin_filtros"] = (filtro, parametros)
+        st.session_state["admin_cursores"] = [None]
+    cursores = st.session_state["admin_cursores"]
+
+    total = consultar(f"SELECT count(*) FROM hortas {filtro}", parametros, tabelas=("hortas",), um=True)[0]
+    hortas, proximo = buscar_pagina_hortas_admin(filtro, parametros, cursores[-1])
     if not hortas:
-        st.info("📢 Nenhuma horta cadastrada ainda.")
+        st.info("📢 Nenhuma horta encontrada.")
         return
 
+    pagina = len(cursores)
+    st.caption(f"{total} horta(s) · página {pagina} de {max(1, -(-total // HORTAS_POR_PAGINA_ADMIN))}")
+
+    # A versão entra na chave das caixas de seleção para limpá-las depois de uma ação
+    versao = st.session_state.setdefault("admin_selecao_versao", 0)
+    metadados = fotos_da_pagina([horta["foto"] for horta in hortas])
     for horta in hortas:
-        with st.container():
-            st.write(f"**🌿 Horta:** {horta['nome_horta']}")
-            st.write(f"📌 **Espécie:** {horta['especie']}")
-            st.write(f"⏳ **Dias para Colheita:** {horta['dias_colheita']} dias")
-            st.write(f"👨‍🌾 **Produtor:** {horta['contato']} - 📧 {horta['email']}")
+        col_selecao, col_foto, col_dados, col_editar = st.columns([0.4, 1, 5, 0.8])
+        col_selecao.checkbox(
+            "Selecionar", key=f"sel_horta_{versao}_{horta['horta_id']}", label_visibility="collapsed")
+        try:
+            col_foto.image(imagem_para_exibir(horta["foto"], metadados, 80, padrao=DEFAULT_HORTA_IMG), width=80)
+        except Exception:
+            col_foto.write("🖼️")
+        colheita_prevista = ler_data(horta["data_colheita"])
+        col_dados.markdown(
+            f"**🌿 {horta['nome_horta']}**{'' if horta['ativa'] else ' · 🚫 desativada'}  \n"
+            f"📌 {horta['especie']} · ⏳ {horta['dias_colheita']} dias"
+            f"{f' · 🗓️ {colheita_prevista:%d/%m/%Y}' if colheita_prevista else ''}  \n"
+            f"👨‍🌾 {horta['contato']} - 📧 {horta['email']}"
+        )
+        col_editar.button("✏️", key=f"edit_{horta['horta_id']}", help="Atualizar",
+                          on_click=st.session_state.update, kwargs={"horta_em_edicao": horta["horta_id"]})
 
-            foto_horta = horta["foto"]
-            if not foto_horta or not os.path.exists(foto_horta):
-                foto_horta = "imagens/default-horta.jpg"
+    col1, col2 = st.columns(2)
+    if pagina > 1 and col1.button("⬅️ Anteriores", key="admin_anteriores"):
+        cursores.pop()
+        st.rerun()
+    if proximo is not None and col2.button("Próximas ➡️", key="admin_proximas"):
+        cursores.append(proximo)
+        st.rerun()
 
-            try:
-                st.image(foto_horta, width=300)
-            except Exception as e:
-                st.warning(f"Erro ao carregar imagem: {e}")
-                st.image("https://via.placeholder.com/300", width=300)
+    selecionadas = [
+        horta["horta_id"] for horta in hortas if st.session_state.get(f"sel_horta_{versao}_{horta['horta_id']}")
+    ]
+    acoes_em_lote(selecionadas)
+
+
+def filtro_hortas_admin(especie, produtor, colheita, situacao):
+    """(cláusula WHERE, parâmetros) dos filtros do painel, aplicados no SQL."""
+    condicoes, parametros = [], []
+    if especie.strip():
+        condicoes.append("lower(trim(especie)) = lower(trim(?))")  # usa idx_hortas_especie
+        parametros.append(especie)
+    if produtor.strip():
+        condicoes.append("(contato LIKE ? OR email LIKE ?)")
+        parametros.extend([f"%{produtor.strip()}%"] * 2)
+    if len(colheita) == 2:
+        condicoes.append("data_colheita BETWEEN ? AND ?")  # usa idx_hortas_colheita
+        parametros.extend(colheita)
+    if situacao != "Todas":
+        condicoes.append("ativa = ?")
+        parametros.append(1 if situacao == "Ativas" else 0)
+    return ("WHERE " + " AND ".join(condicoes) if condicoes else ""), tuple(parametros)
+
+
+def buscar_pagina_hortas_admin(filtro, parametros, cursor_horta=None, limite=HORTAS_POR_PAGINA_ADMIN):
+    """Página da listagem, da horta mais nova para a mais antiga, a partir do cursor (horta_id).
+
+    Retorna as hortas e o cursor da próxima página (None se acabou).
+    """
+    if cursor_horta is not None:
+        filtro = f"{filtro} AND horta_id < ?" if filtro else "WHERE horta_id < ?"
+        parametros = (*parametros, cursor_horta)
+
+    hortas = consultar(f"""
+        SELECT horta_id, nome_horta, especie, dias_colheita, data_colheita, contato, email, foto, ativa
+        FROM hortas {filtro}
+        ORDER BY horta_id DESC
+        LIMIT ?
+    """, (*parametros, limite + 1), tabelas=("hortas",))
+
+    if len(hortas) <= limite:
+        return hortas, None
+    return hortas[:limite], hortas[limite - 1]["horta_id"]
+
+
+def acoes_em_lote(selecionadas):
+    st.markdown(f"**Ações em lote** ({len(selecionadas)} selecionada(s) nesta página)")
+    acao = st.selectbox("Ação", ["Excluir", "Alterar espécie / dias", "Desativar", "Reativar"], key="lote_acao")
+
+    nova_especie = novos_dias = None
+    confirmado = True
+    if acao == "Alterar espécie / dias":
+        col1, col2 = st.columns(2)
+        nova_especie = col1.text_input("Nova espécie (vazio mantém)", key="lote_especie").strip() or None
+        novos_dias = col2.number_input("Novos dias para colheita (vazio mantém)", min_value=1, step=1, value=None,
+                                       key="lote_dias")
+    elif acao == "Excluir":
+        confirmado = st.checkbox("Confirmo a exclusão das hortas e das postagens delas", key="lote_confirmar")
+
+    if not st.button("Aplicar às selecionadas", key="lote_aplicar", disabled=not selecionadas or not confirmado):
+        return
+
+    fotos = []
+    with transacao("hortas", "feed_hortas", "correspondencias") as conn:
+        if acao == "Excluir":
+            fotos = excluir_hortas(conn, selecionadas)
+        elif acao == "Alterar espécie / dias":
+            alterar_hortas(conn, selecionadas, nova_especie, novos_dias)
+        else:
+            ativar_hortas(conn, selecionadas, acao == "Reativar")
+    if fotos:
+        # Só as fotos que ninguém mais cita. A carência vale aqui também: um upload
+        # recente com o mesmo conteúdo pode ainda não ter gravado a linha dele;
+        # as fotos recentes ficam para a coleta periódica
+        coletar_lixo(get_banco(), UPLOAD_FOLDER, apenas=fotos)
+
+    st.session_state["admin_selecao_versao"] += 1
+    st.session_state["admin_cursores"] = [None]
+    st.rerun()
 
-            # Criar colunas para botões
-            col1, col2 = st.columns(2)
 
-            with col1:
-                if st.button("🗑️ Excluir", key=f"del_{horta['horta_id']}"):
-                    st.session_state["confirmar_exclusao"] = horta["horta_id"]
-                    excluir_horta()
-                    st.rerun()
+def _marcadores(ids):
+    return ", ".join("?" * len(ids))
 
-            with col2:
-                if st.button("✏️ Atualizar", key=f"edit_{horta['horta_id']}"):
-                    st.session_state["horta_em_edicao"] = horta["horta_id"]
-                    atualizar_horta(horta["horta_id"])
 
+def excluir_hortas(conn, horta_ids):
+    """Apaga as hortas e, em cascata, as postagens delas, na transação de `conn`.
+
+    Feed, busca, mapa, resumos, correspondências e contagem de referências das
+    fotos são atualizados pelos triggers. Retorna as fotos que as linhas citavam.
+    """
+    marcadores = _marcadores(horta_ids)
+    fotos = [linha[0] for linha in conn.execute(f"""
+        SELECT foto FROM hortas WHERE horta_id IN ({marcadores})
+        UNION SELECT foto FROM feed_hortas WHERE horta_id IN ({marcadores})
+    """, (*horta_ids, *horta_ids)).fetchall() if linha[0]]
+    conn.execute(f"DELETE FROM feed_hortas WHERE horta_id IN ({marcadores})", horta_ids)
+    conn.execute(f"DELETE FROM hortas WHERE horta_id IN ({marcadores})", horta_ids)
+    return fotos
+
+
+def alterar_hortas(conn, horta_ids, especie=None, dias_colheita=None):
+    """Troca espécie e/ou dias para colheita das hortas; None mantém o valor atual."""
+    conn.execute(f"""
+        UPDATE hortas SET especie = coalesce(?, especie), dias_colheita = coalesce(?, dias_colheita)
+        WHERE horta_id IN ({_marcadores(horta_ids)})
+    """, (especie, dias_colheita, *horta_ids))
+    corresponder_hortas(conn, horta_ids)
+
+
+def ativar_hortas(conn, horta_ids, ativa):
+    """Desativa (ou reativa) as hortas: somem do feed, da busca, do mapa e das demandas."""
+    conn.execute(f"UPDATE hortas SET ativa = ? WHERE horta_id IN ({_marcadores(horta_ids)})", (int(ativa), *horta_ids))
+    corresponder_hortas(conn, horta_ids)
+
+
+def importacao_em_lote():
+    st.caption(
+        "Planilha CSV ou Excel com as colunas nome_horta, especie, dias_colheita, contato, "
+        "endereco e email (opcionais: foto, latitude, longitude, data_plantio em AAAA-MM-DD). As fotos vão num .zip, "
+        "com o nome do arquivo igual ao da coluna foto."
+    )
+    planilha = st.file_uploader("Planilha de hortas", type=["csv", "xlsx"], key="lote_planilha")
+    fotos = st.file_uploader("Fotos (.zip, opcional)", type=["zip"], key="lote_fotos")
+
+    if planilha and st.button("📥 Importar", key="lote_importar"):
+        try:
+            df = ler_planilha(planilha, planilha.name)
+            # Tudo ou nada; fotos e geocodificação são feitas antes de abrir a transação
+            inseridas, erros = importar_hortas(get_banco(), df, st.session_state["user"]["user_id"], fotos)
+        except Exception as e:
+            st.error(f"Erro na importação: {e}")
+            return
+
+        st.success(f"✅ {inseridas} horta(s) importada(s).")
+        if len(erros):
+            st.warning(f"{len(erros)} linha(s) ignorada(s):")
+            st.dataframe(erros, hide_index=True)
+
+
+def arquivo_feed_admin():
+    meses = meses_arquivados()
+    st.caption(
+        f"Postagens antigas ficam em um banco por mês ({len(meses)} mês(es) arquivado(s)"
+        f"{f', de {meses[-1]} a {meses[0]}' if meses else ''}) e as fotos delas na pasta fria."
+    )
+    dias = st.number_input("Arquivar postagens com mais de (dias)", min_value=1, value=RETENCAO_DIAS, key="arquivo_dias")
+    if st.button("🗄️ Arquivar agora", key="arquivo_arquivar"):
+        arquivadas = arquivar_feed(get_banco(), dias)
+        if arquivadas:
+            st.success(", ".join(f"{mes}: {quantidade}" for mes, quantidade in arquivadas.items()))
+        else:
+            st.info(f"Nenhuma postagem com mais de {dias} dias.")
+
+
+def exportacao_de_dados():
+    col1, col2 = st.columns(2)
+    with col1:
+        tipo = st.selectbox("Dados", list(EXPORTACOES), key="exportar_tipo")
+    with col2:
+        formato = st.selectbox("Formato", ["csv", "parquet"], key="exportar_formato")
+
+    def gerar_arquivo():
+        # Só roda no clique; o banco é lido em blocos direto para um arquivo temporário
+        with conexao() as conn:
+            return exportar_para_arquivo(conn, tipo, formato)
+
+    st.download_button(
+        "📤 Baixar",
+        data=gerar_arquivo,
+        file_name=f"{tipo}_{datetime.now():%Y%m%d_%H%M}.{formato}",
+        mime="text/csv" if formato == "csv" else "application/octet-stream",
+        key="exportar_baixar",
+    )
+
+
+# ========================== ANÁLISES (ADMIN) ==========================
+
+def geracao_analises():
+    """Versão atual dos dados que alimentam as tabelas de resumo."""
+    banco = get_banco()
+    return banco.geracao("hortas"), banco.geracao("feed_hortas")
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def dados_analises(geracao):
+    """Lê as tabelas de resumo; recalculado só quando `geracao` muda."""
+    import pandas as pd
+
+    with conexao() as conn:
+        especies = pd.read_sql_query(
+            "SELECT especie, hortas FROM resumo_especies ORDER BY hortas DESC", conn)
+        dias_colheita = pd.read_sql_query(
+            "SELECT dias_colheita, hortas FROM resumo_dias_colheita ORDER BY dias_colheita", conn)
+        postagens = pd.read_sql_query(
+            "SELECT dia, postagens FROM resumo_postagens_dia ORDER BY dia", conn, parse_dates=["dia"])
+        produtores = pd.read_sql_query(
+            "SELECT dia, usuario_id FROM resumo_produtores_dia", conn, parse_dates=["dia"])
+
+    postagens_semana = postagens.set_index("dia")["postagens"].resample("W-MON", label="left", closed="left").sum()
+    produtores_semana = (
+        produtores.set_index("dia").groupby(pd.Grouper(freq="W-MON", label="left", closed="left"))["usuario_id"].nunique()
+    )
+    limite_ativos = pd.Timestamp.now().normalize() - pd.Timedelta(days=30)
+
+    return {
+        "especies": especies,
+        "dias_colheita": dias_colheita,
+        "postagens_dia": postagens.set_index("dia")["postagens"],
+        "postagens_semana": postagens_semana,
+        "produtores_semana": produtores_semana,
+        "total_hortas": int(especies["hortas"].sum()),
+        "total_postagens": int(postagens["postagens"].sum()),
+        "ativos_30_dias": int(produtores.loc[produtores["dia"] >= limite_ativos, "usuario_id"].nunique()),
+    }
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def grafico_analises(nome, geracao):
+    """PNG do gráfico `nome`, renderizado uma vez por geração dos dados."""
+    import io
+    from matplotlib.figure import Figure
+
+    dados = dados_analises(geracao)
+    figura = Figure(figsize=(7, 3.5), tight_layout=True)
+    ax = figura.subplots()
+
+    if nome == "especies":
+        top = dados["especies"].head(15).iloc[::-1]
+        ax.barh(top["especie"].str.capitalize(), top["hortas"], color="#4caf50")
+        ax.set_xlabel("Hortas")
+    elif nome == "postagens_dia":
+        serie = dados["postagens_dia"].tail(60)
+        ax.bar(serie.index, serie.values, color="#2196f3")
+        ax.set_ylabel("Postagens")
+        figura.autofmt_xdate()
+    elif nome == "postagens_semana":
+        serie = dados["postagens_semana"].tail(26)
+        ax.bar(serie.index, serie.values, width=5, color="#2196f3")
+        ax.set_ylabel("Postagens por semana")
+        figura.autofmt_xdate()
+    elif nome == "produtores_semana":
+        serie = dados["produtores_semana"].tail(26)
+        ax.plot(serie.index, serie.values, marker="o", color="#ff9800")
+        ax.set_ylabel("Produtores ativos")
+        figura.autofmt_xdate()
+    elif nome == "dias_colheita":
+        distribuicao = dados["dias_colheita"]
+        ax.hist(distribuicao["dias_colheita"], weights=distribuicao["hortas"], bins=20, color="#8bc34a")
+        ax.set_xlabel("Dias para colheita")
+        ax.set_ylabel("Hortas")
+
+    buffer = io.BytesIO()
+    figura.savefig(buffer, format="png", dpi=100)
+    return buffer.getvalue()
+
+
+def painel_analises():
+    geracao = geracao_analises()
+    dados = dados_analises(geracao)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🌿 Hortas", dados["total_hortas"])
+    col2.metric("📢 Postagens", dados["total_postagens"])
+    col3.metric("👨‍🌾 Produtores ativos (30 dias)", dados["ativos_30_dias"])
+
+    if not dados["total_hortas"] and not dados["total_postagens"]:
+        st.info("Ainda não há dados para analisar.")
+        return
+
+    graficos = [
+        ("especies", "Hortas por espécie"),
+        ("postagens_dia", "Postagens por dia (últimos 60 dias com postagem)"),
+        ("postagens_semana", "Postagens por semana"),
+        ("produtores_semana", "Produtores ativos por semana"),
+        ("dias_colheita", "Distribuição de dias para colheita"),
+    ]
+    for nome, titulo in graficos:
+        st.markdown(f"**{titulo}**")
+        st.image(grafico_analises(nome, geracao))
+
+
+def painel_desempenho():
+    import pandas as pd
+
+    st.caption(
+        f"Últimas {registro.capacidade} medições deste processo. "
+        f"Métricas acumuladas no formato Prometheus em `{ARQUIVO_PROMETHEUS}`."
+    )
+
+    paginas = registro.resumo_paginas()
+    if not paginas:
+        st.info("Nenhuma página medida ainda.")
+        return
+
+    st.markdown("**Páginas**")
+    st.dataframe(pd.DataFrame(paginas).round(1), hide_index=True)
 
-            st.write("---")  # Separador entre hortas
+    pagina = st.selectbox("Histograma de latência", [linha["pagina"] for linha in paginas], key="desempenho_pagina")
+    histograma = pd.DataFrame(registro.histograma(pagina), columns=["faixa", "execuções"])
+    st.bar_chart(histograma, x="faixa", y="execuções", sort=False)
+
+    st.markdown("**Consultas mais lentas** (tempo somado no buffer)")
+    st.dataframe(pd.DataFrame(registro.consultas_mais_lentas()).round(2), hide_index=True)
+
+    st.markdown("**Possíveis N+1** (mesma consulta repetida numa execução de página)")
+    suspeitas = registro.suspeitas_n_mais_1()
+    if suspeitas:
+        st.dataframe(pd.DataFrame(suspeitas), hide_index=True)
+    else:
+        st.caption("Nenhuma suspeita registrada.")
+
+    leituras = registro.leituras_mais_lentas()
+    if leituras:
+        st.markdown("**Leituras de imagem mais lentas**")
+        st.dataframe(pd.DataFrame(leituras).round(2), hide_index=True)
+
+    if st.button("🧹 Limpar medições", key="desempenho_limpar"):
+        registro.limpar()
+        st.rerun()
 
 
 # ========================== SISTEMA DE NAVEGAÇÃO ==========================
@@ -473,36 +968,50 @@ def main():
         st.session_state["pagina"] = "login"
 
     if st.session_state["user"]:
-        menu = ["Página Inicial", "Feed de Hortas", "Cadastrar Horta", "Painel do Administrador", "Sair"]
+        menu = ["Página Inicial", "Feed de Hortas", "Buscar Hortas", "Hortas Perto de Mim", "Calendário de Colheitas",
+                "Minhas Demandas", "Compradores Interessados", "Cadastrar Horta", "Painel do Administrador", "Sair"]
         escolha = st.sidebar.selectbox("📌 Navegação", menu)
 
-        if escolha == "Página Inicial":
-            tela_usuario()
-        elif escolha == "Feed de Hortas":
-            feed_hortas()
-        elif escolha == "Cadastrar Horta":
-            cadastrar_horta()
-        elif escolha == "Painel do Administrador":
-            if st.session_state["user"]["is_admin"]:
-                painel_administrador()
-            else:
-                st.warning("Acesso negado! Apenas administradores podem acessar esta página.")
-        elif escolha == "Sair":
-            # Remove o usuário da sessão e retorna para a página de login
-            del st.session_state["user"]
-            st.session_state["pagina"] = "login"
-            st.rerun() 
+        # Tempo da página, com o SQL e as imagens dela: aba "Desempenho" do painel
+        with medir_pagina(escolha):
+            if escolha == "Página Inicial":
+                tela_usuario()
+            elif escolha == "Feed de Hortas":
+                feed_hortas()
+            elif escolha == "Buscar Hortas":
+                buscar_hortas()
+            elif escolha == "Hortas Perto de Mim":
+                hortas_perto_de_mim()
+            elif escolha == "Calendário de Colheitas":
+                calendario_colheitas()
+            elif escolha == "Minhas Demandas":
+                minhas_demandas()
+            elif escolha == "Compradores Interessados":
+                compradores_interessados()
+            elif escolha == "Cadastrar Horta":
+                cadastrar_horta()
+            elif escolha == "Painel do Administrador":
+                if st.session_state["user"]["is_admin"]:
+                    painel_administrador()
+                else:
+                    st.warning("Acesso negado! Apenas administradores podem acessar esta página.")
+            elif escolha == "Sair":
+                # Remove o usuário da sessão e retorna para a página de login
+                del st.session_state["user"]
+                st.session_state["pagina"] = "login"
+                st.rerun() 
 
 
 
     else:
-        if st.session_state["pagina"] == "login":
-            login()
-        elif st.session_state["pagina"] == "cadastro":
-            form_cadastro()
-            if st.button("Voltar ao Login"):
-                st.session_state["pagina"] = "login"
-                st.rerun()
+        with medir_pagina(st.session_state["pagina"]):
+            if st.session_state["pagina"] == "login":
+                login()
+            elif st.session_state["pagina"] == "cadastro":
+                form_cadastro()
+                if st.button("Voltar ao Login"):
+                    st.session_state["pagina"] = "login"
+                    st.rerun()
 
 
 
@@ -522,18 +1031,25 @@ def form_cadastro():
             st.error("As senhas não coincidem!")
             return
 
-        senha_hash = generate_password_hash(senha)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            '''
-            INSERT INTO users (nome, idade, telefone, endereco, email, senha)
-            VALUES (?, ?, ?, ?, ?, ?);
-            ''',
-            (nome, idade, telefone, endereco, email, senha_hash)
-        )
-        conn.commit()
-        conn.close()
+        espera = aguardar_tentativa(email, ip_cliente())
+        if espera:
+            st.error(f"Muitas tentativas. Aguarde {espera} segundos e tente novamente.")
+            return
+
+        try:
+            senha_hash = gerar_hash(senha)
+        except PoolOcupado as e:
+            st.error(str(e))
+            return
+
+        with transacao("users") as conn:
+            conn.execute(
+                '''
+                INSERT INTO users (nome, idade, telefone, endereco, email, senha)
+                VALUES (?, ?, ?, ?, ?, ?);
+                ''',
+                (nome, idade, telefone, endereco, email, senha_hash)
+            )
         st.success("Cadastro realizado com sucesso! Faça login para continuar.")
 
 
@@ -546,19 +1062,27 @@ def cadastrar_horta():
         st.warning("Você precisa estar logado para cadastrar uma horta.")
         return
 
-    # Campos do formulário
-    nome_horta = st.text_input("Nome da Horta")
-    especie = st.text_input("Espécie Plantada")
-    dias_colheita = st.number_input("Dias para Colheita", min_value=1, step=1)
-    endereco = st.text_input("Endereço da Horta")
-    contato = st.text_input("Nome do Produtor", value=st.session_state["user"]["nome"])
-    email = st.text_input("Email do Produtor", value=st.session_state["user"]["email"])
+    # Campos do formulário, enviados juntos no clique do botão
+    with st.form("form_cadastrar_horta"):
+        nome_horta = st.text_input("Nome da Horta")
+        especie = st.text_input("Espécie Plantada")
+        dias_colheita = st.number_input("Dias para Colheita", min_value=1, step=1)
+        data_plantio = st.date_input("Data de Plantio", value=date.today(), format="DD/MM/YYYY")
+        endereco = st.text_input("Endereço da Horta")
+        contato = st.text_input("Nome do Produtor", value=st.session_state["user"]["nome"])
+        email = st.text_input("Email do Produtor", value=st.session_state["user"]["email"])
+
+        # Coordenadas opcionais; sem elas, usa o centróide da cidade/CEP do endereço
+        with st.expander("📍 Localização no mapa (opcional)"):
+            latitude = st.number_input("Latitude", min_value=-90.0, max_value=90.0, value=None, format="%.6f")
+            longitude = st.number_input("Longitude", min_value=-180.0, max_value=180.0, value=None, format="%.6f")
 
-    # Upload da imagem da horta
-    foto = st.file_uploader("Envie uma foto da sua horta", type=["jpg", "png", "jpeg"])
+        # Upload da imagem da horta
+        foto = st.file_uploader("Envie uma foto da sua horta", type=["jpg", "png", "jpeg"])
 
-    # ✅ Corrigido: Adicionando um identificador `key` exclusivo ao botão
-    if st.button("Cadastrar Horta", key="btn_cadastrar_horta"):
+        enviado = st.form_submit_button("Cadastrar Horta", key="btn_cadastrar_horta")
+
+    if enviado:
         if not nome_horta or not especie or not endereco or not contato or not email:
             st.error("Preencha todos os campos obrigatórios!")
             return
@@ -566,19 +1090,21 @@ def cadastrar_horta():
         # Caminho para salvar a imagem da horta
         file_path = ""
         if foto:
-            file_path = os.path.join("uploads", f"horta_{st.session_state['user']['user_id']}.jpg")
-            with open(file_path, "wb") as f:
-                f.write(foto.getbuffer())
+            file_path = guardar_imagem(foto.getbuffer())
+
+        if latitude is None or longitude is None:
+            latitude, longitude = geocodificar(endereco) or (None, None)
 
         # Inserir no banco de dados
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO hortas (nome_horta, usuario_id, foto, especie, dias_colheita, contato, endereco, email)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?);
-        ''', (nome_horta, st.session_state["user"]["user_id"], file_path, especie, dias_colheita, contato, endereco, email))
-        conn.commit()
-        conn.close()
+        with transacao("hortas", "correspondencias") as conn:
+            cursor = conn.execute('''
+                INSERT INTO hortas (nome_horta, usuario_id, foto, especie, dias_colheita, data_plantio,
+                                    contato, endereco, email, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            ''', (nome_horta, st.session_state["user"]["user_id"], file_path, especie, dias_colheita, data_plantio,
+                  contato, endereco, email, latitude, longitude))
+            # Compradores com demanda dessa espécie passam a ver a horta
+            corresponder_hortas(conn, [cursor.lastrowid])
 
         st.success("Horta cadastrada com sucesso!")
 
@@ -587,30 +1113,231 @@ def cadastrar_horta():
         st.rerun()
 
 
+FEED_POR_PAGINA = 10
+# Postagens da mesma horta dentro deste intervalo são mescladas
+JANELA_REPOSTAGEM = timedelta(minutes=10)
+
+
+def buscar_pagina_feed(cursor_feed=None, limite=FEED_POR_PAGINA):
+    """Busca uma página do feed a partir do cursor (data_postagem, feed_id).
+
+    Retorna as postagens e o cursor da próxima página (None se acabou).
+    """
+    filtro = ""
+    parametros = []
+    if cursor_feed:
+        filtro = "WHERE (data_postagem, feed_id) < (?, ?)"
+        parametros.extend(cursor_feed)
+
+    # feed_cards já traz nome do autor e dados da horta (mantida por triggers);
+    # as escritas declaram as tabelas de origem, por isso o cache depende delas
+    postagens = consultar(f"""
+        SELECT feed_id, foto, descricao, data_postagem, nome, nome_horta, especie
+        FROM feed_cards
+        {filtro}
+        ORDER BY data_postagem DESC, feed_id DESC
+        LIMIT ?
+    """, (*parametros, limite + 1), tabelas=("feed_hortas", "users", "hortas"))
+
+    # Busca uma linha a mais só para saber se existe próxima página
+    if len(postagens) <= limite:
+        return postagens, None
+
+    postagens = postagens[:limite]
+    ultima = postagens[-1]
+    return postagens, (ultima["data_postagem"], ultima["feed_id"])
+
+
+def resetar_feed():
+    st.session_state["feed_postagens"] = []
+    st.session_state["feed_cursor"] = None
+    st.session_state["feed_fim"] = False
+    st.session_state["feed_novas"] = []
+    # Geração antes do último id: uma postagem entre as duas leituras aparece na próxima verificação
+    st.session_state["feed_geracao"] = get_banco().geracao("feed_hortas")
+    st.session_state["feed_ultimo_id"] = ultimo_feed_id()
+
+
+def carregar_mais_feed():
+    if st.session_state.get("feed_fim"):
+        return
+    postagens, proximo = buscar_pagina_feed(st.session_state.get("feed_cursor"))
+    st.session_state["feed_postagens"].extend(dict(p) for p in postagens)
+    st.session_state["feed_cursor"] = proximo
+    st.session_state["feed_fim"] = proximo is None
+    st.session_state["feed_ultimo_id"] = max(
+        [st.session_state["feed_ultimo_id"]] + [p["feed_id"] for p in postagens])
+
+
+# Modo ao vivo: intervalo (segundos) entre as consultas de novas postagens e
+# máximo de postagens novas acrescentadas de uma vez
+INTERVALO_FEED_AO_VIVO = 5
+NOVAS_POR_ATUALIZACAO = 50
+
+
+def ultimo_feed_id():
+    """Maior feed_id publicado, compartilhado por todas as sessões do processo.
+
+    Fica no cache de consultas até a próxima escrita em feed_hortas (só um
+    INSERT ali cria feed_id novo), então centenas de sessões consultando a
+    cada poucos segundos leem o banco uma vez por postagem nova.
+    """
+    linha = consultar("SELECT max(feed_id) FROM feed_cards", tabelas=("feed_hortas",), um=True)
+    return linha[0] or 0
+
+
+def buscar_postagens_novas():
+    """Postagens com feed_id maior que o último visto pela sessão, da mais nova para a mais antiga.
+
+    Sem escrita em feed_hortas desde a última verificação, nem o cache é
+    consultado: basta comparar a geração da tabela, que está em memória.
+    Retorna as postagens e se ficaram outras de fora (mais que NOVAS_POR_ATUALIZACAO).
+    """
+    geracao = get_banco().geracao("feed_hortas")
+    if geracao == st.session_state["feed_geracao"]:
+        return [], False
+    st.session_state["feed_geracao"] = geracao
+
+    visto = st.session_state["feed_ultimo_id"]
+    if ultimo_feed_id() <= visto:
+        return [], False
+
+    # idx_feed_cards_id: busca por faixa a partir do último feed_id visto
+    novas = consultar("""
+        SELECT feed_id, foto, descricao, data_postagem, nome, nome_horta, especie
+        FROM feed_cards
+        WHERE feed_id > ?
+        ORDER BY feed_id DESC
+        LIMIT ?
+    """, (visto, NOVAS_POR_ATUALIZACAO + 1), tabelas=("feed_hortas", "users", "hortas"))
+    if not novas:
+        return [], False
+
+    st.session_state["feed_ultimo_id"] = novas[0]["feed_id"]
+    return [dict(p) for p in novas[:NOVAS_POR_ATUALIZACAO]], len(novas) > NOVAS_POR_ATUALIZACAO
+
+
 def feed_hortas():
     st.subheader("🌱 Feed das Hortas")
 
-    # Conectar ao banco de dados
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # As postagens já carregadas ficam na sessão; cada rerun só desenha o
+    # que já foi buscado e apenas "Carregar mais" vai ao banco.
+    if "feed_postagens" not in st.session_state:
+        resetar_feed()
+        carregar_mais_feed()
+
+    col1, col2 = st.columns(2)
+    col1.button("🔄 Atualizar feed", on_click=atualizar_feed)
+    ao_vivo = col2.toggle("🔴 Ao vivo", key="feed_ao_vivo",
+                          help=f"Mostra as postagens novas automaticamente (a cada {INTERVALO_FEED_AO_VIVO} s)")
 
-    # Buscar todas as postagens do feed
-    postagens = cursor.execute("""
-        SELECT feed_hortas.foto, feed_hortas.descricao, feed_hortas.data_postagem, 
-               users.nome, hortas.nome_horta, hortas.especie 
-        FROM feed_hortas
-        JOIN users ON feed_hortas.usuario_id = users.user_id
-        JOIN hortas ON feed_hortas.horta_id = hortas.horta_id
-        ORDER BY feed_hortas.data_postagem DESC
-    """).fetchall()
+    # Só as postagens novas rerodam no timer; a lista carregada fica parada
+    if ao_vivo:
+        postagens_ao_vivo()
+    lista_feed()
+    postagens_antigas()
 
-    conn.close()
+
+def atualizar_feed():
+    resetar_feed()
+    carregar_mais_feed()
+
+
+@st.fragment(run_every=INTERVALO_FEED_AO_VIVO)
+def postagens_ao_vivo():
+    novas, faltaram = buscar_postagens_novas()
+    st.session_state["feed_novas"][:0] = novas
+    if faltaram:
+        st.caption("Há mais postagens novas do que as mostradas aqui: atualize o feed para ver todas.")
+
+    postagens = st.session_state["feed_novas"]
+    if postagens:
+        st.caption(f"✨ {len(postagens)} postagem(ns) nova(s) desde que você abriu o feed")
+        mostrar_postagens(postagens)
+
+
+@st.fragment
+def lista_feed():
+    # "Carregar mais" só reroda a lista
+    postagens = st.session_state["feed_postagens"]
 
     if not postagens:
         st.info("Nenhuma postagem no feed ainda. Poste sua primeira horta! 🌿")
         return
 
+    mostrar_postagens(postagens)
+
+    if st.session_state["feed_fim"]:
+        st.caption("Você chegou ao fim do feed. 🌾")
+    else:
+        st.button("⬇️ Carregar mais", key="feed_carregar_mais", on_click=carregar_mais_feed)
+
+
+def buscar_pagina_antigas(mes, cursor_feed=None, limite=FEED_POR_PAGINA):
+    """Página de um mês arquivado, no mesmo formato e cursor de `buscar_pagina_feed`.
+
+    Postagens de hortas hoje desativadas ou excluídas não aparecem.
+    """
+    filtro = ""
+    parametros = []
+    if cursor_feed:
+        filtro = "WHERE (antigas.data_postagem, antigas.feed_id) < (?, ?)"
+        parametros.extend(cursor_feed)
+
+    with feed_arquivado(get_banco(), [mes]) as conn:
+        postagens = conn.execute(f"""
+            SELECT antigas.feed_id, antigas.foto, antigas.descricao, antigas.data_postagem,
+                   antigas.nome, antigas.nome_horta, antigas.especie
+            FROM feed_arquivado AS antigas
+            JOIN hortas ON hortas.horta_id = antigas.horta_id AND hortas.ativa = 1
+            {filtro}
+            ORDER BY antigas.data_postagem DESC, antigas.feed_id DESC
+            LIMIT ?
+        """, (*parametros, limite + 1)).fetchall()
+
+    if len(postagens) <= limite:
+        return postagens, None
+    postagens = postagens[:limite]
+    return postagens, (postagens[-1]["data_postagem"], postagens[-1]["feed_id"])
+
+
+def carregar_antigas(mes):
+    if st.session_state.get("antigas_carregado") != mes:
+        st.session_state["antigas_carregado"] = mes
+        st.session_state["antigas_postagens"] = []
+        st.session_state["antigas_cursor"] = None
+    postagens, proximo = buscar_pagina_antigas(mes, st.session_state["antigas_cursor"])
+    st.session_state["antigas_postagens"].extend(dict(p) for p in postagens)
+    st.session_state["antigas_cursor"] = proximo
+
+
+@st.fragment
+def postagens_antigas():
+    # Os bancos do arquivo só são abertos quando um mês é escolhido
+    meses = meses_arquivados()
+    if not meses:
+        return
+
+    with st.expander("📜 Ver postagens antigas"):
+        mes = st.selectbox("Mês", meses, index=None, format_func=lambda mes: f"{mes[5:]}/{mes[:4]}",
+                           placeholder="Escolha um mês", key="antigas_mes")
+        if mes is None:
+            return
+        if st.session_state.get("antigas_carregado") != mes:
+            carregar_antigas(mes)
+
+        postagens = st.session_state["antigas_postagens"]
+        if not postagens:
+            st.info("Nenhuma postagem arquivada neste mês.")
+            return
+        mostrar_postagens(postagens)
+        if st.session_state["antigas_cursor"] is not None:
+            st.button("⬇️ Carregar mais antigas", key="antigas_carregar_mais", on_click=carregar_antigas, args=(mes,))
+
+
+def mostrar_postagens(postagens):
     # Exibir as postagens do feed
+    metadados = fotos_da_pagina([postagem["foto"] for postagem in postagens])
     for postagem in postagens:
         with st.container():
             st.markdown(f"### 🌿 {postagem['nome_horta']} ({postagem['especie']})")
@@ -618,10 +1345,11 @@ def feed_hortas():
             st.markdown(f"📅 **Data da Postagem:** {postagem['data_postagem']}")
 
             # Exibir imagem da postagem, se houver
-            if postagem["foto"] and os.path.exists(postagem["foto"]):
-                st.image(postagem["foto"], width=300)
-            else:
-                st.image("imagens/default-horta.jpg", width=300)  # Imagem padrão
+            foto = imagem_para_exibir(postagem["foto"], metadados, 300, padrao=DEFAULT_HORTA_IMG)
+            try:
+                st.image(foto, width=300)
+            except Exception as e:
+                st.warning(f"Erro ao carregar imagem: {e}")
 
             # Exibir descrição, se houver
             if postagem["descricao"]:
@@ -630,5 +1358,313 @@ def feed_hortas():
             st.write("---")  # Linha separadora entre postagens
 
 
+# ========================== BUSCA DE HORTAS ==========================
+
+BUSCA_POR_PAGINA = 20
+# Pesos do bm25 por coluna: nome_horta, especie, endereco, contato
+PESOS_BUSCA = (10.0, 5.0, 2.0, 1.0)
+
+
+def montar_consulta_fts(termo):
+    """Converte o texto digitado em uma consulta FTS5 por prefixo.
+
+    Cada palavra vira `"palavra"*` (aspas evitam que a sintaxe do FTS5 seja
+    interpretada) e todas precisam casar.
+    """
+    palavras = re.findall(r"\w+", termo)
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+
+def pesquisar_hortas(termo, pagina=0, por_pagina=BUSCA_POR_PAGINA):
+    """Hortas que casam com o termo, ordenadas por bm25.
+
+    Retorna os resultados da página e se existe uma próxima.
+    """
+    consulta = montar_consulta_fts(termo)
+    if not consulta:
+        return [], False
+
+    resultados = consultar(f"""
+        SELECT hortas.horta_id, hortas.nome_horta, hortas.especie, hortas.endereco,
+               hortas.contato, hortas.email, hortas.dias_colheita, hortas.foto
+        FROM hortas_fts
+        JOIN hortas ON hortas.horta_id = hortas_fts.rowid
+        WHERE hortas_fts MATCH ? AND hortas.ativa = 1
+        ORDER BY bm25(hortas_fts, {", ".join(map(str, PESOS_BUSCA))})
+        LIMIT ? OFFSET ?
+    """, (consulta, por_pagina + 1, pagina * por_pagina), tabelas=("hortas",))
+
+    return resultados[:por_pagina], len(resultados) > por_pagina
+
+
+def buscar_hortas():
+    st.subheader("🔎 Buscar Hortas")
+
+    termo = st.text_input("Nome, espécie, endereço ou produtor", key="busca_termo")
+
+    # Nova busca volta para a primeira página
+    if st.session_state.get("busca_ultimo_termo") != termo:
+        st.session_state["busca_ultimo_termo"] = termo
+        st.session_state["busca_pagina"] = 0
+
+    if not termo.strip():
+        st.info("Digite algo para buscar. Ex.: alface, Quadra 71, Dodo")
+        return
+
+    pagina = st.session_state["busca_pagina"]
+    resultados, tem_proxima = pesquisar_hortas(termo, pagina)
+
+    if not resultados:
+        st.warning("Nenhuma horta encontrada. 🌱")
+        return
+
+    metadados = fotos_da_pagina([horta["foto"] for horta in resultados])
+    for horta in resultados:
+        with st.container():
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                foto = imagem_para_exibir(horta["foto"], metadados, 100)
+                if foto:
+                    try:
+                        st.image(foto, width=100)
+                    except Exception as e:
+                        st.warning(f"Erro ao carregar imagem: {e}")
+            with col2:
+                st.markdown(f"**🌿 {horta['nome_horta']}** ({horta['especie']})")
+                st.write(f"👨‍🌾 {horta['contato']} - 📧 {horta['email']}")
+                st.write(f"📍 {horta['endereco']} · ⏳ {horta['dias_colheita']} dias para colheita")
+            st.write("---")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if pagina > 0 and st.button("⬅️ Anterior", key="busca_anterior"):
+            st.session_state["busca_pagina"] -= 1
+            st.rerun()
+    with col2:
+        st.caption(f"Página {pagina + 1}")
+    with col3:
+        if tem_proxima and st.button("Próxima ➡️", key="busca_proxima"):
+            st.session_state["busca_pagina"] += 1
+            st.rerun()
+
+
+# ========================== HORTAS PERTO DE MIM ==========================
+
+def hortas_perto_de_mim():
+    st.subheader("📍 Hortas Perto de Mim")
+
+    referencia = st.text_input(
+        "Seu endereço, cidade ou CEP",
+        value=st.session_state["user"].get("endereco", "") if st.session_state["user"] else "",
+        key="proximidade_endereco",
+    )
+    with st.expander("Usar coordenadas exatas"):
+        latitude = st.number_input("Latitude", min_value=-90.0, max_value=90.0, value=None, format="%.6f", key="proximidade_lat")
+        longitude = st.number_input("Longitude", min_value=-180.0, max_value=180.0, value=None, format="%.6f", key="proximidade_lon")
+    raio_km = st.slider("Raio (km)", min_value=1, max_value=300, value=30, key="proximidade_raio")
+
+    if latitude is None or longitude is None:
+        coordenadas = geocodificar(referencia)
+        if not coordenadas:
+            st.info("Não reconhecemos esse endereço. Informe a cidade, o CEP ou as coordenadas.")
+            return
+        latitude, longitude = coordenadas
+
+    with conexao() as conn:
+        proximas = hortas_proximas(conn, latitude, longitude, raio_km)
+
+    if not proximas:
+        st.warning(f"Nenhuma horta num raio de {raio_km} km. 🌱")
+        return
+
+    st.caption(f"{len(proximas)} horta(s) num raio de {raio_km} km")
+    for horta, distancia in proximas:
+        st.markdown(f"**🌿 {horta['nome_horta']}** ({horta['especie']}) — 📏 {distancia:.1f} km")
+        st.write(f"👨‍🌾 {horta['contato']} - 📧 {horta['email']} · 📍 {horta['endereco']}")
+        st.write("---")
+
+
+
+# ========================== DEMANDAS DOS COMPRADORES ==========================
+
+HORTAS_POR_DEMANDA = 5
+COMPRADORES_POR_PAGINA = 50
+
+
+def descrever_distancia(distancia_km):
+    return "distância desconhecida" if distancia_km is None else f"{distancia_km:.0f} km"
+
+
+def minhas_demandas():
+    st.subheader("🛒 Minhas Demandas")
+    usuario = st.session_state["user"]
+    hoje = date.today()
+
+    with st.expander("➕ Registrar nova demanda"), st.form("form_demanda"):
+        especie = st.text_input("Espécie procurada", key="demanda_especie")
+        col1, col2 = st.columns(2)
+        quantidade = col1.number_input("Quantidade", min_value=0.1, value=10.0, step=1.0, key="demanda_quantidade")
+        unidade = col2.selectbox("Unidade", UNIDADES, key="demanda_unidade")
+        periodo = st.date_input(
+            "Janela de compra", value=(hoje, hoje + timedelta(days=14)), format="DD/MM/YYYY", key="demanda_periodo")
+        endereco = st.text_input("Região (cidade ou CEP)", value=usuario.get("endereco", ""), key="demanda_endereco")
+        raio_km = st.slider("Raio (km)", min_value=1, max_value=300, value=RAIO_PADRAO_KM, key="demanda_raio")
+
+        if st.form_submit_button("Registrar demanda", key="demanda_registrar"):
+            if not especie.strip() or len(periodo) != 2:
+                st.error("Informe a espécie e a data inicial e final da janela.")
+            else:
+                with transacao("demandas", "correspondencias") as conn:
+                    registrar_demanda(conn, usuario["user_id"], especie, quantidade, unidade, *periodo, endereco, raio_km)
+                st.success("Demanda registrada!")
+
+    demandas = consultar(
+        "SELECT * FROM demandas WHERE usuario_id = ? AND data_fim >= ? ORDER BY data_inicio, demanda_id",
+        (usuario["user_id"], hoje), tabelas=("demandas",))
+    if not demandas:
+        st.info("Você não tem demandas em aberto.")
+        return
+
+    # As melhores hortas de todas as demandas numa consulta só
+    hortas = consultar("""
+        SELECT * FROM (
+            SELECT correspondencias.demanda_id, correspondencias.pontuacao, correspondencias.distancia_km,
+                   hortas.nome_horta, hortas.data_colheita, hortas.contato, hortas.email, hortas.endereco,
+                   row_number() OVER (PARTITION BY correspondencias.demanda_id
+                                      ORDER BY correspondencias.pontuacao DESC) AS posicao
+            FROM demandas
+            JOIN correspondencias ON correspondencias.demanda_id = demandas.demanda_id
+            JOIN hortas ON hortas.horta_id = correspondencias.horta_id
+            WHERE demandas.usuario_id = ? AND demandas.data_fim >= ?
+        )
+        WHERE posicao <= ?
+        ORDER BY demanda_id, posicao
+    """, (usuario["user_id"], hoje, HORTAS_POR_DEMANDA), tabelas=("demandas", "correspondencias", "hortas"))
+    por_demanda = {}
+    for horta in hortas:
+        por_demanda.setdefault(horta["demanda_id"], []).append(horta)
+
+    st.markdown("**🌿 Hortas para você**")
+    for demanda in demandas:
+        with st.container(border=True):
+            st.markdown(
+                f"**{demanda['especie'].capitalize()}** — {demanda['quantidade']:g} {demanda['unidade']} · "
+                f"{ler_data(demanda['data_inicio']):%d/%m} a {ler_data(demanda['data_fim']):%d/%m/%Y} · "
+                f"📍 {demanda['endereco'] or 'qualquer região'} ({demanda['raio_km']:g} km)"
+            )
+            encontradas = por_demanda.get(demanda["demanda_id"], [])
+            if not encontradas:
+                st.caption("Nenhuma horta atende esta demanda ainda. Ela aparece aqui assim que for cadastrada.")
+            for horta in encontradas:
+                colheita = ler_data(horta["data_colheita"])
+                st.write(
+                    f"🌿 **{horta['nome_horta']}** · 🗓️ {f'{colheita:%d/%m/%Y}' if colheita else 'colheita sem data'} · "
+                    f"📏 {descrever_distancia(horta['distancia_km'])} · ⭐ {horta['pontuacao']:.0%}"
+                )
+                st.caption(f"👨‍🌾 {horta['contato']} - 📧 {horta['email']} · 📍 {horta['endereco']}")
+
+            if st.button("🗑️ Encerrar demanda", key=f"encerrar_demanda_{demanda['demanda_id']}"):
+                with transacao("demandas", "correspondencias") as conn:
+                    conn.execute("DELETE FROM demandas WHERE demanda_id = ?", (demanda["demanda_id"],))
+                st.rerun()
+
+
+def compradores_interessados():
+    st.subheader("🤝 Compradores Interessados")
+
+    compradores = consultar("""
+        SELECT hortas.nome_horta, correspondencias.pontuacao, correspondencias.distancia_km,
+               demandas.especie, demandas.quantidade, demandas.unidade, demandas.data_inicio, demandas.data_fim,
+               demandas.endereco, users.nome, users.email, users.telefone
+        FROM hortas
+        JOIN correspondencias ON correspondencias.horta_id = hortas.horta_id
+        JOIN demandas ON demandas.demanda_id = correspondencias.demanda_id
+        JOIN users ON users.user_id = demandas.usuario_id
+        WHERE hortas.usuario_id = ? AND demandas.data_fim >= ?
+        ORDER BY correspondencias.pontuacao DESC
+        LIMIT ?
+    """, (st.session_state["user"]["user_id"], date.today(), COMPRADORES_POR_PAGINA),
+        tabelas=("hortas", "correspondencias", "demandas", "users"))
+
+    if not compradores:
+        st.info("Nenhum comprador procura, por enquanto, o que as suas hortas produzem. 🌱")
+        return
+
+    st.caption("Demandas em aberto que combinam com a espécie, a data de colheita e a região das suas hortas")
+    for comprador in compradores:
+        st.markdown(
+            f"**🛒 {comprador['nome']}** quer {comprador['quantidade']:g} {comprador['unidade']} de "
+            f"**{comprador['especie']}** entre {ler_data(comprador['data_inicio']):%d/%m} e "
+            f"{ler_data(comprador['data_fim']):%d/%m/%Y} · ⭐ {comprador['pontuacao']:.0%}"
+        )
+        st.write(
+            f"🌿 Sua horta: {comprador['nome_horta']} · 📏 {descrever_distancia(comprador['distancia_km'])} · "
+            f"📧 {comprador['email']} · 📞 {comprador['telefone']}"
+        )
+        st.write("---")
+
+
+# ========================== CALENDÁRIO DE COLHEITAS ==========================
+
+@st.cache_data(ttl=600, show_spinner=False)
+def dados_calendario(inicio, fim, geracao):
+    """Colheitas previstas entre `inicio` e `fim` e o total por semana e espécie.
+
+    A faixa de datas é lida pelo índice de `data_colheita`; a agregação é
+    feita no pandas e fica em cache até `geracao` (de hortas) mudar.
+    """
+    import pandas as pd
+
+    with conexao() as conn:
+        colheitas = pd.read_sql_query("""
+            SELECT data_colheita, lower(trim(especie)) AS especie, horta_id, nome_horta, contato, email, endereco
+            FROM hortas
+            WHERE data_colheita BETWEEN ? AND ? AND ativa = 1
+            ORDER BY data_colheita
+        """, conn, params=(inicio.isoformat(), fim.isoformat()), parse_dates=["data_colheita"])
+
+    semanal = (
+        colheitas.groupby([pd.Grouper(key="data_colheita", freq="W-MON", label="left", closed="left"), "especie"])
+        .size()
+        .unstack("especie", fill_value=0)
+    )
+    return colheitas, semanal
+
+
+def calendario_colheitas():
+    st.subheader("🗓️ Calendário de Colheitas")
+
+    hoje = date.today()
+    periodo = st.date_input(
+        "Colheitas entre", value=(hoje, hoje + timedelta(days=7)), format="DD/MM/YYYY", key="calendario_periodo")
+    if len(periodo) != 2:
+        st.info("Escolha a data final do período.")
+        return
+    inicio, fim = periodo
+
+    colheitas, semanal = dados_calendario(inicio, fim, get_banco().geracao("hortas"))
+    if colheitas.empty:
+        st.warning("Nenhuma colheita prevista nesse período. 🌱")
+        return
+
+    especies = st.multiselect("Espécies", sorted(colheitas["especie"].unique()), key="calendario_especies")
+    if especies:
+        colheitas = colheitas[colheitas["especie"].isin(especies)]
+        semanal = semanal[especies]
+
+    st.caption(f"{len(colheitas)} horta(s) com colheita prevista de {inicio:%d/%m/%Y} a {fim:%d/%m/%Y}")
+    st.markdown("**Hortas por semana e espécie** (semanas a partir de segunda-feira)")
+    st.bar_chart(semanal)
+
+    st.dataframe(
+        colheitas.assign(data_colheita=colheitas["data_colheita"].dt.strftime("%d/%m/%Y")).drop(columns="horta_id"),
+        hide_index=True,
+        column_config={
+            "data_colheita": "Colheita prevista", "especie": "Espécie", "nome_horta": "Horta",
+            "contato": "Produtor", "email": "Email", "endereco": "Endereço",
+        },
+    )
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,207 @@
+"""Arquivamento mensal das postagens antigas do feed.
+
+``feed_hortas`` só cresce, e todo backup ou VACUUM do ``database.db`` paga
+pelo histórico inteiro. Postagens com mais de ``RETENCAO_DIAS`` saem do
+banco quente para um SQLite por mês (``arquivo/feed_AAAA-MM.db``), já com
+nome do produtor e dados da horta, e as fotos delas são copiadas para a
+pasta fria (``arquivo/uploads``). As do banco quente que ninguém mais cita
+são apagadas pelo coletor de lixo de sempre. Um mês arquivado não muda
+mais: o backup dele é feito uma vez.
+
+O histórico continua consultável sob demanda: ``feed_arquivado`` anexa com
+ATTACH só os meses pedidos e cria a visão temporária ``feed_arquivado``
+(união deles). O app lê um mês por vez em "Ver postagens antigas".
+
+As análises não perdem as postagens arquivadas (migração 13), mas
+``python banco.py reconstruir resumos`` só conta o banco quente.
+
+Variáveis de ambiente:
+
+- ``CAMPOCIDADE_RETENCAO_DIAS``: idade mínima, em dias, para arquivar (padrão 365)
+- ``CAMPOCIDADE_PASTA_ARQUIVO``: pasta dos bancos mensais (padrão ``arquivo``)
+- ``CAMPOCIDADE_PASTA_FRIA``: pasta das fotos arquivadas (padrão ``arquivo/uploads``)
+
+Para rodar (ex.: pelo cron, uma vez por dia) e consultar:
+
+    python arquivamento.py arquivar [--dias 365] [--vacuum]
+    python arquivamento.py meses
+    python arquivamento.py consultar "SELECT count(*) FROM feed_arquivado" 2024-01 2024-02
+"""
+
+import argparse
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from midia import UPLOAD_FOLDER, coletar_lixo, copiar_foto
+
+RETENCAO_DIAS = int(os.environ.get("CAMPOCIDADE_RETENCAO_DIAS", 365))
+PASTA_ARQUIVO = os.environ.get("CAMPOCIDADE_PASTA_ARQUIVO", "arquivo")
+PASTA_FRIA = os.environ.get("CAMPOCIDADE_PASTA_FRIA", os.path.join(PASTA_ARQUIVO, "uploads"))
+
+# O SQLite anexa no máximo 10 bancos por conexão (SQLITE_MAX_ATTACHED)
+MAX_MESES_ANEXADOS = 10
+
+_ARQUIVO_RE = re.compile(r"^feed_(\d{4}-\d{2})\.db$")
+
+ESQUEMA_ARQUIVO = """
+    CREATE TABLE IF NOT EXISTS {nome}.postagens (
+        feed_id INTEGER PRIMARY KEY,
+        data_postagem TIMESTAMP NOT NULL,
+        horta_id INTEGER NOT NULL,
+        usuario_id INTEGER NOT NULL,
+        foto TEXT,
+        descricao TEXT,
+        nome TEXT,
+        nome_horta TEXT,
+        especie TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {nome}.idx_postagens_data ON postagens (data_postagem, feed_id);
+"""
+
+# Postagens de um mês a arquivar; LEFT JOIN para guardar também as de hortas desativadas
+SELECT_ARQUIVAR = """
+    SELECT feed_hortas.feed_id, feed_hortas.data_postagem, feed_hortas.horta_id, feed_hortas.usuario_id,
+           feed_hortas.foto, feed_hortas.descricao, users.nome, hortas.nome_horta, hortas.especie
+    FROM main.feed_hortas
+    LEFT JOIN main.users ON users.user_id = feed_hortas.usuario_id
+    LEFT JOIN main.hortas ON hortas.horta_id = feed_hortas.horta_id
+    WHERE feed_hortas.feed_id BETWEEN ? AND ?
+      AND strftime('%Y-%m', feed_hortas.data_postagem) = ? AND feed_hortas.data_postagem < ?
+"""
+
+
+def caminho_mes(mes, pasta=PASTA_ARQUIVO):
+    return os.path.join(pasta, f"feed_{mes}.db")
+
+
+def meses_arquivados(pasta=PASTA_ARQUIVO):
+    """Meses ("AAAA-MM") com banco de arquivo, do mais recente para o mais antigo."""
+    if not os.path.isdir(pasta):
+        return []
+    meses = [m.group(1) for m in map(_ARQUIVO_RE.match, os.listdir(pasta)) if m]
+    return sorted(meses, reverse=True)
+
+
+def _nome_anexo(mes):
+    return f"arquivo_{mes.replace('-', '_')}"
+
+
+def arquivar_feed(banco, dias=RETENCAO_DIAS, pasta=PASTA_ARQUIVO, pasta_fria=PASTA_FRIA, uploads=UPLOAD_FOLDER):
+    """Move as postagens com mais de ``dias`` para os bancos mensais. Retorna {mês: postagens}.
+
+    Cada mês é copiado numa transação (INSERT OR IGNORE: repetir é seguro) e
+    só depois apagado do banco quente, conferindo o que já está no arquivo.
+    """
+    limite = datetime.now() - timedelta(days=dias)
+    with banco.conexao() as conn:
+        # Uma varredura só; depois cada mês é lido pela faixa de feed_id
+        meses = conn.execute("""
+            SELECT strftime('%Y-%m', data_postagem) AS mes, min(feed_id), max(feed_id)
+            FROM feed_hortas WHERE data_postagem < ?
+            GROUP BY mes ORDER BY mes
+        """, (limite,)).fetchall()
+    if not meses:
+        return {}
+
+    os.makedirs(pasta, exist_ok=True)
+    arquivadas = {}
+    for mes, primeiro, ultimo in meses:
+        nome = _nome_anexo(mes)
+        parametros = (primeiro, ultimo, mes, limite)
+        anexos = {nome: caminho_mes(mes, pasta)}
+
+        with banco.transacao(anexos=anexos) as conn:
+            for comando in ESQUEMA_ARQUIVO.format(nome=nome).split(";"):
+                if comando.strip():
+                    conn.execute(comando)
+            conn.execute(f"INSERT OR IGNORE INTO {nome}.postagens {SELECT_ARQUIVAR}", parametros)
+            fotos = [linha[0] for linha in conn.execute(
+                f"SELECT DISTINCT foto FROM {nome}.postagens WHERE coalesce(foto, '') <> '' AND foto NOT LIKE ?",
+                (f"{pasta_fria.replace(os.sep, '/')}/%",)).fetchall()]
+
+        # Fotos para a pasta fria antes de sumirem do banco quente
+        frias = {foto: copiar_foto(foto, uploads, pasta_fria) for foto in fotos}
+        with banco.transacao(anexos=anexos) as conn:
+            conn.executemany(
+                f"UPDATE {nome}.postagens SET foto = ? WHERE foto = ?",
+                [(fria, foto) for foto, fria in frias.items() if fria])
+
+        with banco.transacao("feed_hortas", anexos=anexos) as conn:
+            conn.execute("INSERT INTO arquivamento_em_curso VALUES (1)")
+            cursor = conn.execute(f"""
+                DELETE FROM main.feed_hortas
+                WHERE feed_id IN (SELECT feed_id FROM {nome}.postagens WHERE feed_id BETWEEN ? AND ?)
+                  AND strftime('%Y-%m', data_postagem) = ? AND data_postagem < ?
+            """, parametros)
+            conn.execute("DELETE FROM arquivamento_em_curso")
+        arquivadas[mes] = cursor.rowcount
+
+        # As fotos que só as postagens arquivadas citavam saem de uploads
+        coletar_lixo(banco, uploads, apenas=fotos)
+    return arquivadas
+
+
+@contextmanager
+def feed_arquivado(banco, meses, pasta=PASTA_ARQUIVO):
+    """Conexão com os ``meses`` anexados e a visão temporária ``feed_arquivado``.
+
+    Meses sem banco de arquivo são ignorados; sem nenhum, a visão fica vazia.
+    """
+    meses = [mes for mes in dict.fromkeys(meses) if os.path.exists(caminho_mes(mes, pasta))]
+    if len(meses) > MAX_MESES_ANEXADOS:
+        raise ValueError(f"No máximo {MAX_MESES_ANEXADOS} meses por consulta.")
+
+    anexos = {_nome_anexo(mes): caminho_mes(mes, pasta) for mes in meses}
+    uniao = " UNION ALL ".join(f"SELECT * FROM {nome}.postagens" for nome in anexos) or (
+        "SELECT NULL AS feed_id, NULL AS data_postagem, NULL AS horta_id, NULL AS usuario_id, NULL AS foto, "
+        "NULL AS descricao, NULL AS nome, NULL AS nome_horta, NULL AS especie WHERE 0"
+    )
+    with banco.conexao(anexos=anexos) as conn:
+        conn.execute(f"CREATE TEMP VIEW feed_arquivado AS {uniao}")
+        try:
+            yield conn
+        finally:
+            conn.execute("DROP VIEW IF EXISTS temp.feed_arquivado")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--banco", default=None, help="caminho do banco quente (padrão: database.db)")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    arquivar = comandos.add_parser("arquivar", help="move as postagens antigas para os bancos mensais")
+    arquivar.add_argument("--dias", type=int, default=RETENCAO_DIAS, help="idade mínima das postagens")
+    arquivar.add_argument("--vacuum", action="store_true", help="compacta o banco quente depois")
+    comandos.add_parser("meses", help="lista os meses arquivados")
+    consultar = comandos.add_parser("consultar", help="roda um SELECT sobre a visão feed_arquivado")
+    consultar.add_argument("sql")
+    consultar.add_argument("meses", nargs="+", help="meses AAAA-MM a anexar")
+    args = parser.parse_args()
+
+    from banco import DATABASE, GerenciadorBanco, migrar
+
+    banco = GerenciadorBanco(args.banco or DATABASE)
+    migrar(banco)
+
+    if args.comando == "arquivar":
+        arquivadas = arquivar_feed(banco, args.dias)
+        for mes, quantidade in arquivadas.items():
+            print(f"{mes}: {quantidade} postagem(ns) arquivada(s) em {caminho_mes(mes)}")
+        if not arquivadas:
+            print(f"Nenhuma postagem com mais de {args.dias} dias.")
+        if args.vacuum:
+            with banco.conexao() as conn:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    elif args.comando == "meses":
+        for mes in meses_arquivados():
+            print(f"{mes}\t{os.path.getsize(caminho_mes(mes)) / 1024:.0f} KB")
+    else:
+        with feed_arquivado(banco, args.meses) as conn:
+            for linha in conn.execute(args.sql):
+                print("\t".join("" if valor is None else str(valor) for valor in linha))
+
+
+if __name__ == "__main__":
+    main()
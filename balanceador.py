@@ -0,0 +1,245 @@
+"""Roda vários processos do app atrás de um proxy local com sessões fixas.
+
+Um processo do Streamlit usa um núcleo só. Este script aplica as migrações
+uma vez (sob o mesmo lock de arquivo que cada processo usaria), sobe N
+processos ``streamlit run app.py`` em portas locais e atende na porta
+pública com um proxy reverso HTTP/WebSocket. O primeiro acesso escolhe um
+processo em rodízio e grava o cookie ``campocidade_processo``; os pedidos
+seguintes (inclusive o websocket da sessão e as reconexões) voltam ao mesmo
+processo. Processos que caem são reiniciados.
+
+Todos usam o mesmo ``database.db`` e a mesma pasta ``uploads``; os caches
+de cada processo seguem coerentes pela tabela ``alteracoes`` (ver banco.py).
+O servidor de imagens (estaticos.py, com ``CAMPOCIDADE_URL_IMAGENS``) e a
+API JSON (api.py, com ``CAMPOCIDADE_TOKEN_API``) sobem aqui, uma vez; os
+processos do app só montam as URLs das imagens.
+
+    python balanceador.py                          # um processo por núcleo, porta 8501
+    python balanceador.py --processos 4 --porta 8080
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+from api import iniciar_api
+from banco import DATABASE, GerenciadorBanco, migrar
+from estaticos import base_imagens, iniciar_servidor
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_APP = os.path.join(DIRETORIO_APP, "app.py")
+
+PORTA_PUBLICA = 8501
+# Os processos do app escutam só em 127.0.0.1, a partir desta porta
+PORTA_BASE_PROCESSOS = 8511
+COOKIE = "campocidade_processo"
+# Tamanho máximo do cabeçalho HTTP lido pelo proxy
+LIMITE_CABECALHO = 64 * 1024
+BLOCO = 64 * 1024
+# Segundos entre as verificações dos processos e antes de reiniciar um que caiu
+INTERVALO_MONITOR = 1
+ESPERA_REINICIO = 2
+
+_COOKIE_RE = re.compile(rb"^cookie:.*\b" + COOKIE.encode() + rb"=(\d+)", re.IGNORECASE | re.MULTILINE)
+_ENCAMINHADO_RE = re.compile(rb"^x-forwarded-for:[^\r\n]*\r\n", re.IGNORECASE | re.MULTILINE)
+_CONEXAO_RE = re.compile(rb"^(connection|keep-alive|proxy-connection):[^\r\n]*\r\n", re.IGNORECASE | re.MULTILINE)
+_TAMANHO_RE = re.compile(rb"^content-length:[ \t]*(\d+)[ \t]*\r\n", re.IGNORECASE | re.MULTILINE)
+_EM_PARTES_RE = re.compile(rb"^transfer-encoding:", re.IGNORECASE | re.MULTILINE)
+_WEBSOCKET_RE = re.compile(rb"^upgrade:[ \t]*websocket", re.IGNORECASE | re.MULTILINE)
+
+
+def _encaminhar(cabecalho, ip):
+    """Cabeçalho do pedido com ``X-Forwarded-For`` = IP do cliente.
+
+    Os processos só veem conexões de 127.0.0.1; sem isto todos os usuários
+    cairiam no mesmo balde do limite de tentativas por IP. O valor mandado
+    pelo cliente é descartado, para não ser forjado.
+    """
+    linha_pedido, resto = cabecalho.split(b"\r\n", 1)
+    return linha_pedido + b"\r\nX-Forwarded-For: " + ip.encode() + b"\r\n" + _ENCAMINHADO_RE.sub(b"", resto)
+
+
+def _fechar_depois(cabecalho):
+    """Cabeçalho (de pedido ou resposta) com ``Connection: close`` no lugar do keep-alive."""
+    primeira_linha, resto = cabecalho.split(b"\r\n", 1)
+    return primeira_linha + b"\r\nConnection: close\r\n" + _CONEXAO_RE.sub(b"", resto)
+
+
+class Processo:
+    """Um ``streamlit run app.py`` numa porta local."""
+
+    def __init__(self, indice, porta):
+        self.indice = indice
+        self.porta = porta
+        self.popen = None
+        self.caiu_em = None
+
+    def iniciar(self):
+        self.popen = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", ARQUIVO_APP,
+             "--server.port", str(self.porta), "--server.address", "127.0.0.1",
+             "--server.headless", "true", "--browser.gatherUsageStats", "false"],
+            env={**os.environ, "CAMPOCIDADE_BALANCEADOR": "1"},
+        )
+        self.caiu_em = None
+
+    def vivo(self):
+        return self.popen is not None and self.popen.poll() is None
+
+    def parar(self):
+        if self.vivo():
+            self.popen.terminate()
+
+
+class Balanceador:
+    """Proxy reverso com sessão fixa por cookie e rodízio no primeiro acesso."""
+
+    def __init__(self, processos):
+        self.processos = processos
+        self._rodizio = itertools.cycle(range(len(processos)))
+
+    def _escolher(self, cabecalho):
+        """(processo, cookie novo?) para o pedido com este cabeçalho."""
+        fixo = _COOKIE_RE.search(cabecalho)
+        if fixo and int(fixo.group(1)) < len(self.processos):
+            processo = self.processos[int(fixo.group(1))]
+            if processo.vivo():
+                return processo, False
+        for _ in self.processos:
+            processo = self.processos[next(self._rodizio)]
+            if processo.vivo():
+                return processo, True
+        return None, True
+
+    async def atender(self, leitor_cliente, escritor_cliente):
+        """Um pedido por conexão (ou um websocket), sempre com o cabeçalho reescrito.
+
+        Só o primeiro cabeçalho da conexão é lido, então pedidos HTTP comuns
+        seguem com ``Connection: close`` e só o corpo declarado em
+        Content-Length é repassado: um segundo pedido na mesma conexão nunca
+        chega ao processo sem passar por ``_encaminhar`` e ``_escolher``.
+        Depois do handshake do websocket só trafegam quadros, não pedidos.
+        """
+        escritor_processo = None
+        try:
+            cabecalho = await leitor_cliente.readuntil(b"\r\n\r\n")
+            processo, novo = self._escolher(cabecalho)
+            if processo is None:
+                escritor_cliente.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+                                       b"Connection: close\r\n\r\n")
+                return
+            websocket = bool(_WEBSOCKET_RE.search(cabecalho))
+            if not websocket and _EM_PARTES_RE.search(cabecalho):
+                # Sem o tamanho não dá para saber onde o corpo termina
+                escritor_cliente.write(b"HTTP/1.1 411 Length Required\r\nContent-Length: 0\r\n"
+                                       b"Connection: close\r\n\r\n")
+                return
+            leitor_processo, escritor_processo = await asyncio.open_connection("127.0.0.1", processo.porta)
+
+            cabecalho = _encaminhar(cabecalho, escritor_cliente.get_extra_info("peername")[0])
+            # O corpo do pedido (uploads) segue enquanto a resposta é lida
+            if websocket:
+                envio = asyncio.ensure_future(_copiar(leitor_cliente, escritor_processo))
+            else:
+                cabecalho = _fechar_depois(cabecalho)
+                tamanho = _TAMANHO_RE.search(cabecalho)
+                envio = asyncio.ensure_future(
+                    _copiar(leitor_cliente, escritor_processo, limite=int(tamanho.group(1)) if tamanho else 0))
+            escritor_processo.write(cabecalho)
+            resposta = await leitor_processo.readuntil(b"\r\n\r\n")
+            if not websocket:
+                resposta = _fechar_depois(resposta)
+            if novo:
+                linha_status, resto = resposta.split(b"\r\n", 1)
+                resposta = (linha_status + b"\r\nSet-Cookie: " + f"{COOKIE}={processo.indice}".encode()
+                            + b"; Path=/; HttpOnly; SameSite=Lax\r\n" + resto)
+            escritor_cliente.write(resposta)
+            await asyncio.gather(envio, _copiar(leitor_processo, escritor_cliente))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError):
+            pass  # cliente ou processo desconectou no meio do pedido
+        finally:
+            for escritor in (escritor_cliente, escritor_processo):
+                if escritor is not None:
+                    escritor.close()
+
+    async def monitorar(self):
+        """Reinicia os processos que caíram."""
+        while True:
+            for processo in self.processos:
+                if processo.vivo():
+                    continue
+                if processo.caiu_em is None:
+                    processo.caiu_em = time.monotonic()
+                    print(f"processo {processo.indice} (porta {processo.porta}) parou; reiniciando", file=sys.stderr)
+                elif time.monotonic() - processo.caiu_em >= ESPERA_REINICIO:
+                    processo.iniciar()
+            await asyncio.sleep(INTERVALO_MONITOR)
+
+
+async def _copiar(leitor, escritor, limite=None):
+    """Repassa até o fim da conexão ou, com ``limite``, só esse número de bytes."""
+    try:
+        while limite is None or limite > 0:
+            dados = await leitor.read(BLOCO if limite is None else min(BLOCO, limite))
+            if not dados:
+                if escritor.can_write_eof():
+                    escritor.write_eof()
+                return
+            if limite is not None:
+                limite -= len(dados)
+            escritor.write(dados)
+            await escritor.drain()
+    except (ConnectionError, OSError):
+        pass
+
+
+async def servir(balanceador, host, porta):
+    servidor = await asyncio.start_server(balanceador.atender, host, porta, limit=LIMITE_CABECALHO)
+    print(f"Campo Cidade em http://{host}:{porta} com {len(balanceador.processos)} processo(s)")
+    async with servidor:
+        await asyncio.gather(servidor.serve_forever(), balanceador.monitorar())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="processos do app (padrão: núcleos)")
+    parser.add_argument("--porta", type=int, default=PORTA_PUBLICA, help="porta pública do proxy")
+    parser.add_argument("--host", default="0.0.0.0", help="interface do proxy")
+    parser.add_argument("--porta-base", type=int, default=PORTA_BASE_PROCESSOS, help="porta local do 1º processo")
+    args = parser.parse_args()
+
+    # O app usa caminhos relativos (banco, uploads, imagens)
+    os.chdir(DIRETORIO_APP)
+
+    # Migra antes de subir os processos: eles só encontram o esquema em dia
+    banco = GerenciadorBanco(DATABASE)
+    print(f"Esquema na versão {migrar(banco)}.")
+    if base_imagens():
+        iniciar_servidor()
+    iniciar_api(banco)
+
+    processos = [Processo(indice, args.porta_base + indice) for indice in range(args.processos)]
+    for processo in processos:
+        processo.iniciar()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(servir(Balanceador(processos), args.host, args.porta))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for processo in processos:
+            processo.parar()
+        for processo in processos:
+            if processo.popen is not None:
+                processo.popen.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1138 @@
+"""Camada de acesso ao SQLite do Campo Cidade.
+
+Um único ``GerenciadorBanco`` por processo mantém um pool de conexões já
+configuradas (WAL, busy_timeout, cache de statements) e expõe dois
+context managers:
+
+    with banco.conexao() as conn:      # leitura
+        conn.execute("SELECT ...")
+
+    with banco.transacao("hortas") as conn:    # escrita, COMMIT/ROLLBACK automáticos
+        conn.execute("INSERT ...")
+
+Leituras repetidas podem passar pelo cache de consultas, indexado pela SQL,
+pelos parâmetros e pela geração de cada tabela lida. Toda transação declara
+as tabelas que escreve e incrementa a geração delas no COMMIT, o que torna
+obsoletas exatamente as consultas que dependem delas:
+
+    banco.consultar("SELECT * FROM hortas WHERE horta_id = ?", (1,), tabelas=("hortas",))
+
+As gerações ficam gravadas na tabela ``alteracoes``, na mesma transação da
+escrita, e são relidas quando ``PRAGMA data_version`` acusa um COMMIT de
+outra conexão: com vários processos do app no mesmo banco, a escrita de um
+invalida o cache de todos.
+
+O esquema é versionado por ``PRAGMA user_version``: ``migrar()`` aplica, sob
+um lock de arquivo, só as migrações numeradas ainda não aplicadas.
+
+Este módulo não depende do Streamlit, para poder ser usado também por
+scripts de linha de comando:
+
+    python banco.py migrar
+    python banco.py reconstruir feed      # ou resumos, referencias
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+DATABASE = "database.db"
+TIMEOUT_MIGRACAO = 60
+
+TAMANHO_POOL = 8
+# Segundos de espera por uma conexão livre / por um lock do SQLite
+TIMEOUT_POOL = 30
+TIMEOUT_LOCK = 5
+STATEMENTS_EM_CACHE = 256
+
+# Escrita em lote: pedidos por COMMIT e espera máxima (segundos) para juntar um lote
+LOTE_ESCRITA = 64
+ESPERA_LOTE = 0.02
+
+# Cache de consultas: número máximo de resultados e validade em segundos
+CACHE_MAX_ENTRADAS = 512
+CACHE_TTL = 300
+
+# Funções chamadas como f(sql, segundos, linhas) a cada execução e leitura
+# feita pelas conexões do pool. Sem observadores, nada é medido.
+OBSERVADORES_SQL = []
+# Funções f(comando) ligadas ao set_trace_callback das conexões: recebem cada
+# comando que o SQLite executa, inclusive os de gatilhos ("-- TRIGGER nome").
+# Só valem para conexões criadas depois do registro.
+RASTREADORES_SQL = []
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # seguro com WAL; só o último commit pode se perder em queda de energia
+    "cache_size": -16000,  # em KiB (~16 MB por conexão)
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": TIMEOUT_LOCK * 1000,
+}
+
+
+def _notificar(sql, segundos, linhas):
+    for observador in list(OBSERVADORES_SQL):
+        try:
+            observador(sql, segundos, linhas)
+        except Exception:
+            pass  # um observador com erro não pode derrubar a consulta
+
+
+def _rastrear(comando):
+    for rastreador in list(RASTREADORES_SQL):
+        try:
+            rastreador(comando)
+        except Exception:
+            pass
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que informa aos observadores o tempo e as linhas de cada leitura."""
+
+    sql = ""
+
+    def _medir(self, leitura, *args):
+        inicio = time.perf_counter()
+        resultado = leitura(*args)
+        linhas = len(resultado) if isinstance(resultado, list) else int(resultado is not None)
+        _notificar(self.sql, time.perf_counter() - inicio, linhas)
+        return resultado
+
+    def fetchone(self):
+        return self._medir(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._medir(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._medir(super().fetchall)
+
+
+class ConexaoMedida(sqlite3.Connection):
+    """Conexão cujo execute/executemany é medido quando há observadores."""
+
+    def execute(self, sql, parametros=()):
+        if not OBSERVADORES_SQL:
+            return super().execute(sql, parametros)
+        cursor = self.cursor(CursorMedido)
+        cursor.sql = sql
+        inicio = time.perf_counter()
+        cursor.execute(sql, parametros)
+        _notificar(sql, time.perf_counter() - inicio, 0)
+        return cursor
+
+    def executemany(self, sql, parametros):
+        if not OBSERVADORES_SQL:
+            return super().executemany(sql, parametros)
+        inicio = time.perf_counter()
+        cursor = super().executemany(sql, parametros)
+        _notificar(sql, time.perf_counter() - inicio, max(cursor.rowcount, 0))
+        return cursor
+
+
+class CacheConsultas:
+    """LRU com TTL para resultados de SELECT, com contadores de acerto."""
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._entradas.move_to_end(chave)
+                self.hits += 1
+                return True, entrada[1]
+            if entrada is not None:
+                del self._entradas[chave]
+            self.misses += 1
+            return False, None
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._entradas[chave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+                "entradas": len(self._entradas),
+            }
+
+
+class GerenciadorBanco:
+    """Pool de conexões SQLite compartilhado pelo processo."""
+
+    def __init__(self, caminho=DATABASE, tamanho_pool=TAMANHO_POOL):
+        self.caminho = caminho
+        self.tamanho_pool = tamanho_pool
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+        self.cache = CacheConsultas()
+        self._geracoes = defaultdict(int)
+        # Conexão só para PRAGMA data_version, fora do pool e da instrumentação
+        self._sentinela = None
+        self._versao_dados = None
+        self._lock_sentinela = threading.Lock()
+
+    def _nova_conexao(self):
+        conn = sqlite3.connect(
+            self.caminho,
+            timeout=TIMEOUT_LOCK,
+            isolation_level=None,  # transações explícitas via transacao()
+            check_same_thread=False,  # a conexão circula entre threads pelo pool
+            cached_statements=STATEMENTS_EM_CACHE,
+            factory=ConexaoMedida,
+        )
+        conn.row_factory = sqlite3.Row
+        for nome, valor in PRAGMAS.items():
+            conn.execute(f"PRAGMA {nome} = {valor}")
+        if RASTREADORES_SQL:
+            conn.set_trace_callback(_rastrear)
+        return conn
+
+    def _emprestar(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._criadas < self.tamanho_pool:
+                self._criadas += 1
+                criar = True
+            else:
+                criar = False
+
+        if criar:
+            try:
+                return self._nova_conexao()
+            except Exception:
+                with self._lock:
+                    self._criadas -= 1
+                raise
+
+        try:
+            return self._livres.get(timeout=TIMEOUT_POOL)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Nenhuma conexão livre no pool do banco.")
+
+    def _devolver(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._livres.put(conn)
+
+    @contextmanager
+    def conexao(self, anexos=None):
+        """Empresta uma conexão do pool para leituras.
+
+        ``anexos`` ({nome: caminho}) são bancos anexados com ATTACH durante o
+        bloco e desanexados antes de a conexão voltar ao pool.
+        """
+        conn = self._emprestar()
+        try:
+            _anexar(conn, anexos)
+            yield conn
+        finally:
+            _desanexar(conn, anexos)
+            self._devolver(conn)
+
+    @contextmanager
+    def transacao(self, *tabelas, anexos=None):
+        """Executa o bloco em uma transação: COMMIT no fim, ROLLBACK em erro.
+
+        ``tabelas`` são as tabelas escritas; o cache delas é invalidado no COMMIT.
+        Com o banco principal em WAL, o COMMIT não é atômico entre ele e os
+        ``anexos``: cada arquivo é gravado por inteiro ou não, separadamente.
+        """
+        conn = self._emprestar()
+        try:
+            _anexar(conn, anexos)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                geracoes = _registrar_alteracoes(conn, tabelas)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            self._atualizar_geracoes(geracoes)
+        finally:
+            _desanexar(conn, anexos)
+            self._devolver(conn)
+
+    # ---------------------- cache de consultas ----------------------
+
+    def geracao(self, tabela):
+        self.sincronizar()
+        with self._lock:
+            return self._geracoes[tabela]
+
+    def invalidar(self, *tabelas):
+        """Incrementa a geração das tabelas, tornando obsoleto o cache delas em todos os processos."""
+        with self.transacao(*tabelas):
+            pass
+
+    def _atualizar_geracoes(self, geracoes):
+        with self._lock:
+            for tabela, geracao in geracoes:
+                # Commits de threads diferentes podem chegar fora de ordem
+                self._geracoes[tabela] = max(self._geracoes[tabela], geracao)
+
+    def sincronizar(self):
+        """Relê as gerações se outra conexão (de qualquer processo) fez COMMIT.
+
+        Custa um ``PRAGMA data_version`` quando nada mudou.
+        """
+        with self._lock_sentinela:
+            if self._sentinela is None:
+                self._sentinela = sqlite3.connect(
+                    self.caminho, timeout=TIMEOUT_LOCK, isolation_level=None, check_same_thread=False)
+            versao = self._sentinela.execute("PRAGMA data_version").fetchone()[0]
+            if versao == self._versao_dados:
+                return
+            try:
+                geracoes = self._sentinela.execute("SELECT tabela, geracao FROM alteracoes").fetchall()
+            except sqlite3.OperationalError:
+                return  # banco ainda não migrado: tenta de novo na próxima chamada
+            self._versao_dados = versao
+        self._atualizar_geracoes(geracoes)
+
+    def consultar(self, sql, parametros=(), tabelas=(), um=False):
+        """Executa um SELECT usando o cache quando ``tabelas`` é informado.
+
+        ``tabelas`` lista todas as tabelas lidas pela consulta; sem ela o
+        resultado não é guardado. Com ``um=True`` retorna só a primeira linha.
+        """
+        chave = None
+        if tabelas:
+            self.sincronizar()
+            with self._lock:
+                geracoes = tuple(self._geracoes[tabela] for tabela in tabelas)
+            chave = (sql, tuple(parametros), um, tuple(tabelas), geracoes)
+            encontrado, valor = self.cache.obter(chave)
+            if encontrado:
+                return valor
+
+        with self.conexao() as conn:
+            cursor = conn.execute(sql, parametros)
+            valor = cursor.fetchone() if um else cursor.fetchall()
+
+        if chave is not None:
+            self.cache.guardar(chave, valor)
+        return valor
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._criadas = 0
+        with self._lock_sentinela:
+            if self._sentinela is not None:
+                self._sentinela.close()
+                self._sentinela = None
+                self._versao_dados = None
+
+
+def _anexar(conn, anexos):
+    for nome, caminho in (anexos or {}).items():
+        if not nome.isidentifier():
+            raise ValueError(f"Nome de banco anexado inválido: {nome!r}")
+        conn.execute(f"ATTACH DATABASE ? AS {nome}", (caminho,))
+
+
+def _desanexar(conn, anexos):
+    if not anexos:
+        return
+    if conn.in_transaction:
+        conn.rollback()
+    for nome in anexos:
+        try:
+            conn.execute(f"DETACH DATABASE {nome}")
+        except sqlite3.OperationalError:
+            pass  # não chegou a ser anexado
+
+
+# Segundos desde 1970 (UTC), com fração, em SQL
+AGORA_UNIX = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+def _registrar_alteracoes(conn, tabelas):
+    """Incrementa, na transação de ``conn``, a geração das tabelas escritas.
+
+    Retorna as novas gerações [(tabela, geração)]. Antes da migração 12 a
+    tabela ``alteracoes`` não existe e as próprias migrações não declaram
+    tabelas, então nada é registrado.
+    """
+    tabelas = list(dict.fromkeys(tabelas))
+    if not tabelas:
+        return []
+    return conn.execute(f"""
+        INSERT INTO alteracoes (tabela, geracao, alterada_em)
+        VALUES {", ".join(f"(?, 1, {AGORA_UNIX})" for _ in tabelas)}
+        ON CONFLICT (tabela) DO UPDATE SET geracao = geracao + 1, alterada_em = excluded.alterada_em
+        RETURNING tabela, geracao
+    """, tabelas).fetchall()
+
+
+# ========================== ESCRITA EM LOTE ==========================
+
+class EscritorLote:
+    """Thread única que grava pedidos de escrita em lote (group commit).
+
+    Cada pedido é uma função f(conn) executada em um SAVEPOINT próprio dentro
+    de uma transação compartilhada: um pedido com erro não derruba os outros
+    e o lote inteiro custa um só COMMIT. ``enviar`` devolve um Future que
+    recebe o retorno da função depois do COMMIT.
+
+    Pedidos com a mesma ``chave`` ainda na fila são mesclados: o segundo
+    recebe o mesmo Future do primeiro e não é executado. Depois que o lote
+    sai da fila, a chave fica livre e um pedido novo é gravado de novo.
+    """
+
+    def __init__(self, banco, lote=LOTE_ESCRITA, espera=ESPERA_LOTE):
+        self.banco = banco
+        self.lote = lote
+        self.espera = espera
+        self._fila = queue.Queue()
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._executar, name="escritor-lote", daemon=True)
+        self._thread.start()
+
+    def enviar(self, funcao, tabelas, chave=None):
+        """Enfileira f(conn), que escreve em ``tabelas``; retorna um Future."""
+        with self._lock:
+            if chave is not None and chave in self._pendentes:
+                return self._pendentes[chave]
+            futuro = Future()
+            if chave is not None:
+                self._pendentes[chave] = futuro
+        self._fila.put((funcao, tuple(tabelas), chave, futuro))
+        return futuro
+
+    def fechar(self):
+        """Grava o que já está na fila e encerra a thread."""
+        self._fila.put(None)
+        self._thread.join()
+
+    def _proximo_lote(self):
+        primeiro = self._fila.get()
+        if primeiro is None:
+            return None
+        pedidos = [primeiro]
+        limite = time.monotonic() + self.espera
+        while len(pedidos) < self.lote:
+            restante = limite - time.monotonic()
+            try:
+                pedido = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if pedido is None:
+                self._fila.put(None)  # encerra depois de gravar este lote
+                break
+            pedidos.append(pedido)
+        return pedidos
+
+    def _executar(self):
+        while True:
+            pedidos = self._proximo_lote()
+            if pedidos is None:
+                return
+            # Antes de gravar: um pedido com a mesma chave que chegue agora
+            # vai para o próximo lote, em vez de receber um Future já resolvido
+            with self._lock:
+                for _, _, chave, futuro in pedidos:
+                    if chave is not None and self._pendentes.get(chave) is futuro:
+                        del self._pendentes[chave]
+            self._gravar(pedidos)
+
+    def _gravar(self, pedidos):
+        tabelas = {tabela for _, tabelas_pedido, _, _ in pedidos for tabela in tabelas_pedido}
+        resultados = []
+        try:
+            with self.banco.transacao(*tabelas) as conn:
+                for funcao, _, _, futuro in pedidos:
+                    if not futuro.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT pedido")
+                    try:
+                        resultados.append((futuro, funcao(conn)))
+                    except Exception as erro:
+                        conn.execute("ROLLBACK TO pedido")
+                        futuro.set_exception(erro)
+                    conn.execute("RELEASE pedido")
+        except Exception as erro:
+            # COMMIT (ou BEGIN) falhou: nada do lote foi gravado
+            for _, _, _, futuro in pedidos:
+                if not futuro.done():
+                    futuro.set_exception(erro)
+            return
+        for futuro, resultado in resultados:
+            futuro.set_result(resultado)
+
+
+# ========================== MIGRAÇÕES ==========================
+
+def coluna_existe(conn, nome_tabela, nome_coluna):
+    if not nome_tabela.isidentifier():
+        raise ValueError("Nome de tabela inválido.")
+
+    # table_xinfo também lista as colunas geradas; PRAGMA não aceita `?`
+    cursor = conn.execute(f"PRAGMA table_xinfo({nome_tabela})")
+    colunas = [row["name"] for row in cursor.fetchall()]
+    return nome_coluna in colunas
+
+
+def executar_script(conn, script):
+    """Executa vários comandos SQL dentro da transação corrente.
+
+    Diferente de ``executescript``, não faz COMMIT antes de começar, então a
+    migração continua atômica.
+    """
+    comando = ""
+    for linha in script.splitlines(keepends=True):
+        comando += linha
+        if sqlite3.complete_statement(comando):
+            conn.execute(comando)
+            comando = ""
+    if comando.strip():
+        conn.execute(comando)
+
+
+def _migracao_esquema_inicial(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            idade INTEGER,
+            telefone TEXT NOT NULL,
+            endereco TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            senha TEXT NOT NULL,
+            is_admin INTEGER NOT NULL DEFAULT 0
+        );
+    ''')
+
+    if not coluna_existe(conn, "users", "foto_perfil"):
+        conn.execute("ALTER TABLE users ADD COLUMN foto_perfil TEXT DEFAULT '';")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hortas (
+            horta_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_horta TEXT NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            foto TEXT NOT NULL,
+            especie TEXT NOT NULL,
+            dias_colheita INTEGER NOT NULL,
+            contato TEXT NOT NULL,
+            endereco TEXT NOT NULL,
+            email TEXT NOT NULL,
+            FOREIGN KEY (usuario_id) REFERENCES users(user_id)
+        );
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feed_hortas (
+            feed_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            horta_id INTEGER NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            foto TEXT NOT NULL,
+            descricao TEXT,
+            data_postagem DATETIME NOT NULL,
+            FOREIGN KEY (horta_id) REFERENCES hortas(horta_id),
+            FOREIGN KEY (usuario_id) REFERENCES users(user_id)
+        );
+    ''')
+
+
+def _migracao_indices_feed(conn):
+    # O feed é paginado por (data_postagem, feed_id) e o índice cobre todas
+    # as colunas lidas de feed_hortas, evitando acesso à tabela.
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_feed_data_postagem
+        ON feed_hortas (data_postagem, feed_id, horta_id, usuario_id, foto, descricao);
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_hortas_usuario ON hortas (usuario_id);")
+
+
+def _migracao_busca_hortas(conn):
+    # Índice FTS5 externo (content=hortas): guarda só o índice invertido.
+    # remove_diacritics faz "álface" e "alface" casarem; prefix acelera buscas
+    # por prefixo de 2 e 3 letras.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS hortas_fts USING fts5(
+            nome_horta, especie, endereco, contato,
+            content='hortas', content_rowid='horta_id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        );
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS hortas_fts_insert AFTER INSERT ON hortas BEGIN
+            INSERT INTO hortas_fts (rowid, nome_horta, especie, endereco, contato)
+            VALUES (new.horta_id, new.nome_horta, new.especie, new.endereco, new.contato);
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS hortas_fts_delete AFTER DELETE ON hortas BEGIN
+            INSERT INTO hortas_fts (hortas_fts, rowid, nome_horta, especie, endereco, contato)
+            VALUES ('delete', old.horta_id, old.nome_horta, old.especie, old.endereco, old.contato);
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS hortas_fts_update
+        AFTER UPDATE OF nome_horta, especie, endereco, contato ON hortas BEGIN
+            INSERT INTO hortas_fts (hortas_fts, rowid, nome_horta, especie, endereco, contato)
+            VALUES ('delete', old.horta_id, old.nome_horta, old.especie, old.endereco, old.contato);
+            INSERT INTO hortas_fts (rowid, nome_horta, especie, endereco, contato)
+            VALUES (new.horta_id, new.nome_horta, new.especie, new.endereco, new.contato);
+        END;
+    ''')
+    # Indexa as hortas que já existiam
+    conn.execute("INSERT INTO hortas_fts (hortas_fts) VALUES ('rebuild');")
+
+
+def _migracao_localizacao_hortas(conn):
+    from geo import geocodificar_pendentes
+
+    for coluna in ("latitude", "longitude"):
+        if not coluna_existe(conn, "hortas", coluna):
+            conn.execute(f"ALTER TABLE hortas ADD COLUMN {coluna} REAL;")
+
+    # R*Tree com um ponto por horta (caixa de tamanho zero)
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS hortas_geo USING rtree(
+            horta_id, min_lat, max_lat, min_lon, max_lon
+        );
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS hortas_geo_insert AFTER INSERT ON hortas
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+            INSERT INTO hortas_geo VALUES (new.horta_id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS hortas_geo_update AFTER UPDATE OF latitude, longitude ON hortas BEGIN
+            DELETE FROM hortas_geo WHERE horta_id = old.horta_id;
+            INSERT INTO hortas_geo
+            SELECT new.horta_id, new.latitude, new.latitude, new.longitude, new.longitude
+            WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS hortas_geo_delete AFTER DELETE ON hortas BEGIN
+            DELETE FROM hortas_geo WHERE horta_id = old.horta_id;
+        END;
+    ''')
+
+    # Hortas antigas recebem o centróide da cidade/CEP do endereço, se houver
+    geocodificar_pendentes(conn)
+
+
+def _migracao_resumos(conn):
+    # Tabelas de resumo para o painel de análises, mantidas por triggers a
+    # cada escrita em hortas/feed_hortas. Espécies são agrupadas sem
+    # diferenciar maiúsculas e espaços nas pontas.
+    executar_script(conn, '''
+        CREATE TABLE IF NOT EXISTS resumo_especies (
+            especie TEXT PRIMARY KEY,
+            hortas INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS resumo_dias_colheita (
+            dias_colheita INTEGER PRIMARY KEY,
+            hortas INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS resumo_postagens_dia (
+            dia TEXT PRIMARY KEY,
+            postagens INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS resumo_produtores_dia (
+            dia TEXT NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            PRIMARY KEY (dia, usuario_id)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS resumo_hortas_insert AFTER INSERT ON hortas BEGIN
+            INSERT INTO resumo_especies (especie, hortas) VALUES (lower(trim(new.especie)), 1)
+            ON CONFLICT (especie) DO UPDATE SET hortas = hortas + 1;
+            INSERT INTO resumo_dias_colheita (dias_colheita, hortas) VALUES (new.dias_colheita, 1)
+            ON CONFLICT (dias_colheita) DO UPDATE SET hortas = hortas + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumo_hortas_delete AFTER DELETE ON hortas BEGIN
+            UPDATE resumo_especies SET hortas = hortas - 1 WHERE especie = lower(trim(old.especie));
+            UPDATE resumo_dias_colheita SET hortas = hortas - 1 WHERE dias_colheita = old.dias_colheita;
+            DELETE FROM resumo_especies WHERE hortas <= 0;
+            DELETE FROM resumo_dias_colheita WHERE hortas <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumo_hortas_update AFTER UPDATE OF especie, dias_colheita ON hortas BEGIN
+            UPDATE resumo_especies SET hortas = hortas - 1 WHERE especie = lower(trim(old.especie));
+            UPDATE resumo_dias_colheita SET hortas = hortas - 1 WHERE dias_colheita = old.dias_colheita;
+            INSERT INTO resumo_especies (especie, hortas) VALUES (lower(trim(new.especie)), 1)
+            ON CONFLICT (especie) DO UPDATE SET hortas = hortas + 1;
+            INSERT INTO resumo_dias_colheita (dias_colheita, hortas) VALUES (new.dias_colheita, 1)
+            ON CONFLICT (dias_colheita) DO UPDATE SET hortas = hortas + 1;
+            DELETE FROM resumo_especies WHERE hortas <= 0;
+            DELETE FROM resumo_dias_colheita WHERE hortas <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumo_feed_insert AFTER INSERT ON feed_hortas BEGIN
+            INSERT INTO resumo_postagens_dia (dia, postagens) VALUES (date(new.data_postagem), 1)
+            ON CONFLICT (dia) DO UPDATE SET postagens = postagens + 1;
+            INSERT OR IGNORE INTO resumo_produtores_dia (dia, usuario_id)
+            VALUES (date(new.data_postagem), new.usuario_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumo_feed_delete AFTER DELETE ON feed_hortas BEGIN
+            UPDATE resumo_postagens_dia SET postagens = postagens - 1 WHERE dia = date(old.data_postagem);
+            DELETE FROM resumo_postagens_dia WHERE postagens <= 0;
+        END;
+    ''')
+    reconstruir_resumos(conn)
+
+
+def reconstruir_resumos(conn):
+    """Recalcula as tabelas de resumo do zero (reparo após cargas externas).
+
+    Só enxerga feed_hortas: postagens já arquivadas deixam de ser contadas.
+    """
+    executar_script(conn, '''
+        DELETE FROM resumo_especies;
+        DELETE FROM resumo_dias_colheita;
+        DELETE FROM resumo_postagens_dia;
+        DELETE FROM resumo_produtores_dia;
+
+        INSERT INTO resumo_especies (especie, hortas)
+        SELECT lower(trim(especie)), count(*) FROM hortas GROUP BY lower(trim(especie));
+        INSERT INTO resumo_dias_colheita (dias_colheita, hortas)
+        SELECT dias_colheita, count(*) FROM hortas GROUP BY dias_colheita;
+        INSERT INTO resumo_postagens_dia (dia, postagens)
+        SELECT date(data_postagem), count(*) FROM feed_hortas GROUP BY date(data_postagem);
+        INSERT OR IGNORE INTO resumo_produtores_dia (dia, usuario_id)
+        SELECT DISTINCT date(data_postagem), usuario_id FROM feed_hortas;
+    ''')
+
+
+def _migracao_imagens(conn):
+    # Metadados gravados no upload: as telas escolhem o derivado e leem os
+    # bytes sem consultar o disco. ``caminho`` usa "/" como separador;
+    # ``status`` é mantido pela verificação periódica (midia.verificar_imagens).
+    executar_script(conn, '''
+        CREATE TABLE IF NOT EXISTS imagens (
+            caminho TEXT PRIMARY KEY,
+            original TEXT NOT NULL,
+            tamanho TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            largura INTEGER,
+            altura INTEGER,
+            mtime REAL,
+            sha256 TEXT,
+            status TEXT NOT NULL DEFAULT 'ok',
+            verificado_em TEXT
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_imagens_original ON imagens(original);
+        CREATE INDEX IF NOT EXISTS idx_imagens_problemas ON imagens(status) WHERE status <> 'ok';
+    ''')
+
+
+# Colunas que citam arquivos de imagem, contadas em referencias_imagens
+COLUNAS_COM_FOTO = [("users", "foto_perfil"), ("hortas", "foto"), ("feed_hortas", "foto")]
+
+
+def _migracao_referencias_imagens(conn):
+    # Quantas linhas citam cada foto (caminho com "/"), mantido por triggers.
+    # O coletor de lixo (midia.coletar_lixo) apaga as que chegam a zero.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS referencias_imagens (
+            original TEXT PRIMARY KEY,
+            referencias INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for tabela, coluna in COLUNAS_COM_FOTO:
+        executar_script(conn, f'''
+            CREATE TRIGGER IF NOT EXISTS ref_{tabela}_insert AFTER INSERT ON {tabela}
+            WHEN coalesce(new.{coluna}, '') <> '' BEGIN
+                INSERT INTO referencias_imagens (original, referencias) VALUES (replace(new.{coluna}, '\\', '/'), 1)
+                ON CONFLICT (original) DO UPDATE SET referencias = referencias + 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS ref_{tabela}_delete AFTER DELETE ON {tabela}
+            WHEN coalesce(old.{coluna}, '') <> '' BEGIN
+                UPDATE referencias_imagens SET referencias = referencias - 1
+                WHERE original = replace(old.{coluna}, '\\', '/');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS ref_{tabela}_update AFTER UPDATE OF {coluna} ON {tabela}
+            WHEN old.{coluna} IS NOT new.{coluna} BEGIN
+                UPDATE referencias_imagens SET referencias = referencias - 1
+                WHERE original = replace(old.{coluna}, '\\', '/');
+                INSERT INTO referencias_imagens (original, referencias)
+                SELECT replace(new.{coluna}, '\\', '/'), 1 WHERE coalesce(new.{coluna}, '') <> ''
+                ON CONFLICT (original) DO UPDATE SET referencias = referencias + 1;
+            END;
+        ''')
+    reconstruir_referencias(conn)
+
+
+def reconstruir_referencias(conn):
+    """Recalcula referencias_imagens do zero (reparo após cargas externas)."""
+    citacoes = " UNION ALL ".join(f"SELECT {coluna} AS foto FROM {tabela}" for tabela, coluna in COLUNAS_COM_FOTO)
+    conn.execute("DELETE FROM referencias_imagens")
+    conn.execute(f'''
+        INSERT INTO referencias_imagens (original, referencias)
+        SELECT replace(foto, '\\', '/'), count(*) FROM ({citacoes})
+        WHERE coalesce(foto, '') <> '' GROUP BY 1
+    ''')
+
+
+# Colunas de um card do feed, na ordem da tabela feed_cards
+SELECT_FEED_CARDS = '''
+    SELECT feed_hortas.feed_id, feed_hortas.data_postagem, feed_hortas.horta_id, feed_hortas.usuario_id,
+           feed_hortas.foto, feed_hortas.descricao, users.nome, hortas.nome_horta, hortas.especie
+    FROM feed_hortas
+    JOIN users ON users.user_id = feed_hortas.usuario_id
+    JOIN hortas ON hortas.horta_id = feed_hortas.horta_id
+'''
+# Só hortas ativas aparecem no feed (migração 11)
+SELECT_FEED_CARDS_ATIVAS = SELECT_FEED_CARDS + "    WHERE hortas.ativa = 1\n"
+
+
+def _migracao_feed_cards(conn):
+    # Projeção do feed com tudo o que o card mostra, sem JOIN na leitura.
+    # A chave (data_postagem, feed_id) deixa as linhas na ordem da paginação:
+    # cada página é uma única varredura de intervalo na própria tabela.
+    executar_script(conn, f'''
+        CREATE TABLE IF NOT EXISTS feed_cards (
+            feed_id INTEGER NOT NULL,
+            data_postagem DATETIME NOT NULL,
+            horta_id INTEGER NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            foto TEXT NOT NULL,
+            descricao TEXT,
+            nome TEXT NOT NULL,
+            nome_horta TEXT NOT NULL,
+            especie TEXT NOT NULL,
+            PRIMARY KEY (data_postagem, feed_id)
+        ) WITHOUT ROWID;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_feed_cards_id ON feed_cards (feed_id);
+        CREATE INDEX IF NOT EXISTS idx_feed_cards_horta ON feed_cards (horta_id);
+        CREATE INDEX IF NOT EXISTS idx_feed_cards_usuario ON feed_cards (usuario_id);
+
+        -- Para os triggers de hortas/users acharem as postagens de cada uma
+        CREATE INDEX IF NOT EXISTS idx_feed_horta ON feed_hortas (horta_id);
+        CREATE INDEX IF NOT EXISTS idx_feed_usuario ON feed_hortas (usuario_id);
+        -- O feed agora lê feed_cards; o índice coberto só encarecia as escritas
+        DROP INDEX IF EXISTS idx_feed_data_postagem;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_feed_insert AFTER INSERT ON feed_hortas BEGIN
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS} WHERE feed_hortas.feed_id = new.feed_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_feed_update AFTER UPDATE ON feed_hortas BEGIN
+            DELETE FROM feed_cards WHERE feed_id = old.feed_id;
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS} WHERE feed_hortas.feed_id = new.feed_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_feed_delete AFTER DELETE ON feed_hortas BEGIN
+            DELETE FROM feed_cards WHERE feed_id = old.feed_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_users_update AFTER UPDATE OF nome ON users BEGIN
+            UPDATE feed_cards SET nome = new.nome WHERE usuario_id = new.user_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_users_insert AFTER INSERT ON users BEGIN
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS} WHERE feed_hortas.usuario_id = new.user_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_users_delete AFTER DELETE ON users BEGIN
+            DELETE FROM feed_cards WHERE usuario_id = old.user_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_hortas_update AFTER UPDATE OF nome_horta, especie ON hortas BEGIN
+            UPDATE feed_cards SET nome_horta = new.nome_horta, especie = new.especie WHERE horta_id = new.horta_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_hortas_insert AFTER INSERT ON hortas BEGIN
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS} WHERE feed_hortas.horta_id = new.horta_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_hortas_delete AFTER DELETE ON hortas BEGIN
+            DELETE FROM feed_cards WHERE horta_id = old.horta_id;
+        END;
+    ''')
+    # Não usa reconstruir_feed: ela depende de hortas.ativa (migração 11)
+    conn.execute(f"INSERT INTO feed_cards {SELECT_FEED_CARDS}")
+
+
+def reconstruir_feed(conn):
+    """Refaz feed_cards a partir de feed_hortas, users e hortas (reparo após cargas externas)."""
+    conn.execute("DELETE FROM feed_cards")
+    conn.execute(f"INSERT INTO feed_cards {SELECT_FEED_CARDS_ATIVAS}")
+
+
+def _migracao_colheita(conn):
+    # Data de plantio informada pelo produtor; a data prevista de colheita é
+    # uma coluna gerada (plantio + dias_colheita) com índice, para o
+    # calendário buscar "colheitas entre D1 e D2" por intervalo no índice.
+    # Hortas antigas ficam sem data até o produtor informar o plantio.
+    if not coluna_existe(conn, "hortas", "data_plantio"):
+        conn.execute("ALTER TABLE hortas ADD COLUMN data_plantio DATE")
+    if not coluna_existe(conn, "hortas", "data_colheita"):
+        conn.execute("""
+            ALTER TABLE hortas ADD COLUMN data_colheita DATE
+            GENERATED ALWAYS AS (date(data_plantio, '+' || dias_colheita || ' days')) VIRTUAL
+        """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_hortas_colheita
+        ON hortas (data_colheita, especie) WHERE data_colheita IS NOT NULL
+    """)
+
+
+def _migracao_demandas(conn):
+    # Demandas dos compradores e as hortas que atendem cada uma, com a
+    # pontuação calculada em demandas.py. A espécie é o índice invertido dos
+    # dois lados: demandas.especie já é gravada normalizada e hortas ganha um
+    # índice na mesma expressão usada pelos resumos.
+    executar_script(conn, '''
+        CREATE TABLE IF NOT EXISTS demandas (
+            demanda_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            especie TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            unidade TEXT NOT NULL,
+            data_inicio DATE NOT NULL,
+            data_fim DATE NOT NULL,
+            endereco TEXT,
+            latitude REAL,
+            longitude REAL,
+            raio_km REAL NOT NULL,
+            criada_em DATETIME NOT NULL,
+            FOREIGN KEY (usuario_id) REFERENCES users(user_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_demandas_especie ON demandas (especie, data_fim);
+        CREATE INDEX IF NOT EXISTS idx_demandas_usuario ON demandas (usuario_id);
+        CREATE INDEX IF NOT EXISTS idx_hortas_especie ON hortas (lower(trim(especie)));
+
+        CREATE TABLE IF NOT EXISTS correspondencias (
+            demanda_id INTEGER NOT NULL,
+            horta_id INTEGER NOT NULL,
+            pontuacao REAL NOT NULL,
+            distancia_km REAL,
+            PRIMARY KEY (demanda_id, horta_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_correspondencias_horta ON correspondencias (horta_id);
+
+        CREATE TRIGGER IF NOT EXISTS correspondencias_hortas_delete AFTER DELETE ON hortas BEGIN
+            DELETE FROM correspondencias WHERE horta_id = old.horta_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS correspondencias_demandas_delete AFTER DELETE ON demandas BEGIN
+            DELETE FROM correspondencias WHERE demanda_id = old.demanda_id;
+        END;
+    ''')
+
+
+def _migracao_hortas_ativas(conn):
+    # A moderação pode desativar hortas: elas somem do feed, da busca, do
+    # mapa, do calendário e das correspondências, mas continuam no banco.
+    # Os triggers que inserem em feed_cards passam a ignorar hortas inativas.
+    if not coluna_existe(conn, "hortas", "ativa"):
+        conn.execute("ALTER TABLE hortas ADD COLUMN ativa INTEGER NOT NULL DEFAULT 1")
+    executar_script(conn, f'''
+        DROP TRIGGER IF EXISTS feed_cards_feed_insert;
+        DROP TRIGGER IF EXISTS feed_cards_feed_update;
+        DROP TRIGGER IF EXISTS feed_cards_users_insert;
+        DROP TRIGGER IF EXISTS feed_cards_hortas_insert;
+
+        CREATE TRIGGER feed_cards_feed_insert AFTER INSERT ON feed_hortas BEGIN
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS_ATIVAS} AND feed_hortas.feed_id = new.feed_id;
+        END;
+
+        CREATE TRIGGER feed_cards_feed_update AFTER UPDATE ON feed_hortas BEGIN
+            DELETE FROM feed_cards WHERE feed_id = old.feed_id;
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS_ATIVAS} AND feed_hortas.feed_id = new.feed_id;
+        END;
+
+        CREATE TRIGGER feed_cards_users_insert AFTER INSERT ON users BEGIN
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS_ATIVAS} AND feed_hortas.usuario_id = new.user_id;
+        END;
+
+        CREATE TRIGGER feed_cards_hortas_insert AFTER INSERT ON hortas BEGIN
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS_ATIVAS} AND feed_hortas.horta_id = new.horta_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS feed_cards_hortas_ativa AFTER UPDATE OF ativa ON hortas BEGIN
+            DELETE FROM feed_cards WHERE horta_id = new.horta_id;
+            INSERT OR REPLACE INTO feed_cards {SELECT_FEED_CARDS_ATIVAS} AND feed_hortas.horta_id = new.horta_id;
+        END;
+    ''')
+    reconstruir_feed(conn)
+
+
+def _migracao_alteracoes(conn):
+    # Geração de cada tabela, incrementada na transação que a escreve; é o
+    # que mantém coerentes os caches de vários processos no mesmo banco
+    executar_script(conn, '''
+        CREATE TABLE IF NOT EXISTS alteracoes (
+            tabela TEXT PRIMARY KEY,
+            geracao INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    ''')
+
+
+def _migracao_arquivamento(conn):
+    # O arquivamento (arquivamento.py) tira postagens antigas de feed_hortas,
+    # mas elas continuam contando nas análises: enquanto a transação dele
+    # apaga, há uma linha em arquivamento_em_curso e o resumo não é baixado.
+    executar_script(conn, '''
+        CREATE TABLE IF NOT EXISTS arquivamento_em_curso (ativo INTEGER PRIMARY KEY);
+
+        DROP TRIGGER IF EXISTS resumo_feed_delete;
+        CREATE TRIGGER resumo_feed_delete AFTER DELETE ON feed_hortas
+        WHEN NOT EXISTS (SELECT 1 FROM arquivamento_em_curso) BEGIN
+            UPDATE resumo_postagens_dia SET postagens = postagens - 1 WHERE dia = date(old.data_postagem);
+            DELETE FROM resumo_postagens_dia WHERE postagens <= 0;
+        END;
+    ''')
+
+
+def _migracao_alteracoes_horario(conn):
+    # Quando cada tabela mudou pela última vez (segundos desde 1970, UTC):
+    # o Last-Modified da API (api.py) vem daqui
+    if not coluna_existe(conn, "alteracoes", "alterada_em"):
+        conn.execute("ALTER TABLE alteracoes ADD COLUMN alterada_em REAL")
+
+
+# (versão, descrição, função). Nunca altere uma migração já publicada:
+# acrescente uma nova com o próximo número.
+MIGRACOES = [
+    (1, "esquema inicial (users, hortas, feed_hortas)", _migracao_esquema_inicial),
+    (2, "índices do feed e das hortas por usuário", _migracao_indices_feed),
+    (3, "busca textual de hortas (FTS5)", _migracao_busca_hortas),
+    (4, "latitude/longitude das hortas e índice R*Tree", _migracao_localizacao_hortas),
+    (5, "tabelas de resumo para o painel de análises", _migracao_resumos),
+    (6, "metadados das imagens enviadas", _migracao_imagens),
+    (7, "contagem de referências das imagens", _migracao_referencias_imagens),
+    (8, "projeção do feed (feed_cards) mantida por triggers", _migracao_feed_cards),
+    (9, "data de plantio e data prevista de colheita das hortas", _migracao_colheita),
+    (10, "demandas dos compradores e correspondências com hortas", _migracao_demandas),
+    (11, "hortas desativadas pela moderação", _migracao_hortas_ativas),
+    (12, "gerações das tabelas, para o cache entre processos", _migracao_alteracoes),
+    (13, "postagens arquivadas continuam nos resumos", _migracao_arquivamento),
+    (14, "horário da última alteração de cada tabela", _migracao_alteracoes_horario),
+]
+
+
+@contextmanager
+def trava_arquivo(caminho, timeout=TIMEOUT_MIGRACAO):
+    """Lock exclusivo entre processos, liberado pelo SO se o processo morrer."""
+    with open(caminho, "a+") as f:
+        limite = time.monotonic() + timeout
+        while True:
+            try:
+                if os.name == "nt":
+                    import msvcrt
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() > limite:
+                    raise TimeoutError(f"Não foi possível obter o lock {caminho}.")
+                time.sleep(0.1)
+
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def versao_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrar(banco):
+    """Aplica as migrações pendentes e retorna a versão final do esquema."""
+    with banco.conexao() as conn:
+        versao = versao_esquema(conn)
+    if versao >= MIGRACOES[-1][0]:
+        return versao
+
+    with trava_arquivo(f"{banco.caminho}.lock"):
+        # Outro processo pode ter migrado enquanto esperávamos o lock
+        with banco.conexao() as conn:
+            versao = versao_esquema(conn)
+
+        for numero, descricao, aplicar in MIGRACOES:
+            if numero <= versao:
+                continue
+            with banco.transacao() as conn:
+                aplicar(conn)
+                conn.execute(f"PRAGMA user_version = {numero}")
+            versao = numero
+
+    # O esquema mudou: nada do que estiver em cache continua confiável
+    banco.cache.limpar()
+    return versao
+
+
+# Tabelas derivadas que podem ser refeitas do zero: nome -> (função, tabelas de origem)
+RECONSTRUCOES = {
+    "feed": (reconstruir_feed, ("feed_hortas", "users", "hortas")),
+    "resumos": (reconstruir_resumos, ("hortas", "feed_hortas")),
+    "referencias": (reconstruir_referencias, ("users", "hortas", "feed_hortas")),
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "reconstruir" and sys.argv[2] in RECONSTRUCOES:
+        banco = GerenciadorBanco(sys.argv[3] if len(sys.argv) > 3 else DATABASE)
+        migrar(banco)
+        reconstruir, tabelas = RECONSTRUCOES[sys.argv[2]]
+        with banco.transacao(*tabelas) as conn:
+            reconstruir(conn)
+        print(f"{sys.argv[2]} reconstruído.")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "migrar":
+        banco = GerenciadorBanco(sys.argv[2] if len(sys.argv) > 2 else DATABASE)
+        print(f"Esquema na versão {migrar(banco)}.")
+    else:
+        print("uso: python banco.py migrar [caminho_do_banco]")
+        print(f"     python banco.py reconstruir {'|'.join(RECONSTRUCOES)} [caminho_do_banco]")
+        sys.exit(1)
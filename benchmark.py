@@ -0,0 +1,369 @@
+"""Benchmark das páginas do app com dados sintéticos.
+
+Cria um banco temporário (ou uma cópia de um banco existente), povoa com os
+volumes pedidos e imagens sintéticas e executa as páginas sem navegador pelo
+``AppTest`` do Streamlit. Para cada página mede o tempo de renderização, o
+tempo de SQL, as linhas lidas e os bytes enviados ao navegador (elementos +
+arquivos de mídia), e grava p50/p95 em JSON para comparar entre commits:
+
+    python benchmark.py --usuarios 100000 --hortas 500000 --feed 5000000
+    python benchmark.py --banco database.db --repeticoes 20
+    python benchmark.py --comparar bench_resultados/anterior.json
+
+O database.db do repositório nunca é alterado: com ``--banco`` o arquivo é
+copiado para o diretório temporário antes de rodar.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import banco
+from banco import GerenciadorBanco, migrar
+from desempenho import percentil
+from geo import carregar_centroides
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_APP = os.path.join(DIRETORIO_APP, "app.py")
+PASTA_RESULTADOS = os.path.join(DIRETORIO_APP, "bench_resultados")
+
+SENHA_SINTETICA = "senha-benchmark"
+ADMIN = ("ADM@123", "123456")
+ESPECIES = ["Alface", "Tomate", "Cenoura", "Couve", "Rúcula", "Cebolinha", "Salsa",
+            "Manjericão", "Pimentão", "Abobrinha", "Beterraba", "Morango"]
+TAMANHO_LOTE = 10000
+PAGINAS = ["login", "tela_usuario", "feed_hortas", "cadastrar_horta", "painel_administrador"]
+
+
+# ========================== DADOS SINTÉTICOS ==========================
+
+def _em_lotes(linhas, tamanho=TAMANHO_LOTE):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def gerar_imagens(quantidade, pasta="uploads"):
+    """Fotos sintéticas (gradiente + ruído) gravadas com os derivados do midia."""
+    from PIL import Image
+
+    from midia import salvar_conteudo
+
+    caminhos = []
+    for _ in range(quantidade):
+        cor = tuple(random.randrange(256) for _ in range(3))
+        imagem = Image.linear_gradient("L").resize((1600, 1200)).convert("RGB")
+        imagem = Image.blend(imagem, Image.new("RGB", imagem.size, cor), 0.5)
+        imagem = Image.blend(imagem, Image.effect_noise(imagem.size, 40).convert("RGB"), 0.2)
+        buffer = io.BytesIO()
+        imagem.save(buffer, "JPEG", quality=90)
+        caminhos.append(salvar_conteudo(buffer.getvalue(), pasta))
+    return caminhos
+
+
+def povoar(gerenciador, usuarios, hortas, feed, imagens, semente=42):
+    """Insere usuários, hortas e postagens sintéticos. Retorna os (email, senha) criados."""
+    from werkzeug.security import generate_password_hash
+
+    from senhas import METODO_HASH
+
+    from midia import registrar_imagem
+
+    random.seed(semente)
+    fotos = gerar_imagens(imagens) if imagens else [""]
+    with gerenciador.transacao("imagens") as conn:
+        for foto in filter(None, fotos):
+            registrar_imagem(conn, foto)
+    cidades = carregar_centroides()[0]
+    # Um único hash para todos: o custo do scrypt não é o que está sendo medido
+    senha_hash = generate_password_hash(SENHA_SINTETICA, method=METODO_HASH)
+
+    with gerenciador.transacao("users") as conn:
+        primeiro_usuario = (conn.execute("SELECT COALESCE(MAX(user_id), 0) FROM users").fetchone()[0]) + 1
+        for lote in _em_lotes(
+            (f"Usuário {i}", random.randint(18, 80), f"6199{i:07d}", f"Rua {i}, Brasília - DF",
+             f"usuario{i}@bench.local", senha_hash)
+            for i in range(usuarios)
+        ):
+            conn.executemany(
+                "INSERT INTO users (nome, idade, telefone, endereco, email, senha) VALUES (?, ?, ?, ?, ?, ?)",
+                lote,
+            )
+
+    def horta(i):
+        # As primeiras hortas ficam com o primeiro usuário, que é o da tela_usuario
+        dono = primeiro_usuario + (0 if i < 5 else random.randrange(max(usuarios, 1)))
+        _, (latitude, longitude) = random.choice(cidades)
+        plantio = date.today() - timedelta(days=random.randint(0, 120))
+        return (f"Horta {i}", dono, random.choice(fotos), random.choice(ESPECIES), random.randint(20, 120), plantio,
+                f"Produtor {i}", f"Quadra {i}, Brasília - DF", f"horta{i}@bench.local",
+                latitude + random.uniform(-0.2, 0.2), longitude + random.uniform(-0.2, 0.2))
+
+    with gerenciador.transacao("hortas") as conn:
+        primeira_horta = (conn.execute("SELECT COALESCE(MAX(horta_id), 0) FROM hortas").fetchone()[0]) + 1
+        for lote in _em_lotes(horta(i) for i in range(hortas)):
+            conn.executemany("""
+                INSERT INTO hortas (nome_horta, usuario_id, foto, especie, dias_colheita, data_plantio,
+                                    contato, endereco, email, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, lote)
+
+    inicio = datetime.now() - timedelta(days=365)
+    passo = timedelta(days=365) / max(feed, 1)
+    with gerenciador.transacao("feed_hortas") as conn:
+        for lote in _em_lotes(
+            (primeira_horta + random.randrange(max(hortas, 1)), primeiro_usuario + random.randrange(max(usuarios, 1)),
+             random.choice(fotos), f"Colheita do dia {i}", (inicio + passo * i).strftime("%Y-%m-%d %H:%M:%S"))
+            for i in range(feed)
+        ):
+            conn.executemany("""
+                INSERT INTO feed_hortas (horta_id, usuario_id, foto, descricao, data_postagem)
+                VALUES (?, ?, ?, ?, ?)
+            """, lote)
+
+    return [(f"usuario{i}@bench.local", SENHA_SINTETICA) for i in range(usuarios)]
+
+
+# ========================== MEDIÇÃO ==========================
+
+class MedidorSQL:
+    """Observador de banco.OBSERVADORES_SQL que acumula tempo e linhas."""
+
+    def __init__(self):
+        self.zerar()
+
+    def zerar(self):
+        self.segundos = 0.0
+        self.linhas = 0
+        self.comandos = 0
+
+    def __call__(self, sql, segundos, linhas):
+        self.segundos += segundos
+        self.linhas += linhas
+        self.comandos += 1
+
+
+def _bytes_elementos(no):
+    proto = getattr(no, "proto", None)
+    total = proto.ByteSize() if hasattr(proto, "ByteSize") else 0
+    for filho in getattr(no, "children", {}).values():
+        total += _bytes_elementos(filho)
+    return total
+
+
+_armazenamentos_midia = []
+
+
+def _medir_midia():
+    """Faz o AppTest guardar a mídia num armazenamento que sobrevive à execução."""
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    class ArmazenamentoMedido(MemoryMediaFileStorage):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            _armazenamentos_midia.append(self)
+
+    # O AppTest cria um Runtime falso por execução e o descarta no fim
+    app_test.MemoryMediaFileStorage = ArmazenamentoMedido
+
+
+def _bytes_midia():
+    if not _armazenamentos_midia:
+        return 0
+    return sum(arquivo.content_size for arquivo in _armazenamentos_midia[-1]._files_by_id.values())
+
+
+def executar(at, medidor, acao=None):
+    """Roda uma interação do AppTest e devolve a medição."""
+    medidor.zerar()
+    _armazenamentos_midia.clear()
+    inicio = time.perf_counter()
+    (acao or at.run)()
+    render = time.perf_counter() - inicio
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return {
+        "render_ms": render * 1000,
+        "sql_ms": medidor.segundos * 1000,
+        "sql_comandos": medidor.comandos,
+        "linhas": medidor.linhas,
+        "bytes": _bytes_elementos(at._tree) + _bytes_midia(),
+    }
+
+
+def novo_app(timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(ARQUIVO_APP, default_timeout=timeout)
+    at.run()
+    return at
+
+
+def entrar(at, email, senha):
+    at.text_input(key="login_email").set_value(email)
+    at.text_input(key="login_senha").set_value(senha)
+    return at.button[0].click().run
+
+
+def _por_rotulo(widgets, rotulo):
+    return next(widget for widget in widgets if widget.label == rotulo)
+
+
+def medir_paginas(paginas, repeticoes, logins, admin, timeout):
+    """Executa cada página ``repeticoes`` vezes; retorna {página: [medições]}.
+
+    ``logins`` é a lista de (email, senha) usada nas páginas de usuário comum;
+    o primeiro é o dono das hortas da tela_usuario.
+    """
+    import senhas
+
+    # O benchmark faz muitos logins seguidos: o limitador não é o alvo aqui
+    senhas.limitador_email.maximo = senhas.limitador_ip.maximo = 10 ** 9
+    senhas.iniciar_pool()
+    _medir_midia()
+
+    medidor = MedidorSQL()
+    banco.OBSERVADORES_SQL.append(medidor)
+    resultados = {pagina: [] for pagina in paginas}
+    try:
+        usuario = novo_app(timeout)
+        executar(usuario, medidor, entrar(usuario, *logins[0]))
+        sessao_admin = novo_app(timeout)
+        executar(sessao_admin, medidor, entrar(sessao_admin, *admin))
+
+        for rodada in range(repeticoes):
+            for pagina in paginas:
+                if pagina == "login":
+                    at = novo_app(timeout)
+                    medicao = executar(at, medidor, entrar(at, *logins[rodada % len(logins)]))
+                elif pagina == "tela_usuario":
+                    medicao = executar(usuario, medidor, usuario.sidebar.selectbox[0].set_value("Página Inicial").run)
+                elif pagina == "feed_hortas":
+                    medicao = executar(usuario, medidor, usuario.sidebar.selectbox[0].set_value("Feed de Hortas").run)
+                elif pagina == "cadastrar_horta":
+                    executar(usuario, medidor, usuario.sidebar.selectbox[0].set_value("Cadastrar Horta").run)
+                    _por_rotulo(usuario.text_input, "Nome da Horta").set_value(f"Horta benchmark {rodada}")
+                    _por_rotulo(usuario.text_input, "Espécie Plantada").set_value(random.choice(ESPECIES))
+                    _por_rotulo(usuario.text_input, "Endereço da Horta").set_value("Brasília - DF")
+                    medicao = executar(usuario, medidor, usuario.button(key="btn_cadastrar_horta").click().run)
+                    # Volta à página inicial para a próxima rodada recomeçar do formulário vazio
+                    usuario.sidebar.selectbox[0].set_value("Página Inicial").run()
+                else:
+                    medicao = executar(sessao_admin, medidor,
+                                       sessao_admin.sidebar.selectbox[0].set_value("Painel do Administrador").run)
+                    sessao_admin.sidebar.selectbox[0].set_value("Página Inicial").run()
+                resultados[pagina].append(medicao)
+    finally:
+        banco.OBSERVADORES_SQL.remove(medidor)
+    return resultados
+
+
+def resumir(medicoes):
+    resumo = {"execucoes": len(medicoes)}
+    for metrica in ("render_ms", "sql_ms", "sql_comandos", "linhas", "bytes"):
+        valores = [medicao[metrica] for medicao in medicoes]
+        resumo[metrica] = {"p50": percentil(valores, 50), "p95": percentil(valores, 95)}
+    return resumo
+
+
+# ========================== RELATÓRIO ==========================
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRETORIO_APP,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def imprimir(resultado, anterior=None):
+    print(f"\nCommit {resultado['commit']}  volumes {resultado['volumes']}")
+    print(f"{'página':<22}{'render p50':>12}{'p95':>10}{'sql p50':>10}{'linhas':>10}{'bytes':>12}")
+    for pagina, resumo in resultado["paginas"].items():
+        linha = (f"{pagina:<22}{resumo['render_ms']['p50']:>10.1f}ms{resumo['render_ms']['p95']:>8.1f}ms"
+                 f"{resumo['sql_ms']['p50']:>8.1f}ms{resumo['linhas']['p50']:>10.0f}{resumo['bytes']['p50']:>12.0f}")
+        antes = (anterior or {}).get("paginas", {}).get(pagina)
+        if antes and antes["render_ms"]["p50"]:
+            variacao = resumo["render_ms"]["p50"] / antes["render_ms"]["p50"] - 1
+            linha += f"  {variacao:+.0%} vs {anterior['commit']}"
+        print(linha)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--hortas", type=int, default=5000)
+    parser.add_argument("--feed", type=int, default=50000)
+    parser.add_argument("--imagens", type=int, default=20, help="fotos sintéticas distintas")
+    parser.add_argument("--banco", help="usa uma cópia deste banco em vez de gerar dados")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--paginas", nargs="*", choices=PAGINAS, default=PAGINAS)
+    parser.add_argument("--admin", nargs=2, default=ADMIN, metavar=("EMAIL", "SENHA"),
+                        help="administrador do banco; com --banco também faz as páginas de usuário")
+    parser.add_argument("--timeout", type=float, default=120, help="segundos por execução de página")
+    parser.add_argument("--saida", help="arquivo JSON (padrão: bench_resultados/<data>_<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+
+    commit = commit_atual()
+    saida = os.path.abspath(args.saida or os.path.join(
+        PASTA_RESULTADOS, f"{datetime.now():%Y%m%d-%H%M%S}_{commit}.json"))
+
+    diretorio = tempfile.mkdtemp(prefix="campocidade-bench-")
+    try:
+        # O app usa caminhos relativos (database.db, uploads/): tudo no temporário
+        os.chdir(diretorio)
+        if args.banco:
+            shutil.copy(os.path.join(DIRETORIO_APP, args.banco), "database.db")
+            for pasta in ("uploads", "imagens"):
+                if os.path.isdir(os.path.join(DIRETORIO_APP, pasta)):
+                    shutil.copytree(os.path.join(DIRETORIO_APP, pasta), pasta)
+
+        gerenciador = GerenciadorBanco(banco.DATABASE)
+        migrar(gerenciador)
+        logins = [tuple(args.admin)]
+        volumes = {"banco": args.banco}
+        if not args.banco:
+            inicio = time.perf_counter()
+            logins = povoar(gerenciador, args.usuarios, args.hortas, args.feed, args.imagens)
+            volumes = {"usuarios": args.usuarios, "hortas": args.hortas, "feed": args.feed, "imagens": args.imagens}
+            print(f"Dados sintéticos gerados em {time.perf_counter() - inicio:.1f}s")
+        gerenciador.fechar()
+
+        medicoes = medir_paginas(args.paginas, args.repeticoes, logins, tuple(args.admin), args.timeout)
+        resultado = {
+            "commit": commit,
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "volumes": volumes,
+            "repeticoes": args.repeticoes,
+            "paginas": {pagina: resumir(lista) for pagina, lista in medicoes.items()},
+        }
+    finally:
+        os.chdir(DIRETORIO_APP)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(saida), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    imprimir(resultado, anterior)
+    print(f"\nResultados salvos em {saida}")
@@ -0,0 +1,156 @@
+"""Demandas dos compradores e correspondência com as hortas.
+
+Um comerciante registra o que quer comprar: espécie, quantidade, janela de
+datas e região. Cada demanda só é comparada com as hortas da mesma espécie
+(os índices ``idx_demandas_especie`` e ``idx_hortas_especie`` fazem o papel
+de índice invertido) e cada par recebe uma nota pela data prevista de
+colheita e pela distância, calculada com NumPy para todas as candidatas de
+uma vez. O resultado fica na tabela ``correspondencias``, atualizada aos
+poucos: ao registrar uma demanda e ao cadastrar ou editar uma horta.
+
+Para recalcular tudo (ex.: depois de mudar os pesos):
+
+    python demandas.py reconstruir
+"""
+
+import sys
+from datetime import date, datetime
+
+from geo import distancias_km, geocodificar
+
+UNIDADES = ["kg", "maço", "unidade", "caixa"]
+RAIO_PADRAO_KM = 50
+
+# Pontuação = PESO_DATA * nota da data + PESO_DISTANCIA * nota da distância, de 0 a 1
+PESO_DATA = 0.6
+PESO_DISTANCIA = 0.4
+# Colheitas até DIAS_TOLERANCIA fora da janela ainda contam; a nota cai
+# para ~37% a cada ESCALA_DIAS
+DIAS_TOLERANCIA = 30
+ESCALA_DIAS = 14
+# A nota da distância cai pela metade a cada ESCALA_KM
+ESCALA_KM = 25
+# Nota de data ou de distância quando a horta (ou a demanda) não a informa
+NOTA_DESCONHECIDA = 0.3
+
+SQL_CANDIDATAS = """
+    SELECT horta_id, data_colheita, latitude, longitude
+    FROM hortas WHERE lower(trim(especie)) = ? AND ativa = 1
+"""
+
+
+def pontuar(demanda, hortas):
+    """(pontuações, distâncias em km) das ``hortas`` para a ``demanda``.
+
+    Hortas fora do raio ou longe demais da janela de datas ficam com
+    pontuação NaN. Distâncias desconhecidas são NaN.
+    """
+    import numpy as np
+
+    inicio = np.datetime64(demanda["data_inicio"], "D")
+    fim = np.datetime64(demanda["data_fim"], "D")
+    colheitas = np.array([horta["data_colheita"] or "NaT" for horta in hortas], dtype="datetime64[D]")
+    zero = np.timedelta64(0, "D")
+    dias_fora = (np.maximum(inicio - colheitas, zero) + np.maximum(colheitas - fim, zero)) / np.timedelta64(1, "D")
+    nota_data = np.where(np.isnan(dias_fora), NOTA_DESCONHECIDA, np.exp(-dias_fora / ESCALA_DIAS))
+
+    distancias = np.full(len(hortas), np.nan)
+    if demanda["latitude"] is not None and demanda["longitude"] is not None:
+        latitudes = np.array([np.nan if horta["latitude"] is None else horta["latitude"] for horta in hortas])
+        longitudes = np.array([np.nan if horta["longitude"] is None else horta["longitude"] for horta in hortas])
+        conhecidas = ~np.isnan(latitudes) & ~np.isnan(longitudes)
+        distancias[conhecidas] = distancias_km(
+            demanda["latitude"], demanda["longitude"], latitudes[conhecidas], longitudes[conhecidas])
+    nota_distancia = np.where(np.isnan(distancias), NOTA_DESCONHECIDA, 1 / (1 + distancias / ESCALA_KM))
+
+    pontuacoes = PESO_DATA * nota_data + PESO_DISTANCIA * nota_distancia
+    pontuacoes[dias_fora > DIAS_TOLERANCIA] = np.nan
+    pontuacoes[distancias > demanda["raio_km"]] = np.nan
+    return pontuacoes, distancias
+
+
+def _gravar(conn, demanda, hortas):
+    if not hortas:
+        return 0
+    import numpy as np
+
+    pontuacoes, distancias = pontuar(demanda, hortas)
+    linhas = [
+        (demanda["demanda_id"], horta["horta_id"], float(pontuacao), None if np.isnan(distancia) else float(distancia))
+        for horta, pontuacao, distancia in zip(hortas, pontuacoes, distancias)
+        if not np.isnan(pontuacao)
+    ]
+    conn.executemany("INSERT OR REPLACE INTO correspondencias VALUES (?, ?, ?, ?)", linhas)
+    return len(linhas)
+
+
+def corresponder_demanda(conn, demanda_id):
+    """Recalcula as hortas que atendem a demanda. Retorna quantas."""
+    conn.execute("DELETE FROM correspondencias WHERE demanda_id = ?", (demanda_id,))
+    demanda = conn.execute("SELECT * FROM demandas WHERE demanda_id = ?", (demanda_id,)).fetchone()
+    if demanda is None:
+        return 0
+    return _gravar(conn, demanda, conn.execute(SQL_CANDIDATAS, (demanda["especie"],)).fetchall())
+
+
+def corresponder_hortas(conn, horta_ids):
+    """Recalcula as correspondências das hortas criadas ou editadas. Retorna quantas.
+
+    Só as demandas em aberto da espécie de cada horta são consultadas;
+    hortas desativadas perdem as correspondências.
+    """
+    horta_ids = sorted(set(horta_ids))
+    por_especie = {}
+    for inicio in range(0, len(horta_ids), 500):
+        bloco = horta_ids[inicio:inicio + 500]
+        marcadores = ", ".join("?" * len(bloco))
+        conn.execute(f"DELETE FROM correspondencias WHERE horta_id IN ({marcadores})", bloco)
+        for horta in conn.execute(f"""
+            SELECT horta_id, lower(trim(especie)) AS especie, data_colheita, latitude, longitude
+            FROM hortas WHERE horta_id IN ({marcadores}) AND ativa = 1
+        """, bloco):
+            por_especie.setdefault(horta["especie"], []).append(horta)
+
+    total = 0
+    hoje = date.today().isoformat()
+    for especie, hortas in por_especie.items():
+        demandas = conn.execute(
+            "SELECT * FROM demandas WHERE especie = ? AND data_fim >= ?", (especie, hoje)).fetchall()
+        for demanda in demandas:
+            total += _gravar(conn, demanda, hortas)
+    return total
+
+
+def registrar_demanda(conn, usuario_id, especie, quantidade, unidade, data_inicio, data_fim, endereco,
+                      raio_km=RAIO_PADRAO_KM):
+    """Grava a demanda, localiza a região e já calcula as correspondências. Retorna o id."""
+    latitude, longitude = geocodificar(endereco) or (None, None)
+    cursor = conn.execute("""
+        INSERT INTO demandas (usuario_id, especie, quantidade, unidade, data_inicio, data_fim,
+                              endereco, latitude, longitude, raio_km, criada_em)
+        VALUES (?, lower(trim(?)), ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (usuario_id, especie, quantidade, unidade, data_inicio, data_fim, endereco,
+          latitude, longitude, raio_km, datetime.now()))
+    corresponder_demanda(conn, cursor.lastrowid)
+    return cursor.lastrowid
+
+
+def reconstruir_correspondencias(conn):
+    """Refaz a tabela inteira a partir das demandas em aberto. Retorna quantas correspondências."""
+    conn.execute("DELETE FROM correspondencias")
+    demandas = conn.execute(
+        "SELECT demanda_id FROM demandas WHERE data_fim >= ?", (date.today().isoformat(),)).fetchall()
+    return sum(corresponder_demanda(conn, demanda["demanda_id"]) for demanda in demandas)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "reconstruir":
+        print("uso: python demandas.py reconstruir [caminho_do_banco]")
+        sys.exit(1)
+
+    from banco import DATABASE, GerenciadorBanco, migrar
+
+    banco = GerenciadorBanco(sys.argv[2] if len(sys.argv) > 2 else DATABASE)
+    migrar(banco)
+    with banco.transacao("correspondencias") as conn:
+        print(f"{reconstruir_correspondencias(conn)} correspondência(s) calculada(s).")
@@ -0,0 +1,345 @@
+"""Instrumentação de desempenho do app.
+
+Cada execução de página (``medir_pagina``) abre um contexto ao qual são
+atribuídos os comandos SQL e as leituras de imagem feitos durante ela:
+
+- tempo de SQL: observador em ``banco.OBSERVADORES_SQL``;
+- comandos executados: ``set_trace_callback`` das conexões do pool, que
+  também mostra os comandos disparados por gatilhos;
+- leituras de imagem: observador em ``midia.OBSERVADORES_LEITURA``.
+
+Os eventos ficam num buffer circular em memória (os mais antigos saem
+primeiro) e alimentam a aba "Desempenho" do painel do administrador. A
+mesma consulta repetida muitas vezes numa execução é registrada como
+suspeita de N+1. Contadores acumulados desde o início do processo são
+gravados periodicamente no formato texto do Prometheus, em
+``CAMPOCIDADE_METRICAS`` (padrão: metricas.prom), para um coletor local.
+
+Este módulo não depende do Streamlit.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import banco
+import midia
+
+CAPACIDADE = 5000
+# Mesma consulta (a menos dos parâmetros) repetida numa execução de página
+LIMITE_N_MAIS_1 = 10
+# Limites superiores (segundos) das faixas dos histogramas de latência
+FAIXAS_SEGUNDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Formas de consulta distintas contadas desde o início do processo
+MAX_FORMAS_SQL = 2000
+
+ARQUIVO_PROMETHEUS = os.environ.get("CAMPOCIDADE_METRICAS", "metricas.prom")
+INTERVALO_PROMETHEUS = 15
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bNULL\b", re.IGNORECASE)
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ESPACOS = re.compile(r"\s+")
+_SEM_N_MAIS_1 = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "SAVEPOINT", "RELEASE")
+
+
+def forma_sql(sql):
+    """SQL sem literais nem espaços extras: agrupa execuções da mesma consulta."""
+    sql = _LITERAIS.sub("?", sql or "")
+    sql = _LISTAS.sub("(?, ...)", sql)
+    return _ESPACOS.sub(" ", sql).strip()
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    posicao = (len(ordenados) - 1) * p / 100
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(ordenados) - 1)
+    return ordenados[baixo] + (ordenados[alto] - ordenados[baixo]) * (posicao - baixo)
+
+
+class _Execucao:
+    """O que aconteceu durante uma execução de página."""
+
+    def __init__(self, pagina):
+        self.pagina = pagina
+        self.comandos = Counter()
+        self.gatilhos = 0
+        self.sql_segundos = 0.0
+        self.imagens = 0
+        self.imagem_segundos = 0.0
+
+
+_execucao_atual = ContextVar("execucao_desempenho", default=None)
+
+
+class Registro:
+    """Buffer circular de eventos e contadores acumulados para o Prometheus."""
+
+    def __init__(self, capacidade=CAPACIDADE):
+        self.capacidade = capacidade
+        self._eventos = deque(maxlen=capacidade)
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(float)
+        self._execucoes_sql = Counter()
+        self._histogramas = defaultdict(lambda: [0] * (len(FAIXAS_SEGUNDOS) + 1))
+        self._somas = defaultdict(float)
+
+    def adicionar(self, tipo, nome, segundos, **extra):
+        evento = {"momento": time.time(), "tipo": tipo, "nome": nome, "segundos": segundos, **extra}
+        with self._lock:
+            self._eventos.append(evento)
+
+    def incrementar(self, metrica, valor=1, **rotulos):
+        with self._lock:
+            self._contadores[(metrica, tuple(sorted(rotulos.items())))] += valor
+
+    def contar_execucao_sql(self, forma):
+        with self._lock:
+            if forma in self._execucoes_sql or len(self._execucoes_sql) < MAX_FORMAS_SQL:
+                self._execucoes_sql[forma] += 1
+
+    def observar_pagina(self, pagina, segundos):
+        with self._lock:
+            faixas = self._histogramas[pagina]
+            for i, limite in enumerate(FAIXAS_SEGUNDOS):
+                if segundos <= limite:
+                    faixas[i] += 1
+                    break
+            else:
+                faixas[-1] += 1
+            self._somas[pagina] += segundos
+
+    def eventos(self, tipo=None):
+        with self._lock:
+            eventos = list(self._eventos)
+        return [evento for evento in eventos if tipo is None or evento["tipo"] == tipo]
+
+    def limpar(self):
+        """Esvazia o buffer; os contadores do Prometheus continuam acumulando."""
+        with self._lock:
+            self._eventos.clear()
+
+    # ---------------------- resumos para a tela ----------------------
+
+    def resumo_paginas(self):
+        por_pagina = defaultdict(list)
+        for evento in self.eventos("pagina"):
+            por_pagina[evento["nome"]].append(evento)
+
+        resumo = []
+        for pagina, eventos in por_pagina.items():
+            tempos = [evento["segundos"] * 1000 for evento in eventos]
+            resumo.append({
+                "pagina": pagina,
+                "execucoes": len(eventos),
+                "p50_ms": percentil(tempos, 50),
+                "p95_ms": percentil(tempos, 95),
+                "max_ms": max(tempos),
+                "sql_ms_medio": sum(e["sql_segundos"] for e in eventos) * 1000 / len(eventos),
+                "imagens_ms_medio": sum(e["imagem_segundos"] for e in eventos) * 1000 / len(eventos),
+                "comandos_medio": sum(e["comandos"] for e in eventos) / len(eventos),
+            })
+        return sorted(resumo, key=lambda linha: -linha["p95_ms"])
+
+    def histograma(self, pagina):
+        """[(faixa, execuções)] da página, com as execuções ainda no buffer."""
+        contagens = [0] * (len(FAIXAS_SEGUNDOS) + 1)
+        for evento in self.eventos("pagina"):
+            if evento["nome"] != pagina:
+                continue
+            for i, limite in enumerate(FAIXAS_SEGUNDOS):
+                if evento["segundos"] <= limite:
+                    contagens[i] += 1
+                    break
+            else:
+                contagens[-1] += 1
+        rotulos = [f"≤ {limite * 1000:g} ms" for limite in FAIXAS_SEGUNDOS] + [f"> {FAIXAS_SEGUNDOS[-1] * 1000:g} ms"]
+        return list(zip(rotulos, contagens))
+
+    def consultas_mais_lentas(self, limite=20):
+        por_forma = defaultdict(lambda: {"tempo_total_ms": 0.0, "maior_ms": 0.0, "linhas": 0})
+        for evento in self.eventos("sql"):
+            linha = por_forma[evento["nome"]]
+            linha["tempo_total_ms"] += evento["segundos"] * 1000
+            linha["maior_ms"] = max(linha["maior_ms"], evento["segundos"] * 1000)
+            linha["linhas"] += evento["linhas"]
+        with self._lock:
+            execucoes = dict(self._execucoes_sql)
+
+        linhas = [{"consulta": forma, "execucoes": execucoes.get(forma, 0), **dados} for forma, dados in por_forma.items()]
+        return sorted(linhas, key=lambda linha: -linha["tempo_total_ms"])[:limite]
+
+    def suspeitas_n_mais_1(self, limite=50):
+        eventos = sorted(self.eventos("n+1"), key=lambda evento: -evento["momento"])[:limite]
+        return [{
+            "quando": time.strftime("%H:%M:%S", time.localtime(evento["momento"])),
+            "pagina": evento["pagina"],
+            "vezes": evento["vezes"],
+            "consulta": evento["nome"],
+        } for evento in eventos]
+
+    def leituras_mais_lentas(self, limite=20):
+        eventos = sorted(self.eventos("imagem"), key=lambda evento: -evento["segundos"])[:limite]
+        return [{
+            "arquivo": evento["nome"],
+            "ms": evento["segundos"] * 1000,
+            "bytes": evento["bytes"],
+            "pagina": evento["pagina"],
+        } for evento in eventos]
+
+    # ---------------------- Prometheus ----------------------
+
+    def texto_prometheus(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {pagina: list(faixas) for pagina, faixas in self._histogramas.items()}
+            somas = dict(self._somas)
+
+        linhas = [
+            "# HELP campocidade_pagina_segundos Tempo de execução das páginas.",
+            "# TYPE campocidade_pagina_segundos histogram",
+        ]
+        for pagina, faixas in sorted(histogramas.items()):
+            rotulo = f'pagina="{_escapar(pagina)}"'
+            acumulado = 0
+            for limite, quantidade in zip(FAIXAS_SEGUNDOS, faixas):
+                acumulado += quantidade
+                linhas.append(f'campocidade_pagina_segundos_bucket{{{rotulo},le="{limite:g}"}} {acumulado}')
+            acumulado += faixas[-1]
+            linhas.append(f'campocidade_pagina_segundos_bucket{{{rotulo},le="+Inf"}} {acumulado}')
+            linhas.append(f"campocidade_pagina_segundos_sum{{{rotulo}}} {somas[pagina]:.6f}")
+            linhas.append(f"campocidade_pagina_segundos_count{{{rotulo}}} {acumulado}")
+
+        metricas = defaultdict(list)
+        for (metrica, rotulos), valor in contadores.items():
+            metricas[metrica].append((rotulos, valor))
+        for metrica in sorted(metricas):
+            linhas.append(f"# TYPE campocidade_{metrica} counter")
+            for rotulos, valor in sorted(metricas[metrica]):
+                texto = ",".join(f'{chave}="{_escapar(v)}"' for chave, v in rotulos)
+                linhas.append(f"campocidade_{metrica}{{{texto}}} {valor:g}" if texto else f"campocidade_{metrica} {valor:g}")
+        return "\n".join(linhas) + "\n"
+
+    def gravar_prometheus(self, caminho=ARQUIVO_PROMETHEUS):
+        """Grava de forma atômica: o coletor nunca lê um arquivo pela metade."""
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(self.texto_prometheus())
+        os.replace(temporario, caminho)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registro = Registro()
+
+
+# ========================== COLETA ==========================
+
+def _observar_sql(sql, segundos, linhas):
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.sql_segundos += segundos
+    registro.adicionar("sql", forma_sql(sql), segundos, linhas=linhas,
+                       pagina=execucao.pagina if execucao else None)
+    registro.incrementar("sql_segundos_total", segundos)
+
+
+def _rastrear_sql(comando):
+    execucao = _execucao_atual.get()
+    if comando.startswith("-- TRIGGER"):
+        registro.incrementar("sql_gatilhos_total")
+        if execucao is not None:
+            execucao.gatilhos += 1
+        return
+
+    forma = forma_sql(comando)
+    registro.contar_execucao_sql(forma)
+    registro.incrementar("sql_comandos_total")
+    if execucao is not None:
+        execucao.comandos[forma] += 1
+
+
+def _observar_leitura(caminho, segundos, tamanho):
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.imagens += 1
+        execucao.imagem_segundos += segundos
+    registro.adicionar("imagem", caminho, segundos, bytes=tamanho,
+                       pagina=execucao.pagina if execucao else None)
+    registro.incrementar("imagem_leituras_total")
+    registro.incrementar("imagem_bytes_total", tamanho)
+    registro.incrementar("imagem_segundos_total", segundos)
+
+
+def instalar():
+    """Liga os observadores no banco e no midia. Pode ser chamado mais de uma vez.
+
+    O rastreamento de comandos só vale para conexões criadas depois daqui.
+    """
+    for lista, observador in (
+        (banco.OBSERVADORES_SQL, _observar_sql),
+        (banco.RASTREADORES_SQL, _rastrear_sql),
+        (midia.OBSERVADORES_LEITURA, _observar_leitura),
+    ):
+        if observador not in lista:
+            lista.append(observador)
+
+
+@contextmanager
+def medir_pagina(pagina):
+    """Mede a execução de uma página e o SQL/imagens atribuídos a ela."""
+    execucao = _Execucao(pagina)
+    token = _execucao_atual.set(execucao)
+    inicio = time.perf_counter()
+    try:
+        yield execucao
+    finally:
+        segundos = time.perf_counter() - inicio
+        _execucao_atual.reset(token)
+
+        registro.adicionar(
+            "pagina", pagina, segundos,
+            sql_segundos=execucao.sql_segundos,
+            comandos=sum(execucao.comandos.values()),
+            gatilhos=execucao.gatilhos,
+            imagens=execucao.imagens,
+            imagem_segundos=execucao.imagem_segundos,
+        )
+        registro.observar_pagina(pagina, segundos)
+        for forma, vezes in execucao.comandos.items():
+            if vezes >= LIMITE_N_MAIS_1 and not forma.upper().startswith(_SEM_N_MAIS_1):
+                registro.adicionar("n+1", forma, None, vezes=vezes, pagina=pagina)
+                registro.incrementar("n_mais_1_total", pagina=pagina)
+
+
+# ========================== EXPORTAÇÃO ==========================
+
+_exportador = None
+_lock_exportador = threading.Lock()
+
+
+def iniciar_exportacao(caminho=ARQUIVO_PROMETHEUS, intervalo=INTERVALO_PROMETHEUS):
+    """Thread que grava as métricas a cada ``intervalo`` segundos (uma por processo)."""
+    global _exportador
+
+    def exportar():
+        while True:
+            try:
+                registro.gravar_prometheus(caminho)
+            except OSError:
+                pass  # disco cheio/sem permissão: tenta de novo no próximo ciclo
+            time.sleep(intervalo)
+
+    with _lock_exportador:
+        if _exportador is None:
+            _exportador = threading.Thread(target=exportar, name="exportador-metricas", daemon=True)
+            _exportador.start()
+    return _exportador
@@ -0,0 +1,170 @@
+"""Servidor HTTP das imagens, com URLs imutáveis e cache longo no navegador.
+
+Com ``st.image(bytes)`` cada rerun relê as fotos e as reenvia pelo
+websocket. Aqui as pastas ``uploads`` e ``imagens`` são servidas por um
+servidor HTTP pequeno, numa thread do próprio processo, e as telas passam
+só a URL da foto. Isso só vale quando o endereço público do servidor é
+configurado (normalmente um caminho no proxy reverso, com o mesmo esquema
+da página); sem ele o app segue mandando os bytes pelo ``st.image``. A URL leva a versão do arquivo (``?v=``: o SHA-256
+registrado ou, sem registro, mtime e tamanho), então nunca muda de
+conteúdo e pode ser guardada com ``Cache-Control: immutable``; o navegador
+ou um proxy reverso só revalida com ETag/If-None-Match.
+
+Variáveis de ambiente:
+
+- ``CAMPOCIDADE_PORTA_IMAGENS``: porta do servidor (padrão 8502; 0 desliga)
+- ``CAMPOCIDADE_HOST_IMAGENS``: interface em que escuta (padrão 0.0.0.0)
+- ``CAMPOCIDADE_URL_IMAGENS``: endereço público das imagens, com o esquema
+  (ex.: https://campocidade.org/imagens-estaticas). Sem ela o servidor não
+  sobe e as fotos vão em bytes.
+- ``CAMPOCIDADE_BALANCEADOR``: definida pelo balanceador.py nos processos
+  que ele sobe. O servidor roda no balanceador; os processos só montam as URLs.
+"""
+
+import mimetypes
+import os
+import posixpath
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+from midia import EXTENSOES_DERIVADO, EXTENSOES_IMAGEM, caminho_derivado, chave_imagem, escolher_variante, ler_imagem
+
+PORTA_IMAGENS = int(os.environ.get("CAMPOCIDADE_PORTA_IMAGENS", 8502))
+HOST_IMAGENS = os.environ.get("CAMPOCIDADE_HOST_IMAGENS", "0.0.0.0")
+URL_IMAGENS = os.environ.get("CAMPOCIDADE_URL_IMAGENS", "").rstrip("/")
+SOB_BALANCEADOR = os.environ.get("CAMPOCIDADE_BALANCEADOR") == "1"
+
+# Só arquivos de imagem destas pastas são servidos
+PASTAS_PUBLICAS = ("uploads", "imagens")
+EXTENSOES_PUBLICAS = set(EXTENSOES_IMAGEM) | set(EXTENSOES_DERIVADO.values())
+
+# URLs versionadas: um ano, sem revalidar. Sem versão: sempre revalida.
+CACHE_VERSIONADO = "public, max-age=31536000, immutable"
+CACHE_SEM_VERSAO = "public, no-cache"
+
+_servidor = None
+_lock_servidor = threading.Lock()
+
+
+def _etag(estado):
+    return f'"{estado.st_mtime_ns:x}-{estado.st_size:x}"'
+
+
+def _arquivo_publico(caminho_url):
+    """Caminho relativo do arquivo pedido, ou None se estiver fora das pastas públicas."""
+    caminho = posixpath.normpath(unquote(caminho_url).lstrip("/"))
+    partes = caminho.split("/")
+    if partes[0] not in PASTAS_PUBLICAS or ".." in partes or len(partes) < 2:
+        return None
+    if os.path.splitext(caminho)[1].lower() not in EXTENSOES_PUBLICAS:
+        return None
+    return caminho
+
+
+class ManipuladorImagens(BaseHTTPRequestHandler):
+    """GET/HEAD de imagens com ETag, 304 e Cache-Control conforme a versão."""
+
+    server_version = "CampoCidadeImagens"
+
+    def do_HEAD(self):
+        self._responder(corpo=False)
+
+    def do_GET(self):
+        self._responder(corpo=True)
+
+    def _responder(self, corpo):
+        url = urlsplit(self.path)
+        caminho = _arquivo_publico(url.path)
+        try:
+            estado = os.stat(caminho) if caminho else None
+        except OSError:
+            estado = None
+        if estado is None or estado.st_size == 0:
+            self.send_error(404)
+            return
+
+        etag = _etag(estado)
+        nao_mudou = etag in self.headers.get("If-None-Match", "")
+        self.send_response(304 if nao_mudou else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", CACHE_VERSIONADO if "v=" in url.query else CACHE_SEM_VERSAO)
+        if nao_mudou:
+            self.end_headers()
+            return
+
+        # mtime e tamanho identificam a versão no cache em memória das imagens
+        dados = ler_imagem(caminho, etag) if corpo else None
+        self.send_header("Content-Type", mimetypes.guess_type(caminho)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(estado.st_size if dados is None else len(dados)))
+        self.end_headers()
+        if dados is not None:
+            self.wfile.write(dados)
+
+    def log_message(self, formato, *args):
+        pass  # uma linha por imagem só atrapalharia o log do Streamlit
+
+
+def iniciar_servidor(porta=PORTA_IMAGENS, host=HOST_IMAGENS):
+    """Sobe o servidor de imagens uma vez por processo; retorna a porta ou None.
+
+    Se a porta já estiver em uso (outro processo do app serve as mesmas
+    pastas), apenas usa a porta configurada.
+    """
+    global _servidor
+
+    if not porta:
+        return None
+    with _lock_servidor:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer((host, porta), ManipuladorImagens)
+            except OSError as e:
+                print(f"servidor de imagens não iniciado na porta {porta}: {e}", file=sys.stderr)
+                return porta
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name="servidor-imagens", daemon=True).start()
+    return porta
+
+
+def base_imagens():
+    """Endereço público das imagens (``CAMPOCIDADE_URL_IMAGENS``), ou None se não configurado.
+
+    Não é montado a partir da página: o servidor fala só HTTP e numa porta
+    própria, o que quebra as fotos atrás de HTTPS ou de um firewall que só
+    abre a porta do app.
+    """
+    if urlsplit(URL_IMAGENS).scheme not in ("http", "https"):
+        return None
+    return URL_IMAGENS
+
+
+def url_imagem(base, caminho, metadados, largura=None):
+    """URL versionada da foto (no derivado adequado à ``largura``), ou None.
+
+    ``metadados`` vem de ``metadados_fotos``; fotos sem registro são
+    versionadas por mtime e tamanho do arquivo em disco.
+    """
+    if not base or not caminho:
+        return None
+
+    variantes = metadados.get(chave_imagem(caminho))
+    if variantes is None:
+        arquivo = caminho_derivado(caminho, largura)
+        try:
+            estado = os.stat(arquivo)
+        except OSError:
+            return None
+        if estado.st_size == 0:
+            return None
+        arquivo, versao = chave_imagem(arquivo), _etag(estado).strip('"')
+    else:
+        variante = escolher_variante(variantes, largura)
+        if variante is None:
+            return None
+        arquivo, versao = variante["caminho"], variante["sha256"][:16]
+
+    if _arquivo_publico(arquivo) is None:
+        return None
+    return f"{base}/{quote(arquivo)}?v={versao}"
@@ -0,0 +1,152 @@
+"""Localização das hortas e busca por proximidade.
+
+As coordenadas vêm do cadastro ou, quando não informadas, de uma tabela
+offline de centróides de cidades e faixas de CEP (dados/centroides.csv).
+A busca por raio usa o índice R*Tree ``hortas_geo`` para filtrar pela caixa
+que envolve o círculo e depois calcula a distância exata (haversine) de
+todos os candidatos de uma vez com NumPy.
+
+Para geocodificar as hortas que ainda estão sem coordenadas:
+
+    python geo.py geocodificar
+"""
+
+import csv
+import math
+import os
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+ARQUIVO_CENTROIDES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "centroides.csv")
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU_LAT = 111.32
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", texto).strip().lower()
+
+
+@lru_cache(maxsize=1)
+def carregar_centroides(arquivo=ARQUIVO_CENTROIDES):
+    """Cidades (maior nome primeiro) e prefixos de CEP (maior prefixo primeiro)."""
+    cidades, ceps = [], []
+    with open(arquivo, encoding="utf-8", newline="") as f:
+        for linha in csv.DictReader(f):
+            coordenadas = (float(linha["latitude"]), float(linha["longitude"]))
+            if linha["tipo"] == "cep":
+                ceps.append((linha["chave"], coordenadas))
+            else:
+                padrao = re.compile(rf"\b{re.escape(_normalizar(linha['chave']))}\b")
+                cidades.append((len(linha["chave"]), padrao, coordenadas))
+
+    cidades.sort(key=lambda item: -item[0])
+    ceps.sort(key=lambda item: -len(item[0]))
+    return [(padrao, coord) for _, padrao, coord in cidades], ceps
+
+
+def geocodificar(endereco):
+    """(latitude, longitude) aproximadas do endereço, ou None.
+
+    Um CEP no texto tem prioridade; senão procura o nome de uma cidade.
+    """
+    if not endereco:
+        return None
+
+    cidades, ceps = carregar_centroides()
+
+    cep = re.search(r"\b(\d{5})-?\d{3}\b", endereco)
+    if cep:
+        for prefixo, coordenadas in ceps:
+            if cep.group(1).startswith(prefixo):
+                return coordenadas
+
+    texto = _normalizar(endereco)
+    for padrao, coordenadas in cidades:
+        if padrao.search(texto):
+            return coordenadas
+    return None
+
+
+def caixa_envolvente(latitude, longitude, raio_km):
+    """(min_lat, max_lat, min_lon, max_lon) do quadrado que contém o círculo."""
+    delta_lat = raio_km / KM_POR_GRAU_LAT
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_lon = min(raio_km / (KM_POR_GRAU_LAT * cos_lat), 180.0)
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+
+def distancias_km(latitude, longitude, latitudes, longitudes):
+    """Distância haversine de um ponto para vários, vetorizada."""
+    import numpy as np
+
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=float))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype=float) - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def hortas_proximas(conn, latitude, longitude, raio_km, limite=50):
+    """Hortas dentro do raio, da mais próxima para a mais distante.
+
+    Retorna uma lista de (linha da horta, distância em km).
+    """
+    import numpy as np
+
+    min_lat, max_lat, min_lon, max_lon = caixa_envolvente(latitude, longitude, raio_km)
+    candidatas = conn.execute("""
+        SELECT hortas.horta_id, hortas.nome_horta, hortas.especie, hortas.endereco,
+               hortas.contato, hortas.email, hortas.dias_colheita, hortas.foto,
+               hortas.latitude, hortas.longitude
+        FROM hortas_geo
+        JOIN hortas ON hortas.horta_id = hortas_geo.horta_id
+        WHERE hortas_geo.max_lat >= ? AND hortas_geo.min_lat <= ?
+          AND hortas_geo.max_lon >= ? AND hortas_geo.min_lon <= ?
+          AND hortas.ativa = 1
+    """, (min_lat, max_lat, min_lon, max_lon)).fetchall()
+
+    if not candidatas:
+        return []
+
+    distancias = distancias_km(
+        latitude, longitude,
+        [horta["latitude"] for horta in candidatas],
+        [horta["longitude"] for horta in candidatas],
+    )
+    dentro = np.flatnonzero(distancias <= raio_km)
+    ordem = dentro[np.argsort(distancias[dentro], kind="stable")][:limite]
+    return [(candidatas[i], float(distancias[i])) for i in ordem]
+
+
+def geocodificar_pendentes(conn):
+    """Preenche latitude/longitude das hortas sem coordenadas. Retorna quantas."""
+    pendentes = conn.execute(
+        "SELECT horta_id, endereco FROM hortas WHERE latitude IS NULL OR longitude IS NULL"
+    ).fetchall()
+
+    atualizacoes = []
+    for horta_id, endereco in pendentes:
+        coordenadas = geocodificar(endereco)
+        if coordenadas:
+            atualizacoes.append((*coordenadas, horta_id))
+
+    conn.executemany("UPDATE hortas SET latitude = ?, longitude = ? WHERE horta_id = ?", atualizacoes)
+    return len(atualizacoes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "geocodificar":
+        print("uso: python geo.py geocodificar [caminho_do_banco]")
+        sys.exit(1)
+
+    from banco import DATABASE, GerenciadorBanco, migrar
+
+    banco = GerenciadorBanco(sys.argv[2] if len(sys.argv) > 2 else DATABASE)
+    migrar(banco)
+    with banco.transacao("hortas") as conn:
+        print(f"{geocodificar_pendentes(conn)} horta(s) geocodificada(s).")
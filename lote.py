@@ -0,0 +1,305 @@
+"""Importação e exportação em lote.
+
+Importação (só administradores): uma planilha CSV/Excel de hortas é lida
+com pandas, validada de forma vetorizada e gravada com ``executemany`` em
+uma única transação. Um .zip opcional traz as fotos, casadas pela coluna
+``foto`` com o nome do arquivo dentro do zip.
+
+Exportação: hortas, usuários (sem o hash da senha) e histórico do feed são
+lidos em blocos de um cursor e escritos direto no destino, sem carregar a
+tabela inteira na memória:
+
+    python lote.py exportar hortas hortas.csv
+    python lote.py exportar feed feed.parquet
+    python lote.py importar hortas.xlsx [fotos.zip]
+"""
+
+import csv
+import io
+import os
+import sys
+import tempfile
+import zipfile
+
+from demandas import corresponder_hortas
+from geo import geocodificar
+from midia import UPLOAD_FOLDER, registrar_imagem, salvar_conteudo
+
+TAMANHO_BLOCO = 5000
+
+COLUNAS_OBRIGATORIAS = ["nome_horta", "especie", "dias_colheita", "contato", "endereco", "email"]
+COLUNAS_OPCIONAIS = ["foto", "latitude", "longitude", "data_plantio"]
+
+# Consultas de exportação; nunca inclua users.senha aqui
+EXPORTACOES = {
+    "hortas": """
+        SELECT horta_id, nome_horta, usuario_id, foto, especie, dias_colheita, data_plantio,
+               data_colheita, contato, endereco, email, latitude, longitude
+        FROM hortas ORDER BY horta_id
+    """,
+    "usuarios": """
+        SELECT user_id, nome, idade, telefone, endereco, email, is_admin, foto_perfil
+        FROM users ORDER BY user_id
+    """,
+    "feed": """
+        SELECT feed_id, horta_id, usuario_id, foto, descricao, data_postagem
+        FROM feed_hortas ORDER BY feed_id
+    """,
+}
+
+# Tipos das colunas no Parquet; as demais são texto
+COLUNAS_INTEIRAS = {"horta_id", "usuario_id", "user_id", "feed_id", "dias_colheita", "idade", "is_admin"}
+COLUNAS_REAIS = {"latitude", "longitude"}
+
+
+# ========================== IMPORTAÇÃO ==========================
+
+def ler_planilha(arquivo, nome_arquivo):
+    """DataFrame com as colunas conhecidas, tudo como texto."""
+    import pandas as pd
+
+    if nome_arquivo.lower().endswith((".xlsx", ".xls")):
+        try:
+            df = pd.read_excel(arquivo, dtype=str)
+        except ImportError:
+            raise ValueError("Para importar Excel instale o pacote openpyxl (ou envie CSV).")
+    else:
+        df = pd.read_csv(arquivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+
+    df.columns = [str(coluna).strip().lower() for coluna in df.columns]
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+
+    for coluna in COLUNAS_OPCIONAIS:
+        if coluna not in df.columns:
+            df[coluna] = None
+    return df[COLUNAS_OBRIGATORIAS + COLUNAS_OPCIONAIS]
+
+
+def validar_hortas(df):
+    """Separa linhas válidas e inválidas sem iterar linha a linha.
+
+    Retorna (válidas, erros), onde ``erros`` tem a linha da planilha e o motivo.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = df.copy()
+    texto = ["nome_horta", "especie", "contato", "endereco", "email", "foto"]
+    df[texto] = df[texto].apply(lambda coluna: coluna.fillna("").astype(str).str.strip())
+    df["dias_colheita"] = pd.to_numeric(df["dias_colheita"], errors="coerce")
+    df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
+    df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
+    df["data_plantio"] = df["data_plantio"].str.strip().replace("", np.nan)
+    plantio = pd.to_datetime(df["data_plantio"], format="ISO8601", errors="coerce")
+
+    regras = {
+        "campo obrigatório vazio": (df[["nome_horta", "especie", "contato", "endereco", "email"]] == "").any(axis=1),
+        "dias_colheita deve ser um inteiro >= 1": ~(df["dias_colheita"] >= 1) | (df["dias_colheita"] % 1 != 0),
+        "email inválido": ~df["email"].str.contains("@", regex=False),
+        "latitude fora de -90..90": df["latitude"].notna() & ~df["latitude"].between(-90, 90),
+        "longitude fora de -180..180": df["longitude"].notna() & ~df["longitude"].between(-180, 180),
+        "data_plantio deve estar no formato AAAA-MM-DD": df["data_plantio"].notna() & plantio.isna(),
+    }
+
+    motivos = pd.Series("", index=df.index)
+    for motivo, falhou in regras.items():
+        motivos = motivos.where(~falhou, np.where(motivos == "", motivo, motivos + "; " + motivo))
+
+    invalidas = motivos != ""
+    # +2: cabeçalho e numeração a partir de 1, como na planilha
+    erros = pd.DataFrame({"linha": df.index[invalidas] + 2, "motivo": motivos[invalidas]})
+    validas = df[~invalidas].copy()
+    validas["dias_colheita"] = validas["dias_colheita"].astype(int)
+    validas["data_plantio"] = plantio[~invalidas].dt.strftime("%Y-%m-%d")
+    return validas, erros
+
+
+def _salvar_fotos_do_zip(arquivo_zip, nomes):
+    """Grava as fotos do zip citadas em ``nomes``; retorna {nome: caminho salvo}."""
+    salvas = {}
+    with zipfile.ZipFile(arquivo_zip) as zf:
+        por_nome = {os.path.basename(info.filename).lower(): info for info in zf.infolist() if not info.is_dir()}
+        for nome in set(nomes):
+            info = por_nome.get(os.path.basename(nome).lower())
+            if not nome or info is None:
+                continue
+            try:
+                # Nome derivado do conteúdo: reimportar a mesma foto não duplica o arquivo
+                salvas[nome] = salvar_conteudo(zf.read(info), UPLOAD_FOLDER)
+            except Exception:
+                continue
+    return salvas
+
+
+def preparar_hortas(df, arquivo_zip=None):
+    """Valida, geocodifica e grava as fotos do zip, sem tocar no banco.
+
+    É a parte lenta da importação (leitura do zip, derivados com Pillow,
+    geocodificação), por isso fica fora da transação. As fotos gravadas
+    antes das linhas que as citam ficam protegidas pela carência do coletor.
+    Retorna (válidas, erros), com a coluna ``foto`` já com o caminho salvo.
+    """
+    validas, erros = validar_hortas(df)
+    if validas.empty:
+        return validas, erros
+
+    # Geocodifica uma vez por endereço distinto
+    sem_coordenadas = validas["latitude"].isna() | validas["longitude"].isna()
+    enderecos = validas.loc[sem_coordenadas, "endereco"].unique()
+    coordenadas = {endereco: geocodificar(endereco) or (None, None) for endereco in enderecos}
+    validas.loc[sem_coordenadas, "latitude"] = validas.loc[sem_coordenadas, "endereco"].map(lambda e: coordenadas[e][0])
+    validas.loc[sem_coordenadas, "longitude"] = validas.loc[sem_coordenadas, "endereco"].map(lambda e: coordenadas[e][1])
+
+    fotos = _salvar_fotos_do_zip(arquivo_zip, validas["foto"]) if arquivo_zip is not None else {}
+    validas["foto"] = validas["foto"].map(lambda nome: fotos.get(nome, ""))
+    return validas, erros
+
+
+def gravar_hortas(conn, validas, usuario_padrao_id):
+    """Insere as hortas já preparadas na transação de ``conn``. Retorna quantas.
+
+    O dono de cada horta é o usuário com o mesmo email; sem ele, ``usuario_padrao_id``.
+    As fotos têm os metadados registrados e as hortas novas, as
+    correspondências com demandas calculadas na mesma transação.
+    """
+    import pandas as pd
+
+    if validas.empty:
+        return 0
+
+    usuarios = pd.DataFrame(
+        conn.execute("SELECT user_id, lower(email) AS email FROM users").fetchall(),
+        columns=["user_id", "email_usuario"],
+    ).drop_duplicates("email_usuario")
+    validas = validas.assign(email_usuario=validas["email"].str.lower())
+    validas = validas.merge(usuarios, on="email_usuario", how="left")
+    validas["user_id"] = validas["user_id"].fillna(usuario_padrao_id).astype(int)
+
+    for caminho in set(validas["foto"]) - {""}:
+        registrar_imagem(conn, caminho)
+
+    validas = validas.astype(object).where(validas.notna(), None)
+    linhas = validas[[
+        "nome_horta", "user_id", "foto", "especie", "dias_colheita", "data_plantio",
+        "contato", "endereco", "email", "latitude", "longitude",
+    ]].itertuples(index=False, name=None)
+
+    ultima = conn.execute("SELECT COALESCE(MAX(horta_id), 0) FROM hortas").fetchone()[0]
+    conn.executemany("""
+        INSERT INTO hortas (nome_horta, usuario_id, foto, especie, dias_colheita, data_plantio,
+                            contato, endereco, email, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, linhas)
+    novas = conn.execute("SELECT horta_id FROM hortas WHERE horta_id > ?", (ultima,)).fetchall()
+    corresponder_hortas(conn, [horta["horta_id"] for horta in novas])
+    return len(validas)
+
+
+def importar_hortas(banco, df, usuario_padrao_id, arquivo_zip=None):
+    """Importa as hortas válidas de ``df``. Retorna (quantidade inserida, DataFrame de erros).
+
+    Tudo ou nada: as linhas válidas entram numa única transação, aberta só
+    depois de validar, geocodificar e gravar as fotos.
+    """
+    validas, erros = preparar_hortas(df, arquivo_zip)
+    if validas.empty:
+        return 0, erros
+    with banco.transacao("hortas", "imagens", "correspondencias") as conn:
+        return gravar_hortas(conn, validas, usuario_padrao_id), erros
+
+
+# ========================== EXPORTAÇÃO ==========================
+
+def _blocos(conn, sql, tamanho=TAMANHO_BLOCO):
+    cursor = conn.execute(sql)
+    colunas = [descricao[0] for descricao in cursor.description]
+    yield colunas
+    while True:
+        linhas = cursor.fetchmany(tamanho)
+        if not linhas:
+            break
+        yield linhas
+
+
+def exportar_csv(conn, tipo, destino):
+    """Escreve o CSV de ``tipo`` no arquivo texto ``destino``, bloco a bloco."""
+    blocos = _blocos(conn, EXPORTACOES[tipo])
+    escritor = csv.writer(destino)
+    escritor.writerow(next(blocos))
+    total = 0
+    for linhas in blocos:
+        escritor.writerows(tuple(linha) for linha in linhas)
+        total += len(linhas)
+    return total
+
+
+def exportar_parquet(conn, tipo, destino):
+    """Escreve o Parquet de ``tipo`` em ``destino``, um row group por bloco."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Para exportar Parquet instale o pacote pyarrow (ou use CSV).")
+
+    blocos = _blocos(conn, EXPORTACOES[tipo])
+    colunas = next(blocos)
+    esquema = pa.schema([
+        (coluna, pa.int64() if coluna in COLUNAS_INTEIRAS else pa.float64() if coluna in COLUNAS_REAIS else pa.string())
+        for coluna in colunas
+    ])
+
+    total = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for linhas in blocos:
+            dados = {coluna: [linha[i] for linha in linhas] for i, coluna in enumerate(colunas)}
+            escritor.write_table(pa.table(dados, schema=esquema))
+            total += len(linhas)
+    return total
+
+
+def exportar_para_arquivo(conn, tipo, formato):
+    """Exporta para um arquivo temporário e o devolve aberto para leitura."""
+    temporario = tempfile.TemporaryFile()
+    if formato == "parquet":
+        exportar_parquet(conn, tipo, temporario)
+    else:
+        texto = io.TextIOWrapper(temporario, encoding="utf-8", newline="", write_through=True)
+        exportar_csv(conn, tipo, texto)
+        texto.detach()
+    temporario.seek(0)
+    return temporario
+
+
+if __name__ == "__main__":
+    from banco import DATABASE, GerenciadorBanco, migrar
+
+    banco = GerenciadorBanco(DATABASE)
+    migrar(banco)
+
+    if len(sys.argv) == 4 and sys.argv[1] == "exportar" and sys.argv[2] in EXPORTACOES:
+        _, _, tipo, saida = sys.argv
+        with banco.conexao() as conn:
+            if saida.endswith(".parquet"):
+                total = exportar_parquet(conn, tipo, saida)
+            else:
+                with open(saida, "w", encoding="utf-8", newline="") as f:
+                    total = exportar_csv(conn, tipo, f)
+        print(f"{total} linha(s) exportada(s) para {saida}.")
+
+    elif len(sys.argv) in (3, 4) and sys.argv[1] == "importar":
+        planilha = sys.argv[2]
+        fotos = sys.argv[3] if len(sys.argv) == 4 else None
+        with open(planilha, "rb") as f:
+            df = ler_planilha(f, planilha)
+        with banco.conexao() as conn:
+            admin = conn.execute("SELECT user_id FROM users WHERE is_admin = 1 ORDER BY user_id").fetchone()
+        inseridas, erros = importar_hortas(banco, df, admin["user_id"], fotos)
+        print(f"{inseridas} horta(s) importada(s), {len(erros)} linha(s) com erro.")
+        for linha, motivo in erros.itertuples(index=False):
+            print(f"  linha {linha}: {motivo}")
+
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,642 @@
+"""Pipeline de imagens do Campo Cidade.
+
+Cada upload é normalizado (orientação EXIF, RGB) e gravado em versões de
+tamanho limitado:
+
+- ``full``: JPEG no próprio caminho salvo no banco
+- ``card`` e ``thumb``: WebP (ou JPEG, se o Pillow não tiver WebP) ao lado,
+  ex.: uploads/3f/a9/3fa9….card.webp
+
+O nome vem do SHA-256 dos bytes enviados, em subpastas pelos 4 primeiros
+dígitos (``salvar_conteudo``): fotos idênticas são gravadas uma vez e um
+caminho nunca muda de conteúdo, então pode ser guardado em cache à vontade.
+Triggers contam quantas linhas de users/hortas/feed_hortas citam cada foto
+(tabela ``referencias_imagens``) e o coletor de lixo apaga as que ninguém
+cita mais. Uploads antigos (uploads/horta_1.jpg) continuam válidos.
+
+Os metadados de cada arquivo (bytes, dimensões, mtime, SHA-256) vão para a
+tabela ``imagens`` no upload. As telas escolhem o derivado por esses
+metadados, sem consultar o disco a cada linha, e leem os bytes por um LRU em
+memória limitado pelo total de bytes. Uma verificação periódica em segundo
+plano marca arquivos ausentes ou vazios e registra uploads antigos.
+
+Para gerar os derivados das fotos antigas e para verificar os arquivos:
+
+    python midia.py backfill
+    python midia.py verificar
+    python midia.py coletar [--simular]
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+UPLOAD_FOLDER = "uploads"
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png")
+
+# Maior lado (em pixels) de cada derivado, do menor para o maior
+TAMANHOS_DERIVADOS = {
+    "thumb": 200,
+    "card": 640,
+    "full": 1600,
+}
+QUALIDADE_JPEG = 85
+QUALIDADE_WEBP = 80
+# Densidade de pixels assumida para telas de alta resolução
+FATOR_DENSIDADE = 2
+
+# Extensões possíveis dos derivados, na ordem em que são procuradas
+EXTENSOES_DERIVADO = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+# Funções f(caminho, segundos, bytes) chamadas a cada leitura do disco
+OBSERVADORES_LEITURA = []
+
+# Total de bytes de imagem mantidos em memória por processo
+CACHE_IMAGENS_BYTES = int(os.environ.get("CAMPOCIDADE_CACHE_IMAGENS_MB", 64)) * 1024 * 1024
+# Verificação dos arquivos: espera após o início e intervalo, em segundos
+ATRASO_VERIFICACAO = 30
+INTERVALO_VERIFICACAO = 600
+# Idade mínima (segundos) de um arquivo sem referências para o coletor apagá-lo:
+# o upload é gravado antes da linha que o cita
+CARENCIA_COLETA = 3600
+
+
+@lru_cache(maxsize=None)
+def formato_derivado():
+    """WebP se o Pillow tiver suporte, senão JPEG.
+
+    O Pillow só é importado aqui e na geração, para que as telas que apenas
+    exibem imagens não paguem a importação.
+    """
+    from PIL import features
+
+    return "WEBP" if features.check("webp") else "JPEG"
+
+
+def normalizar_caminho(caminho):
+    """Converte caminhos gravados no Windows (uploads\\x.jpg) para o SO atual."""
+    if not caminho:
+        return caminho
+    return caminho.replace("\\", os.sep).replace("/", os.sep)
+
+
+def _caminho_variante(caminho, tamanho, formato):
+    base, _ = os.path.splitext(caminho)
+    return f"{base}.{tamanho}{EXTENSOES_DERIVADO[formato]}"
+
+
+def eh_derivado(caminho):
+    nome = os.path.basename(caminho)
+    return any(f".{tamanho}." in nome for tamanho in TAMANHOS_DERIVADOS if tamanho != "full")
+
+
+def escolher_derivado(largura):
+    """Menor derivado que cobre a largura exibida (None = largura do container)."""
+    if largura is None:
+        return "full"
+    necessario = largura * FATOR_DENSIDADE
+    for tamanho, lado in TAMANHOS_DERIVADOS.items():
+        if lado >= necessario:
+            return tamanho
+    return "full"
+
+
+def caminho_derivado(caminho, largura=None):
+    """Caminho do menor derivado existente para a largura pedida.
+
+    Cai para a imagem original quando o derivado ainda não foi gerado.
+    """
+    caminho = normalizar_caminho(caminho)
+    if not caminho:
+        return caminho
+
+    tamanho = escolher_derivado(largura)
+    if tamanho != "full":
+        for formato in EXTENSOES_DERIVADO:
+            variante = _caminho_variante(caminho, tamanho, formato)
+            if os.path.exists(variante):
+                return variante
+    return caminho
+
+
+def _precisa_normalizar(imagem):
+    """A imagem é maior que ``full`` ou depende da orientação EXIF."""
+    orientacao = imagem.getexif().get(0x0112, 1)
+    return orientacao != 1 or max(imagem.size) > TAMANHOS_DERIVADOS["full"]
+
+
+def _abrir_normalizada(dados):
+    from PIL import Image, ImageOps
+
+    imagem = Image.open(io.BytesIO(dados))
+    imagem = ImageOps.exif_transpose(imagem)
+
+    if imagem.mode in ("RGBA", "LA", "P"):
+        imagem = imagem.convert("RGBA")
+        fundo = Image.new("RGB", imagem.size, (255, 255, 255))
+        fundo.paste(imagem, mask=imagem.getchannel("A"))
+        return fundo
+    return imagem.convert("RGB")
+
+
+def _gravar_atomico(imagem, caminho, formato, qualidade):
+    # Temporário próprio da thread: dois uploads da mesma foto podem correr juntos
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    imagem.save(temporario, format=formato, quality=qualidade, optimize=True)
+    os.replace(temporario, caminho)
+
+
+def gerar_derivados(dados, caminho, regravar_full=True):
+    """Grava ``full`` em ``caminho`` e os derivados menores ao lado.
+
+    Com ``regravar_full=False`` o arquivo em ``caminho`` só é reescrito se
+    estiver fora do limite de tamanho ou rotacionado via EXIF.
+    Retorna o caminho da imagem ``full``.
+    """
+    from PIL import Image
+
+    if not regravar_full:
+        regravar_full = _precisa_normalizar(Image.open(io.BytesIO(dados)))
+    imagem = _abrir_normalizada(dados)
+    formato_menores = formato_derivado()
+
+    for tamanho, lado in sorted(TAMANHOS_DERIVADOS.items(), key=lambda item: -item[1]):
+        if tamanho == "full" and not regravar_full:
+            continue
+
+        copia = imagem.copy()
+        copia.thumbnail((lado, lado), Image.LANCZOS)
+
+        if tamanho == "full":
+            formato = "PNG" if caminho.lower().endswith(".png") else "JPEG"
+            _gravar_atomico(copia, caminho, formato, QUALIDADE_JPEG)
+        else:
+            qualidade = QUALIDADE_WEBP if formato_menores == "WEBP" else QUALIDADE_JPEG
+            variante = _caminho_variante(caminho, tamanho, formato_menores)
+            _gravar_atomico(copia, variante, formato_menores, qualidade)
+
+    return caminho
+
+
+def salvar_imagem(dados, caminho):
+    """Processa os bytes enviados e grava os derivados. Retorna o caminho salvo."""
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    return gerar_derivados(bytes(dados), caminho)
+
+
+def caminho_conteudo(sha256, pasta=UPLOAD_FOLDER):
+    """uploads/ab/cd/abcd….jpg: duas subpastas evitam diretórios enormes."""
+    return f"{pasta}/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg"
+
+
+def salvar_conteudo(dados, pasta=UPLOAD_FOLDER):
+    """Grava a foto com o nome dado pelo SHA-256 dos bytes. Retorna o caminho.
+
+    Se a mesma foto já foi enviada, nada é reprocessado.
+    """
+    dados = bytes(dados)
+    caminho = caminho_conteudo(hashlib.sha256(dados).hexdigest(), pasta)
+    if os.path.exists(normalizar_caminho(caminho)):
+        # Renova a carência: o coletor pode estar prestes a apagá-la
+        os.utime(normalizar_caminho(caminho))
+        return caminho
+    salvar_imagem(dados, normalizar_caminho(caminho))
+    return caminho
+
+
+# ========================== LEITURA ==========================
+
+class CacheImagens:
+    """LRU de bytes de imagem limitado pelo total de bytes guardados."""
+
+    def __init__(self, max_bytes=CACHE_IMAGENS_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            dados = self._entradas.get(chave)
+            if dados is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return dados
+
+    def guardar(self, chave, dados):
+        # Uma imagem enorme não pode esvaziar o cache sozinha
+        if len(dados) > self.max_bytes // 4:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self.total_bytes -= len(anterior)
+            self._entradas[chave] = dados
+            self.total_bytes += len(dados)
+            while self.total_bytes > self.max_bytes:
+                _, removida = self._entradas.popitem(last=False)
+                self.total_bytes -= len(removida)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.total_bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+                "entradas": len(self._entradas),
+                "bytes": self.total_bytes,
+            }
+
+
+cache_imagens = CacheImagens()
+
+
+def ler_imagem(caminho, versao=None):
+    """Bytes do arquivo, informando o tempo de leitura do disco aos observadores.
+
+    Com ``versao`` (o SHA-256 registrado) os bytes passam pelo ``cache_imagens``;
+    um novo upload no mesmo caminho tem outro hash e não reaproveita o antigo.
+    """
+    if versao is not None:
+        dados = cache_imagens.obter((caminho, versao))
+        if dados is not None:
+            return dados
+
+    inicio = time.perf_counter()
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    segundos = time.perf_counter() - inicio
+    for observador in list(OBSERVADORES_LEITURA):
+        try:
+            observador(caminho, segundos, len(dados))
+        except Exception:
+            pass
+
+    if versao is not None:
+        cache_imagens.guardar((caminho, versao), dados)
+    return dados
+
+
+def escolher_variante(variantes, largura=None):
+    """Linha de ``imagens`` a exibir: o derivado pedido ou o mais próximo em bom estado."""
+    ordem = list(TAMANHOS_DERIVADOS)
+    posicao = ordem.index(escolher_derivado(largura))
+    # Primeiro os maiores (qualidade), depois os menores
+    for tamanho in ordem[posicao:] + ordem[:posicao][::-1]:
+        variante = variantes.get(tamanho)
+        if variante is not None and variante["status"] == "ok":
+            return variante
+    return None
+
+
+def bytes_para_exibir(caminho, metadados, largura=None):
+    """Bytes da foto para ``st.image``, ou None se ela não estiver disponível.
+
+    ``metadados`` vem de ``metadados_fotos``. Uma foto ainda sem registro
+    (upload antigo não verificado) é procurada no disco como antes.
+    """
+    if not caminho:
+        return None
+
+    variantes = metadados.get(chave_imagem(caminho))
+    if variantes is None:
+        arquivo = caminho_derivado(caminho, largura)
+        if not os.path.exists(arquivo) or os.path.getsize(arquivo) == 0:
+            return None
+        return ler_imagem(arquivo)
+
+    variante = escolher_variante(variantes, largura)
+    if variante is None:
+        return None
+    try:
+        return ler_imagem(normalizar_caminho(variante["caminho"]), variante["sha256"])
+    except FileNotFoundError:
+        return None  # sumiu depois da última verificação
+
+
+# ========================== METADADOS ==========================
+
+SQL_REGISTRAR = """
+    INSERT INTO imagens (caminho, original, tamanho, bytes, largura, altura, mtime, sha256, status, verificado_em)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (caminho) DO UPDATE SET
+        original = excluded.original, tamanho = excluded.tamanho, bytes = excluded.bytes,
+        largura = excluded.largura, altura = excluded.altura, mtime = excluded.mtime,
+        sha256 = excluded.sha256, status = excluded.status, verificado_em = excluded.verificado_em
+"""
+
+
+def chave_imagem(caminho):
+    """Caminho como gravado na tabela ``imagens``: sempre com "/"."""
+    return normalizar_caminho(caminho).replace(os.sep, "/")
+
+
+def _agora():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def metadados_arquivo(caminho):
+    """(bytes, largura, altura, mtime, sha256, status) do arquivo em disco."""
+    mtime = os.stat(caminho).st_mtime
+    with open(caminho, "rb") as f:
+        dados = f.read()
+
+    largura = altura = None
+    if dados:
+        try:
+            from PIL import Image
+
+            largura, altura = Image.open(io.BytesIO(dados)).size  # só lê o cabeçalho
+        except Exception:
+            pass
+    return len(dados), largura, altura, mtime, hashlib.sha256(dados).hexdigest(), "ok" if dados else "vazio"
+
+
+def _linhas_imagem(caminho):
+    """Linhas de ``imagens`` para a foto ``caminho`` e seus derivados em disco."""
+    caminho = normalizar_caminho(caminho)
+    original = chave_imagem(caminho)
+    linhas = []
+    for tamanho in TAMANHOS_DERIVADOS:
+        if tamanho == "full":
+            candidatos = [caminho]
+        else:
+            candidatos = [_caminho_variante(caminho, tamanho, formato) for formato in EXTENSOES_DERIVADO]
+        for candidato in candidatos:
+            if os.path.exists(candidato):
+                linhas.append((chave_imagem(candidato), original, tamanho, *metadados_arquivo(candidato), _agora()))
+                break
+    return linhas
+
+
+def registrar_imagem(conn, caminho):
+    """Grava os metadados da foto e dos derivados; use logo após salvar_imagem."""
+    linhas = _linhas_imagem(caminho)
+    conn.execute("DELETE FROM imagens WHERE original = ?", (chave_imagem(caminho),))
+    conn.executemany(SQL_REGISTRAR, linhas)
+    return len(linhas)
+
+
+def metadados_fotos(conn, caminhos):
+    """{original: {tamanho: linha}} das fotos de uma página, numa consulta por bloco."""
+    chaves = sorted({chave_imagem(caminho) for caminho in caminhos if caminho})
+    metadados = {}
+    for inicio in range(0, len(chaves), 500):
+        bloco = chaves[inicio:inicio + 500]
+        linhas = conn.execute(f"""
+            SELECT caminho, original, tamanho, bytes, sha256, status
+            FROM imagens WHERE original IN ({", ".join("?" * len(bloco))})
+        """, bloco).fetchall()
+        for linha in linhas:
+            metadados.setdefault(linha["original"], {})[linha["tamanho"]] = linha
+    return metadados
+
+
+# ========================== VERIFICAÇÃO ==========================
+
+def verificar_imagens(banco, pasta=UPLOAD_FOLDER):
+    """Confere o disco contra a tabela ``imagens``. Retorna a contagem por situação.
+
+    Marca arquivos ausentes ou vazios, refaz os metadados dos alterados fora
+    do app e registra as fotos citadas no banco ou presentes em ``pasta``
+    que ainda não têm registro. Toda a leitura do disco acontece fora da
+    transação de escrita.
+    """
+    with banco.conexao() as conn:
+        registradas = conn.execute(
+            "SELECT caminho, original, tamanho, bytes, mtime, status FROM imagens"
+        ).fetchall()
+        citadas = {chave_imagem(linha[0]) for linha in conn.execute("""
+            SELECT foto FROM hortas WHERE foto <> ''
+            UNION SELECT foto FROM feed_hortas WHERE foto <> ''
+            UNION SELECT foto_perfil FROM users WHERE foto_perfil <> ''
+        """).fetchall()}
+
+    contagem = Counter()
+    mudancas, refeitas = [], []
+    for linha in registradas:
+        arquivo = normalizar_caminho(linha["caminho"])
+        try:
+            estado = os.stat(arquivo)
+        except FileNotFoundError:
+            status = "ausente"
+        else:
+            status = "vazio" if estado.st_size == 0 else "ok"
+            if status == "ok" and (estado.st_size != linha["bytes"] or estado.st_mtime != linha["mtime"]):
+                refeitas.append((linha["caminho"], linha["original"], linha["tamanho"], *metadados_arquivo(arquivo), _agora()))
+                contagem["alterado"] += 1
+                continue
+        contagem[status] += 1
+        if status != linha["status"]:
+            mudancas.append((status, _agora(), linha["caminho"]))
+
+    conhecidas = {linha["original"] for linha in registradas}
+    for caminho in _originais_em_disco(pasta):
+        citadas.add(chave_imagem(caminho))
+
+    novas = []
+    for original in sorted(citadas - conhecidas):
+        linhas = _linhas_imagem(original)
+        if not linhas:
+            # Citada no banco, mas sem arquivo: as telas já sabem sem procurar
+            linhas = [(original, original, "full", 0, None, None, None, None, "ausente", _agora())]
+        novas.extend(linhas)
+        contagem["registrado"] += 1
+
+    if mudancas or refeitas or novas:
+        with banco.transacao("imagens") as conn:
+            conn.executemany("UPDATE imagens SET status = ?, verificado_em = ? WHERE caminho = ?", mudancas)
+            conn.executemany(SQL_REGISTRAR, refeitas + novas)
+    return dict(contagem)
+
+
+def _originais_em_disco(pasta):
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            if nome.lower().endswith(EXTENSOES_IMAGEM) and not eh_derivado(caminho):
+                yield caminho
+
+
+def _variantes_em_disco(caminho):
+    yield caminho
+    for tamanho in TAMANHOS_DERIVADOS:
+        if tamanho != "full":
+            for formato in EXTENSOES_DERIVADO:
+                yield _caminho_variante(caminho, tamanho, formato)
+
+
+def copiar_foto(caminho, pasta_origem, pasta_destino):
+    """Copia a foto e os derivados para ``pasta_destino``, no mesmo caminho relativo.
+
+    Retorna o novo caminho (com "/"), ou None se a foto estiver fora de
+    ``pasta_origem`` ou não existir. Arquivos já copiados não são regravados.
+    """
+    caminho = normalizar_caminho(caminho)
+    relativo = os.path.relpath(os.path.abspath(caminho), os.path.abspath(pasta_origem))
+    if relativo.startswith(os.pardir) or not os.path.exists(caminho):
+        return None
+
+    destino = os.path.join(pasta_destino, relativo)
+    for arquivo in _variantes_em_disco(caminho):
+        copia = os.path.join(pasta_destino, os.path.relpath(os.path.abspath(arquivo), os.path.abspath(pasta_origem)))
+        if os.path.exists(arquivo) and not os.path.exists(copia):
+            os.makedirs(os.path.dirname(copia), exist_ok=True)
+            shutil.copy2(arquivo, f"{copia}.tmp")
+            os.replace(f"{copia}.tmp", copia)
+    return chave_imagem(destino)
+
+
+def coletar_lixo(banco, pasta=UPLOAD_FOLDER, carencia=CARENCIA_COLETA, simular=False, apenas=None):
+    """Apaga as fotos (e derivados) que nenhuma linha do banco cita mais.
+
+    Só considera arquivos sem modificação há ``carencia`` segundos e confere
+    a contagem de novo, dentro da transação, antes de apagar cada um.
+    Também remove temporários esquecidos. Com ``apenas`` (caminhos de fotos
+    que acabaram de perder referências), examina só essas, sem varrer a
+    pasta. Retorna os caminhos removidos.
+    """
+    with banco.conexao() as conn:
+        citadas = {linha[0] for linha in conn.execute(
+            "SELECT original FROM referencias_imagens WHERE referencias > 0"
+        ).fetchall()}
+
+    limite = time.time() - carencia
+    candidatas = []
+    if apenas is not None:
+        raiz_pasta = os.path.abspath(pasta) + os.sep
+        for caminho in {normalizar_caminho(caminho) for caminho in apenas if caminho}:
+            if (os.path.abspath(caminho).startswith(raiz_pasta) and os.path.exists(caminho)
+                    and caminho.lower().endswith(EXTENSOES_IMAGEM) and not eh_derivado(caminho)
+                    and chave_imagem(caminho) not in citadas and os.path.getmtime(caminho) < limite):
+                candidatas.append(caminho)
+    else:
+        for raiz, _, nomes in os.walk(pasta):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+                if nome.endswith(".tmp") and os.path.getmtime(caminho) < limite and not simular:
+                    os.remove(caminho)
+                elif (nome.lower().endswith(EXTENSOES_IMAGEM) and not eh_derivado(caminho)
+                      and chave_imagem(caminho) not in citadas and os.path.getmtime(caminho) < limite):
+                    candidatas.append(caminho)
+    if simular:
+        return [chave_imagem(caminho) for caminho in candidatas]
+
+    removidas = []
+    for caminho in candidatas:
+        chave = chave_imagem(caminho)
+        with banco.transacao("imagens") as conn:
+            linha = conn.execute("SELECT referencias FROM referencias_imagens WHERE original = ?", (chave,)).fetchone()
+            if (linha and linha[0] > 0) or not os.path.exists(caminho) or os.path.getmtime(caminho) >= limite:
+                continue  # citada ou reenviada enquanto varríamos
+            conn.execute("DELETE FROM imagens WHERE original = ?", (chave,))
+            conn.execute("DELETE FROM referencias_imagens WHERE original = ?", (chave,))
+            for arquivo in _variantes_em_disco(caminho):
+                if os.path.exists(arquivo):
+                    os.remove(arquivo)
+        # Subpastas do hash que ficaram vazias
+        subpasta = os.path.dirname(caminho)
+        while os.path.abspath(subpasta) != os.path.abspath(pasta) and not os.listdir(subpasta):
+            os.rmdir(subpasta)
+            subpasta = os.path.dirname(subpasta)
+        removidas.append(chave)
+    return removidas
+
+
+_verificador = None
+_lock_verificador = threading.Lock()
+
+
+def iniciar_verificacao(banco, pasta=UPLOAD_FOLDER, intervalo=INTERVALO_VERIFICACAO, atraso=ATRASO_VERIFICACAO):
+    """Thread que roda ``verificar_imagens`` e ``coletar_lixo`` periodicamente (uma por processo)."""
+    global _verificador
+
+    def verificar():
+        time.sleep(atraso)
+        while True:
+            try:
+                verificar_imagens(banco, pasta)
+                coletar_lixo(banco, pasta)
+            except Exception as e:
+                print(f"verificação de imagens falhou: {e}", file=sys.stderr)
+            time.sleep(intervalo)
+
+    with _lock_verificador:
+        if _verificador is None:
+            _verificador = threading.Thread(target=verificar, name="verificador-imagens", daemon=True)
+            _verificador.start()
+    return _verificador
+
+
+# ========================== BACKFILL ==========================
+
+def backfill(pasta=UPLOAD_FOLDER, banco=None):
+    """Gera os derivados das imagens já existentes em ``pasta``.
+
+    Com ``banco``, os metadados de cada imagem processada são registrados.
+    """
+    processadas = 0
+    for nome in sorted(os.listdir(pasta)):
+        caminho = os.path.join(pasta, nome)
+        if not nome.lower().endswith(EXTENSOES_IMAGEM) or eh_derivado(caminho):
+            continue
+        if os.path.getsize(caminho) == 0:
+            print(f"ignorado (vazio): {caminho}")
+            continue
+
+        try:
+            with open(caminho, "rb") as f:
+                gerar_derivados(f.read(), caminho, regravar_full=False)
+        except Exception as e:
+            print(f"erro em {caminho}: {e}")
+            continue
+
+        if banco is not None:
+            with banco.transacao("imagens") as conn:
+                registrar_imagem(conn, caminho)
+        processadas += 1
+        print(f"ok: {caminho}")
+
+    print(f"{processadas} imagem(ns) processada(s).")
+    return processadas
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("backfill", "verificar", "coletar"):
+        print("uso: python midia.py backfill|verificar|coletar [--simular] [pasta]")
+        sys.exit(1)
+    simular = "--simular" in sys.argv
+    argumentos = [argumento for argumento in sys.argv[2:] if argumento != "--simular"]
+    pasta = argumentos[0] if argumentos else UPLOAD_FOLDER
+
+    from banco import DATABASE, GerenciadorBanco, migrar
+
+    banco = GerenciadorBanco(DATABASE)
+    migrar(banco)
+    if sys.argv[1] == "backfill":
+        backfill(pasta, banco)
+    elif sys.argv[1] == "coletar":
+        removidas = coletar_lixo(banco, pasta, simular=simular)
+        for chave in removidas:
+            print(f"{'seria removida' if simular else 'removida'}: {chave}")
+        print(f"{len(removidas)} foto(s) sem referência.")
+    else:
+        for situacao, quantidade in sorted(verificar_imagens(banco, pasta).items()):
+            print(f"{situacao}: {quantidade}")
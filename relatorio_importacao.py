@@ -0,0 +1,86 @@
+"""Relatório do custo de importação do app.
+
+Lê os imports de nível de módulo do app.py, mede cada um com
+``python -X importtime`` em um processo novo e mostra o tempo acumulado.
+Os módulos importados sob demanda (pandas, matplotlib) são medidos à parte,
+para mostrar quanto deixou de pesar no início de cada processo.
+
+    python relatorio_importacao.py
+    python relatorio_importacao.py --sob-demanda pandas matplotlib.pyplot PIL.Image
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ARQUIVO_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+SOB_DEMANDA = ["pandas", "matplotlib.pyplot", "PIL.Image"]
+
+
+def modulos_importados(caminho=ARQUIVO_APP):
+    """Módulos importados no nível de módulo do arquivo, em ordem."""
+    with open(caminho, encoding="utf-8") as f:
+        arvore = ast.parse(f.read())
+
+    modulos = []
+    for no in arvore.body:
+        if isinstance(no, ast.Import):
+            modulos.extend(alias.name for alias in no.names)
+        elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+            modulos.append(no.module)
+    return list(dict.fromkeys(modulos))
+
+
+def medir(modulos):
+    """Tempo acumulado (ms) de cada módulo, importados em sequência num processo novo.
+
+    Um módulo já carregado por um anterior da lista custa 0 ms.
+    """
+    codigo = "; ".join(f"import {modulo}" for modulo in modulos)
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=os.path.dirname(ARQUIVO_APP),
+        capture_output=True,
+        text=True,
+    )
+
+    tempos = {}
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, nome = linha[len("import time:"):].split("|")
+        # Só os módulos sem recuo foram importados diretamente pelo código
+        if nome.startswith(" ") and not nome.startswith("  "):
+            tempos[nome.strip()] = int(cumulativo) / 1000
+
+    if resultado.returncode != 0:
+        print(resultado.stderr.strip().splitlines()[-1], file=sys.stderr)
+    # "import a.b" aparece como duas entradas de topo: "a" e "a.b"
+    return {
+        modulo: sum(ms for nome, ms in tempos.items() if modulo == nome or modulo.startswith(f"{nome}."))
+        for modulo in modulos
+    }
+
+
+def imprimir(titulo, tempos):
+    print(f"\n{titulo}")
+    for modulo, ms in sorted(tempos.items(), key=lambda item: -item[1]):
+        print(f"  {ms:9.1f} ms  {modulo}")
+    print(f"  {sum(tempos.values()):9.1f} ms  TOTAL")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sob-demanda", nargs="*", default=SOB_DEMANDA,
+                        help="módulos carregados só pelas páginas que precisam deles")
+    args = parser.parse_args()
+
+    imprimir("Importações no início do app.py:", medir(modulos_importados()))
+    if args.sob_demanda:
+        # Cada um em um processo próprio, como quando uma página o importa
+        sob_demanda = {}
+        for modulo in args.sob_demanda:
+            sob_demanda.update(medir([modulo]))
+        imprimir("Importações sob demanda (fora do início, cada uma isolada):", sob_demanda)
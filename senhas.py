@@ -0,0 +1,161 @@
+"""Hash e verificação de senhas fora da thread do Streamlit.
+
+O scrypt/pbkdf2 do Werkzeug custa dezenas a centenas de milissegundos de
+CPU por chamada. Para que uma rajada de logins não trave as outras sessões,
+as chamadas vão para um pool de processos limitado e compartilhado pelo
+processo do app. O ``Limitador`` corta excesso de tentativas por email/IP
+antes que elas cheguem ao pool.
+
+Parâmetros configuráveis por variável de ambiente:
+
+- ``CAMPOCIDADE_HASH_METODO``: método do Werkzeug (padrão ``scrypt:32768:8:1``).
+  Ao mudar, as senhas antigas são refeitas no próximo login bem-sucedido.
+- ``CAMPOCIDADE_HASH_PROCESSOS``: tamanho do pool (padrão: até 4 CPUs).
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+METODO_HASH = os.environ.get("CAMPOCIDADE_HASH_METODO", "scrypt:32768:8:1")
+TAMANHO_SALT = 16
+PROCESSOS_HASH = int(os.environ.get("CAMPOCIDADE_HASH_PROCESSOS", min(4, os.cpu_count() or 1)))
+# Tarefas aguardando por processo antes de recusar novas chamadas
+FILA_POR_PROCESSO = 8
+TIMEOUT_HASH = 10
+
+# Tentativas permitidas por janela de tempo (segundos)
+JANELA_TENTATIVAS = 60
+MAX_TENTATIVAS_EMAIL = 5
+MAX_TENTATIVAS_IP = 20
+
+
+class PoolOcupado(RuntimeError):
+    """O pool de hash está com a fila cheia."""
+
+
+_executor = None
+_vagas = threading.BoundedSemaphore(PROCESSOS_HASH * FILA_POR_PROCESSO)
+_lock_executor = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock_executor:
+        if _executor is None:
+            # "spawn" evita copiar as threads do Streamlit para os filhos;
+            # os filhos só importam este módulo.
+            _executor = ProcessPoolExecutor(
+                max_workers=PROCESSOS_HASH,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+
+def iniciar_pool():
+    """Sobe todos os processos do pool de uma vez, em vez de no primeiro hash.
+
+    Os filhos "spawn" reimportam o ``__main__`` do processo pai; quem troca o
+    ``__main__`` depois (como o AppTest) deve chamar isto antes.
+    """
+    executor = _get_executor()
+    tarefas = [executor.submit(os.getpid) for _ in range(PROCESSOS_HASH)]
+    return len({tarefa.result(timeout=TIMEOUT_HASH) for tarefa in tarefas})
+
+
+def _executar(funcao, *args):
+    if not _vagas.acquire(timeout=TIMEOUT_HASH):
+        raise PoolOcupado("Servidor ocupado, tente novamente em instantes.")
+    try:
+        return _get_executor().submit(funcao, *args).result(timeout=TIMEOUT_HASH)
+    finally:
+        _vagas.release()
+
+
+def _gerar(senha, metodo):
+    return generate_password_hash(senha, method=metodo, salt_length=TAMANHO_SALT)
+
+
+def gerar_hash(senha):
+    """Gera o hash da senha no pool de processos."""
+    return _executar(_gerar, senha, METODO_HASH)
+
+
+def verificar_senha(senha_hash, senha):
+    """Confere a senha contra o hash no pool de processos."""
+    return _executar(check_password_hash, senha_hash, senha)
+
+
+def _metodo_completo(metodo):
+    """Método com os parâmetros padrão do Werkzeug preenchidos (como ele grava no hash).
+
+    ``"pbkdf2:sha256"`` vira ``"pbkdf2:sha256:<iterações padrão>"`` e
+    ``"scrypt"`` vira ``"scrypt:32768:8:1"``; métodos desconhecidos ficam como estão.
+    """
+    nome, *args = metodo.split(":")
+    if nome == "scrypt" and not args:
+        args = ["32768", "8", "1"]
+    elif nome == "pbkdf2":
+        args = (args or ["sha256"]) + [str(DEFAULT_PBKDF2_ITERATIONS)] * (len(args) < 2)
+    return ":".join([nome, *args])
+
+
+def precisa_rehash(senha_hash):
+    """O hash foi gerado com parâmetros diferentes dos configurados."""
+    return _metodo_completo(senha_hash.split("$", 1)[0]) != _metodo_completo(METODO_HASH)
+
+
+class Limitador:
+    """Janela deslizante de tentativas por chave (email, IP...)."""
+
+    def __init__(self, maximo, janela=JANELA_TENTATIVAS):
+        self.maximo = maximo
+        self.janela = janela
+        self._tentativas = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def registrar(self, chave):
+        """Conta uma tentativa. Retorna 0 se permitida, senão os segundos de espera."""
+        agora = time.monotonic()
+        with self._lock:
+            tentativas = self._tentativas[chave]
+            while tentativas and tentativas[0] <= agora - self.janela:
+                tentativas.popleft()
+
+            if len(tentativas) >= self.maximo:
+                return int(tentativas[0] + self.janela - agora) + 1
+
+            tentativas.append(agora)
+            # Evita que chaves que não voltam mais cresçam o dicionário
+            if len(self._tentativas) > 10000:
+                for antiga in [c for c, t in self._tentativas.items() if not t or t[-1] <= agora - self.janela]:
+                    del self._tentativas[antiga]
+            return 0
+
+    def limpar(self, chave):
+        with self._lock:
+            self._tentativas.pop(chave, None)
+
+
+limitador_email = Limitador(MAX_TENTATIVAS_EMAIL)
+limitador_ip = Limitador(MAX_TENTATIVAS_IP)
+
+
+def aguardar_tentativa(email, ip):
+    """Registra a tentativa no email e no IP; retorna os segundos de espera (0 = liberado).
+
+    Sem IP conhecido vale só o limite por email: um balde único para todos
+    os anônimos travaria o login do site inteiro numa rajada.
+    """
+    if ip:
+        espera = limitador_ip.registrar(ip)
+        if espera:
+            return espera
+    return limitador_email.registrar((email or "").strip().lower())
@@ -0,0 +1,72 @@
+"""Fixtures compartilhadas: cada teste roda numa pasta temporária, com banco próprio.
+
+Os módulos do app ficam na raiz do repositório e usam caminhos relativos
+(``uploads``, ``arquivo``), por isso a raiz entra no ``sys.path`` e o
+teste roda com a pasta temporária como diretório atual.
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from banco import GerenciadorBanco, migrar  # noqa: E402
+
+# Banco de exemplo versionado no repositório, no esquema anterior às migrações
+BANCO_ORIGINAL = os.path.join(RAIZ, "database.db")
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def banco(pasta):
+    banco = GerenciadorBanco(str(pasta / "database.db"))
+    migrar(banco)
+    yield banco
+    banco.fechar()
+
+
+@pytest.fixture
+def criar_usuario(banco):
+    def criar(nome="Produtor", email=None):
+        email = email or f"{nome.lower()}@exemplo.com"
+        with banco.transacao("users") as conn:
+            cursor = conn.execute("""
+                INSERT INTO users (nome, telefone, endereco, email, senha)
+                VALUES (?, '61999990000', 'Brasília', ?, 'hash')
+            """, (nome, email))
+        return cursor.lastrowid
+    return criar
+
+
+@pytest.fixture
+def criar_horta(banco):
+    def criar(usuario_id, nome="Horta", especie="alface", foto="", ativa=1):
+        with banco.transacao("hortas") as conn:
+            cursor = conn.execute("""
+                INSERT INTO hortas (nome_horta, usuario_id, foto, especie, dias_colheita, data_plantio,
+                                    contato, endereco, email, ativa)
+                VALUES (?, ?, ?, ?, 30, '2026-01-10', '61999990000', 'Brasília', 'horta@exemplo.com', ?)
+            """, (nome, usuario_id, foto, especie, ativa))
+        return cursor.lastrowid
+    return criar
+
+
+@pytest.fixture
+def postar(banco):
+    def criar(horta_id, usuario_id, data=None, foto="", descricao="Postagem"):
+        with banco.transacao("feed_hortas") as conn:
+            cursor = conn.execute("""
+                INSERT INTO feed_hortas (horta_id, usuario_id, foto, descricao, data_postagem)
+                VALUES (?, ?, ?, ?, ?)
+            """, (horta_id, usuario_id, foto, descricao, data or datetime.now()))
+        return cursor.lastrowid
+    return criar
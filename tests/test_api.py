@@ -0,0 +1,127 @@
+import gzip
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from api import criar_servidor, iniciar_api
+
+TOKEN = "segredo-de-teste"
+
+
+@pytest.fixture
+def api(banco):
+    servidor = criar_servidor(banco, "127.0.0.1", 0, TOKEN)
+    threading.Thread(target=servidor.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def pedir(api):
+    """(status, cabeçalhos, corpo) do GET; o corpo já vem descompactado."""
+    def pedir(caminho, token=TOKEN, **cabecalhos):
+        if token is not None:
+            cabecalhos["Authorization"] = f"Bearer {token}"
+        pedido = urllib.request.Request(api + caminho, headers={nome.replace("_", "-"): valor
+                                                                  for nome, valor in cabecalhos.items()})
+        try:
+            with urllib.request.urlopen(pedido, timeout=5) as resposta:
+                status, headers, corpo = resposta.status, resposta.headers, resposta.read()
+        except urllib.error.HTTPError as erro:
+            status, headers, corpo = erro.code, erro.headers, erro.read()
+        if headers.get("Content-Encoding") == "gzip":
+            corpo = gzip.decompress(corpo)
+        return status, headers, corpo
+    return pedir
+
+
+@pytest.fixture
+def hortas(criar_usuario, criar_horta):
+    usuario = criar_usuario()
+    ids = [criar_horta(usuario, nome=f"Horta {i}", especie="Alface" if i % 2 else "tomate") for i in range(8)]
+    criar_horta(usuario, nome="Desativada", especie="alface", ativa=0)
+    return ids
+
+
+def test_exige_o_segredo(pedir, hortas):
+    assert pedir("/api/hortas", token=None)[0] == 401
+    status, cabecalhos, _ = pedir("/api/hortas", token="errado")
+    assert status == 401
+    assert cabecalhos["WWW-Authenticate"].startswith("Bearer")
+
+
+def test_sem_segredo_nao_sobe(banco):
+    with pytest.raises(ValueError):
+        criar_servidor(banco, "127.0.0.1", 0, "")
+    assert iniciar_api(banco, porta=0, token=TOKEN) is None
+    assert iniciar_api(banco, porta=8503, token="") is None
+
+
+def test_hortas_por_especie_com_cursor(pedir, hortas):
+    status, cabecalhos, corpo = pedir("/api/hortas?especie=%20ALFACE&limite=3")
+    assert status == 200
+    assert cabecalhos["Content-Type"].startswith("application/json")
+    pagina = json.loads(corpo)
+    assert [horta["nome_horta"] for horta in pagina["hortas"]] == ["Horta 1", "Horta 3", "Horta 5"]
+    assert "email" not in pagina["hortas"][0]
+
+    pagina = json.loads(pedir(f"/api/hortas?especie=alface&limite=3&cursor={pagina['proximo']}")[2])
+    # A desativada não aparece e a última página não tem próximo cursor
+    assert [horta["nome_horta"] for horta in pagina["hortas"]] == ["Horta 7"]
+    assert pagina["proximo"] is None
+
+
+def test_feed_desde(pedir, criar_usuario, criar_horta, postar):
+    usuario = criar_usuario()
+    horta = criar_horta(usuario)
+    ids = [postar(horta, usuario, descricao=f"p{i}") for i in range(3)]
+    corpo = json.loads(pedir(f"/api/feed?desde={ids[0]}")[2])
+    assert [postagem["feed_id"] for postagem in corpo["postagens"]] == ids[1:]
+    assert corpo["ultimo"] == ids[-1]
+    assert json.loads(pedir(f"/api/feed?desde={ids[-1]}")[2]) == {"postagens": [], "ultimo": ids[-1]}
+
+
+@pytest.mark.parametrize("consulta", ["limite=abc", "limite=0", "limite=501", "cursor=-1"])
+def test_parametro_invalido(pedir, hortas, consulta):
+    status, _, corpo = pedir(f"/api/hortas?{consulta}")
+    assert status == 400
+    assert "erro" in json.loads(corpo)
+
+
+def test_rota_desconhecida(pedir):
+    assert pedir("/api/usuarios")[0] == 404
+
+
+def test_etag_e_304_ate_a_proxima_escrita(banco, pedir, hortas):
+    status, cabecalhos, _ = pedir("/api/hortas?limite=2&especie=alface")
+    etag, modificado = cabecalhos["ETag"], cabecalhos["Last-Modified"]
+    assert status == 200 and etag.startswith('W/"')
+
+    # Mesmos parâmetros em outra ordem: mesma representação
+    assert pedir("/api/hortas?especie=alface&limite=2", If_None_Match=etag)[0] == 304
+    assert pedir("/api/hortas?especie=alface&limite=2", If_Modified_Since=modificado)[0] == 304
+    assert pedir("/api/hortas?especie=alface&limite=2", If_Modified_Since="Mon, 01 Jan 2001 00:00:00 GMT")[0] == 200
+    # Outra consulta tem outro ETag
+    assert pedir("/api/hortas?especie=tomate&limite=2", If_None_Match=etag)[0] == 200
+
+    with banco.transacao("hortas") as conn:
+        conn.execute("UPDATE hortas SET nome_horta = 'Renomeada' WHERE horta_id = ?", (hortas[1],))
+    status, cabecalhos, corpo = pedir("/api/hortas?especie=alface&limite=2", If_None_Match=etag)
+    assert status == 200
+    assert cabecalhos["ETag"] != etag
+    assert json.loads(corpo)["hortas"][0]["nome_horta"] == "Renomeada"
+
+
+def test_gzip_quando_aceito(pedir, hortas):
+    _, cabecalhos, corpo = pedir("/api/hortas?limite=500", Accept_Encoding="gzip")
+    assert cabecalhos["Content-Encoding"] == "gzip"
+    assert cabecalhos["Vary"] == "Accept-Encoding"
+    assert len(json.loads(corpo)["hortas"]) == 8
+
+    _, cabecalhos, corpo_puro = pedir("/api/hortas?limite=500")
+    assert "Content-Encoding" not in cabecalhos
+    assert corpo_puro == corpo
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import pytest
+
+import arquivamento
+from arquivamento import arquivar_feed, caminho_mes, feed_arquivado, meses_arquivados
+
+
+@pytest.fixture
+def feed(banco, criar_usuario, criar_horta, postar):
+    """Duas postagens em março e uma em abril de 2024, mais uma de hoje."""
+    usuario = criar_usuario()
+    horta = criar_horta(usuario, nome="Horta Velha")
+    antigas = [postar(horta, usuario, datetime(2024, 3, dia)) for dia in (5, 20)]
+    antigas.append(postar(horta, usuario, datetime(2024, 4, 2)))
+    recente = postar(horta, usuario)
+    return antigas, recente
+
+
+def _total_resumos(banco):
+    with banco.conexao() as conn:
+        return conn.execute("SELECT coalesce(sum(postagens), 0) FROM resumo_postagens_dia").fetchone()[0]
+
+
+def _ids_quentes(banco):
+    with banco.conexao() as conn:
+        return [linha[0] for linha in conn.execute("SELECT feed_id FROM feed_hortas ORDER BY feed_id")]
+
+
+def test_arquiva_por_mes_e_mantem_as_recentes(banco, feed):
+    antigas, recente = feed
+    total = _total_resumos(banco)
+
+    assert arquivar_feed(banco, dias=30) == {"2024-03": 2, "2024-04": 1}
+    assert _ids_quentes(banco) == [recente]
+    assert meses_arquivados() == ["2024-04", "2024-03"]
+    # As análises continuam contando as postagens arquivadas
+    assert _total_resumos(banco) == total
+
+    with feed_arquivado(banco, ["2024-03", "2024-04", "2023-01"]) as conn:
+        linhas = conn.execute("SELECT feed_id, nome_horta, nome FROM feed_arquivado ORDER BY feed_id").fetchall()
+    assert [tuple(linha) for linha in linhas] == [(feed_id, "Horta Velha", "Produtor") for feed_id in antigas]
+
+
+def test_rodar_de_novo_nao_muda_nada(banco, feed):
+    arquivar_feed(banco, dias=30)
+    total = _total_resumos(banco)
+    with feed_arquivado(banco, ["2024-03", "2024-04"]) as conn:
+        arquivadas = conn.execute("SELECT * FROM feed_arquivado ORDER BY feed_id").fetchall()
+
+    assert arquivar_feed(banco, dias=30) == {}
+    assert _total_resumos(banco) == total
+    with feed_arquivado(banco, ["2024-03", "2024-04"]) as conn:
+        assert conn.execute("SELECT * FROM feed_arquivado ORDER BY feed_id").fetchall() == arquivadas
+
+
+def test_retoma_depois_de_falhar_entre_copiar_e_apagar(banco, feed, monkeypatch):
+    antigas, recente = feed
+
+    def falhar(*args):
+        raise OSError("disco cheio")
+
+    # Março já está copiado para o arquivo quando a cópia das fotos falha
+    monkeypatch.setattr(arquivamento, "copiar_foto", falhar)
+    with banco.transacao("feed_hortas") as conn:
+        conn.execute("UPDATE feed_hortas SET foto = 'uploads/x.jpg' WHERE feed_id = ?", (antigas[0],))
+    with pytest.raises(OSError):
+        arquivar_feed(banco, dias=30)
+    assert _ids_quentes(banco) == [*antigas, recente]
+    monkeypatch.undo()
+
+    assert arquivar_feed(banco, dias=30) == {"2024-03": 2, "2024-04": 1}
+    assert _ids_quentes(banco) == [recente]
+    with feed_arquivado(banco, ["2024-03"]) as conn:
+        assert tuple(conn.execute("SELECT count(*), count(DISTINCT feed_id) FROM feed_arquivado").fetchone()) == (2, 2)
+
+
+def test_nada_para_arquivar(banco, feed, pasta):
+    assert arquivar_feed(banco, dias=(datetime.now() - datetime(2024, 1, 1)).days + 1) == {}
+    assert not (pasta / caminho_mes("2024-03")).exists()
+    assert meses_arquivados() == []
+
+
+def test_meses_sem_arquivo_sao_ignorados_e_o_limite_vale(banco, feed, pasta):
+    arquivar_feed(banco, dias=30)
+    with feed_arquivado(banco, ["2024-03", "2024-03", "2019-01"]) as conn:
+        assert conn.execute("SELECT count(*) FROM feed_arquivado").fetchone()[0] == 2
+    with feed_arquivado(banco, ["2019-01"]) as conn:
+        assert conn.execute("SELECT count(*) FROM feed_arquivado").fetchone()[0] == 0
+
+    meses = [f"2023-{mes:02d}" for mes in range(1, 12)]
+    for mes in meses:
+        (pasta / caminho_mes(mes)).touch()
+    with pytest.raises(ValueError, match="No máximo"):
+        with feed_arquivado(banco, meses):
+            pass
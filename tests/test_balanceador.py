@@ -0,0 +1,121 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from balanceador import COOKIE, LIMITE_CABECALHO, Balanceador
+
+
+class ProcessoFalso:
+    def __init__(self, indice, porta, vivo=True):
+        self.indice = indice
+        self.porta = porta
+        self._vivo = vivo
+
+    def vivo(self):
+        return self._vivo
+
+
+@pytest.fixture
+def processo():
+    """Servidor HTTP/1.1 com keep-alive no lugar do Streamlit; anota cada pedido recebido."""
+    pedidos = []
+
+    class Eco(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _responder(self):
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            corpo = self.rfile.read(tamanho)
+            pedidos.append((self.command, self.path, self.headers.get_all("X-Forwarded-For"), corpo))
+            resposta = b"eco:" + corpo
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(resposta)))
+            self.end_headers()
+            self.wfile.write(resposta)
+
+        do_GET = do_POST = _responder
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Eco)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield servidor.server_port, pedidos
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _subir_proxy(processos):
+    laco = asyncio.new_event_loop()
+    servidor = laco.run_until_complete(
+        asyncio.start_server(Balanceador(processos).atender, "127.0.0.1", 0, limit=LIMITE_CABECALHO))
+    threading.Thread(target=laco.run_forever, daemon=True).start()
+
+    def parar():
+        laco.call_soon_threadsafe(servidor.close)
+        laco.call_soon_threadsafe(laco.stop)
+    return servidor.sockets[0].getsockname()[1], parar
+
+
+@pytest.fixture
+def proxy(processo):
+    porta, parar = _subir_proxy([ProcessoFalso(0, processo[0])])
+    yield porta
+    parar()
+
+
+def _trocar(porta, dados):
+    """Manda os bytes de uma vez e lê tudo até o proxy fechar a conexão."""
+    with socket.create_connection(("127.0.0.1", porta), timeout=5) as conexao:
+        conexao.sendall(dados)
+        recebido = b""
+        while parte := conexao.recv(65536):
+            recebido += parte
+    return recebido
+
+
+def test_pedidos_em_sequencia_na_mesma_conexao_nao_passam_sem_reescrita(proxy, processo):
+    _, pedidos = processo
+    resposta = _trocar(proxy, (
+        b"GET /primeiro HTTP/1.1\r\nHost: x\r\nX-Forwarded-For: 6.6.6.6\r\n\r\n"
+        b"GET /segundo HTTP/1.1\r\nHost: x\r\nX-Forwarded-For: 7.7.7.7\r\n"
+        b"Cookie: " + COOKIE.encode() + b"=0\r\n\r\n"
+    ))
+
+    # Um pedido por conexão: o segundo nunca chega ao processo com o IP forjado
+    assert pedidos == [("GET", "/primeiro", ["127.0.0.1"], b"")]
+    assert resposta.count(b"HTTP/1.") == 1
+    cabecalho = resposta.split(b"\r\n\r\n", 1)[0].lower()
+    assert b"\r\nconnection: close" in cabecalho
+    assert b"keep-alive" not in cabecalho
+    assert b"set-cookie: " + COOKIE.encode() + b"=0" in cabecalho
+
+
+def test_corpo_do_pedido_e_repassado_so_ate_o_content_length(proxy, processo):
+    _, pedidos = processo
+    resposta = _trocar(proxy, (
+        b"POST /upload HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n\r\nabcde"
+        b"GET /depois HTTP/1.1\r\nHost: x\r\nX-Forwarded-For: 6.6.6.6\r\n\r\n"
+    ))
+
+    assert pedidos == [("POST", "/upload", ["127.0.0.1"], b"abcde")]
+    assert resposta.endswith(b"eco:abcde")
+
+
+def test_corpo_sem_tamanho_e_recusado(proxy, processo):
+    _, pedidos = processo
+    resposta = _trocar(proxy, b"POST / HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n")
+    assert resposta.startswith(b"HTTP/1.1 411")
+    assert pedidos == []
+
+
+def test_sem_processo_vivo(processo):
+    porta, parar = _subir_proxy([ProcessoFalso(0, processo[0], vivo=False)])
+    try:
+        assert _trocar(porta, b"GET / HTTP/1.1\r\nHost: x\r\n\r\n").startswith(b"HTTP/1.1 503")
+    finally:
+        parar()
@@ -0,0 +1,75 @@
+import io
+import os
+import time
+
+import pytest
+
+from midia import CARENCIA_COLETA, UPLOAD_FOLDER, coletar_lixo, normalizar_caminho, registrar_imagem, salvar_conteudo
+
+
+def _png(cor):
+    from PIL import Image
+
+    saida = io.BytesIO()
+    Image.new("RGB", (32, 32), cor).save(saida, format="PNG")
+    return saida.getvalue()
+
+
+@pytest.fixture
+def enviar(banco):
+    """Grava uma foto como o app faz no upload; ``idade`` em segundos recua o mtime."""
+    def enviar(cor, idade=0):
+        caminho = salvar_conteudo(_png(cor), UPLOAD_FOLDER)
+        with banco.transacao("imagens") as conn:
+            registrar_imagem(conn, caminho)
+        if idade:
+            antigo = time.time() - idade
+            os.utime(normalizar_caminho(caminho), (antigo, antigo))
+        return caminho
+    return enviar
+
+
+def _existe(caminho):
+    return os.path.exists(normalizar_caminho(caminho))
+
+
+def test_apaga_so_fotos_sem_referencia_fora_da_carencia(banco, enviar, criar_usuario, criar_horta):
+    citada = enviar("green", idade=2 * CARENCIA_COLETA)
+    criar_horta(criar_usuario(), foto=citada)
+    antiga = enviar("red", idade=2 * CARENCIA_COLETA)
+    recente = enviar("blue")
+
+    assert coletar_lixo(banco, UPLOAD_FOLDER) == [antiga]
+    assert not _existe(antiga)
+    assert _existe(citada) and _existe(recente)
+    with banco.conexao() as conn:
+        assert conn.execute("SELECT count(*) FROM imagens WHERE original = ?", (antiga,)).fetchone()[0] == 0
+
+
+def test_simular_nao_apaga(banco, enviar):
+    antiga = enviar("red", idade=2 * CARENCIA_COLETA)
+    assert coletar_lixo(banco, UPLOAD_FOLDER, simular=True) == [antiga]
+    assert _existe(antiga)
+
+
+def test_reenvio_renova_a_carencia(banco, enviar):
+    antiga = enviar("red", idade=2 * CARENCIA_COLETA)
+    # Mesmo conteúdo enviado de novo antes da linha que o cita ser gravada
+    assert enviar("red") == antiga
+    assert coletar_lixo(banco, UPLOAD_FOLDER) == []
+    assert _existe(antiga)
+
+
+def test_apenas_examina_as_fotos_informadas(banco, enviar, criar_usuario, criar_horta):
+    uma = enviar("red", idade=2 * CARENCIA_COLETA)
+    outra = enviar("blue", idade=2 * CARENCIA_COLETA)
+    horta = criar_horta(criar_usuario(), foto=uma)
+    with banco.transacao("hortas") as conn:
+        conn.execute("DELETE FROM hortas WHERE horta_id = ?", (horta,))
+
+    assert coletar_lixo(banco, UPLOAD_FOLDER, apenas=[uma]) == [uma]
+    assert _existe(outra)
+    # Recente demais: fica para a coleta periódica
+    recente = enviar("yellow")
+    assert coletar_lixo(banco, UPLOAD_FOLDER, apenas=[recente]) == []
+    assert coletar_lixo(banco, UPLOAD_FOLDER, carencia=0, apenas=[recente]) == [recente]
@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+
+import pytest
+
+from banco import EscritorLote
+
+
+@pytest.fixture
+def escritor(banco):
+    with banco.transacao() as conn:
+        conn.execute("CREATE TABLE registros (valor TEXT NOT NULL)")
+    escritor = EscritorLote(banco, espera=0.05)
+    yield escritor
+    escritor.fechar()
+
+
+def _inserir(valor):
+    def gravar(conn):
+        return conn.execute("INSERT INTO registros VALUES (?)", (valor,)).lastrowid
+    return gravar
+
+
+def _valores(banco):
+    with banco.conexao() as conn:
+        return sorted(linha[0] for linha in conn.execute("SELECT valor FROM registros"))
+
+
+def test_grava_em_lote_e_avanca_a_geracao(banco, escritor):
+    geracao = banco.geracao("registros")
+    futuros = [escritor.enviar(_inserir(f"v{i}"), ["registros"]) for i in range(5)]
+    assert all(futuro.result(timeout=5) for futuro in futuros)
+    assert _valores(banco) == [f"v{i}" for i in range(5)]
+    assert banco.geracao("registros") > geracao
+
+
+def test_mesma_chave_na_fila_e_mesclada(banco, escritor):
+    liberar = threading.Event()
+    # Segura a thread do escritor para os dois pedidos seguintes ficarem na fila
+    bloqueio = escritor.enviar(lambda conn: liberar.wait(5), ["registros"])
+    primeiro = escritor.enviar(_inserir("a"), ["registros"], chave="post-1")
+    segundo = escritor.enviar(_inserir("b"), ["registros"], chave="post-1")
+    liberar.set()
+
+    assert segundo is primeiro
+    primeiro.result(timeout=5)
+    bloqueio.result(timeout=5)
+    assert _valores(banco) == ["a"]
+
+
+def test_chave_liberada_quando_o_lote_sai_da_fila(banco, escritor):
+    executando = threading.Event()
+    liberar = threading.Event()
+
+    def lento(conn):
+        executando.set()
+        liberar.wait(5)
+        return _inserir("a")(conn)
+
+    primeiro = escritor.enviar(lento, ["registros"], chave="post-1")
+    assert executando.wait(5)
+    # O primeiro já está sendo gravado: este não pode receber o Future dele
+    segundo = escritor.enviar(_inserir("b"), ["registros"], chave="post-1")
+    liberar.set()
+
+    assert segundo is not primeiro
+    segundo.result(timeout=5)
+    assert _valores(banco) == ["a", "b"]
+
+
+def test_erro_em_um_pedido_nao_derruba_o_lote(banco, escritor):
+    liberar = threading.Event()
+    bloqueio = escritor.enviar(lambda conn: liberar.wait(5), ["registros"])
+
+    def parcial(conn):
+        _inserir("desfeito")(conn)
+        raise ValueError("falhou no meio")
+
+    antes = escritor.enviar(_inserir("antes"), ["registros"])
+    com_erro = escritor.enviar(parcial, ["registros"])
+    nulo = escritor.enviar(_inserir(None), ["registros"])
+    depois = escritor.enviar(_inserir("depois"), ["registros"])
+    liberar.set()
+
+    bloqueio.result(timeout=5)
+    assert antes.result(timeout=5) and depois.result(timeout=5)
+    with pytest.raises(ValueError, match="falhou no meio"):
+        com_erro.result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        nulo.result(timeout=5)
+    # O SAVEPOINT desfaz só o que o pedido com erro escreveu
+    assert _valores(banco) == ["antes", "depois"]
+
+
+def test_fechar_grava_o_que_esta_na_fila(banco):
+    with banco.transacao() as conn:
+        conn.execute("CREATE TABLE registros (valor TEXT NOT NULL)")
+    escritor = EscritorLote(banco, espera=1)
+    futuros = [escritor.enviar(_inserir(f"v{i}"), ["registros"]) for i in range(3)]
+    escritor.fechar()
+    assert all(futuro.done() for futuro in futuros)
+    assert _valores(banco) == ["v0", "v1", "v2"]
@@ -0,0 +1,97 @@
+import io
+import sqlite3
+
+import pytest
+
+import lote
+from lote import importar_hortas, ler_planilha, validar_hortas
+
+CABECALHO = "nome_horta,especie,dias_colheita,contato,endereco,email,latitude,longitude,data_plantio\n"
+
+
+def _planilha(*linhas, cabecalho=CABECALHO):
+    return ler_planilha(io.BytesIO((cabecalho + "\n".join(linhas) + "\n").encode()), "hortas.csv")
+
+
+def test_colunas_obrigatorias_ausentes():
+    with pytest.raises(ValueError, match="dias_colheita"):
+        _planilha("Horta,alface,a@x", cabecalho="nome_horta,especie,email\n")
+
+
+def test_colunas_opcionais_e_cabecalho_normalizados():
+    df = _planilha("Horta,alface,30,6199,Brasília,a@x", cabecalho=" Nome_Horta ,ESPECIE,dias_colheita,contato,endereco,email\n")
+    assert df.loc[0, "nome_horta"] == "Horta"
+    assert df["foto"].isna().all() and df["data_plantio"].isna().all()
+
+
+def test_validacao_aponta_linha_e_motivos():
+    df = _planilha(
+        "Boa,alface,30,6199,Brasília,a@x,-15.8,-47.9,2026-01-10",
+        ",alface,30,6199,Brasília,a@x,,,",
+        "Dias,alface,2.5,6199,Brasília,a@x,,,",
+        "Email,alface,30,6199,Brasília,sem-arroba,,,",
+        "Coordenada,alface,30,6199,Brasília,a@x,95,-200,",
+        "Data,alface,0,6199,Brasília,a@x,,,10/01/2026",
+    )
+    validas, erros = validar_hortas(df)
+
+    assert list(validas["nome_horta"]) == ["Boa"]
+    assert validas.iloc[0]["data_plantio"] == "2026-01-10"
+    motivos = dict(zip(erros["linha"], erros["motivo"]))
+    # Linha 2 da planilha é a primeira depois do cabeçalho
+    assert set(motivos) == {3, 4, 5, 6, 7}
+    assert motivos[3] == "campo obrigatório vazio"
+    assert motivos[4] == "dias_colheita deve ser um inteiro >= 1"
+    assert motivos[5] == "email inválido"
+    assert motivos[6] == "latitude fora de -90..90; longitude fora de -180..180"
+    assert motivos[7] == "dias_colheita deve ser um inteiro >= 1; data_plantio deve estar no formato AAAA-MM-DD"
+
+
+def test_importar_grava_so_as_validas(banco, criar_usuario):
+    admin = criar_usuario("Admin")
+    dono = criar_usuario("Dono", email="dono@exemplo.com")
+    df = _planilha(
+        "Do dono,alface,30,6199,Brasília,DONO@exemplo.com,-15.8,-47.9,2026-01-10",
+        "Sem conta,tomate,45,6199,Brasília,novo@exemplo.com,,,",
+        "Inválida,tomate,-1,6199,Brasília,novo@exemplo.com,,,",
+    )
+    inseridas, erros = importar_hortas(banco, df, admin)
+
+    assert inseridas == 2
+    assert list(erros["linha"]) == [4]
+    with banco.conexao() as conn:
+        hortas = {linha["nome_horta"]: linha for linha in conn.execute("SELECT * FROM hortas")}
+    assert set(hortas) == {"Do dono", "Sem conta"}
+    # O dono é o usuário com o mesmo email; sem conta, o usuário padrão
+    assert hortas["Do dono"]["usuario_id"] == dono
+    assert hortas["Sem conta"]["usuario_id"] == admin
+    assert hortas["Do dono"]["data_colheita"] == "2026-02-09"
+    assert hortas["Sem conta"]["data_plantio"] is None
+
+
+def test_importar_sem_validas_nao_grava(banco, criar_usuario):
+    admin = criar_usuario("Admin")
+    inseridas, erros = importar_hortas(banco, _planilha(",alface,30,6199,Brasília,a@x,,,"), admin)
+    assert (inseridas, len(erros)) == (0, 1)
+    with banco.conexao() as conn:
+        assert conn.execute("SELECT count(*) FROM hortas").fetchone()[0] == 0
+
+
+def test_geocodificacao_fora_da_transacao(banco, criar_usuario, monkeypatch):
+    admin = criar_usuario("Admin")
+
+    def geocodificar(endereco):
+        # Outra conexão consegue o lock de escrita: a importação ainda não abriu a transação
+        conn = sqlite3.connect(banco.caminho, timeout=0, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+        return -15.8, -47.9
+
+    monkeypatch.setattr(lote, "geocodificar", geocodificar)
+    inseridas, _ = importar_hortas(banco, _planilha("Sem coordenadas,alface,30,6199,Brasília,a@x.com,,,"), admin)
+    assert inseridas == 1
+    with banco.conexao() as conn:
+        assert tuple(conn.execute("SELECT latitude, longitude FROM hortas").fetchone()) == (-15.8, -47.9)
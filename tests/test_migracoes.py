@@ -0,0 +1,58 @@
+import shutil
+import sqlite3
+
+from banco import MIGRACOES, GerenciadorBanco, coluna_existe, migrar, versao_esquema
+
+from conftest import BANCO_ORIGINAL
+
+ULTIMA_VERSAO = MIGRACOES[-1][0]
+
+
+def _tabelas(conn):
+    return {linha[0] for linha in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+
+
+def test_banco_novo_chega_na_ultima_versao(banco):
+    with banco.conexao() as conn:
+        assert versao_esquema(conn) == ULTIMA_VERSAO
+        tabelas = _tabelas(conn)
+        assert {"users", "hortas", "feed_hortas", "feed_cards", "imagens", "referencias_imagens",
+                "demandas", "correspondencias", "alteracoes", "arquivamento_em_curso"} <= tabelas
+        assert coluna_existe(conn, "hortas", "data_colheita")
+        assert coluna_existe(conn, "alteracoes", "alterada_em")
+
+
+def test_migrar_de_novo_nao_faz_nada(banco):
+    with banco.conexao() as conn:
+        antes = conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall()
+    assert migrar(banco) == ULTIMA_VERSAO
+    with banco.conexao() as conn:
+        assert conn.execute("SELECT sql FROM sqlite_master ORDER BY name").fetchall() == antes
+
+
+def test_banco_original_migra_sem_perder_dados(pasta):
+    caminho = str(pasta / "original.db")
+    shutil.copy(BANCO_ORIGINAL, caminho)
+    with sqlite3.connect(caminho) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        hortas = conn.execute("SELECT horta_id, nome_horta FROM hortas ORDER BY horta_id").fetchall()
+        postagens = conn.execute("SELECT feed_id FROM feed_hortas ORDER BY feed_id").fetchall()
+        usuarios = conn.execute("SELECT count(*) FROM users").fetchone()[0]
+
+    banco = GerenciadorBanco(caminho)
+    try:
+        assert migrar(banco) == ULTIMA_VERSAO
+        with banco.conexao() as conn:
+            assert [tuple(linha) for linha in conn.execute(
+                "SELECT horta_id, nome_horta FROM hortas ORDER BY horta_id")] == hortas
+            assert conn.execute("SELECT count(*) FROM users").fetchone()[0] == usuarios
+            # As projeções e índices novos são preenchidos com os dados que já existiam
+            assert [tuple(linha) for linha in conn.execute(
+                "SELECT feed_id FROM feed_cards ORDER BY feed_id")] == [tuple(linha) for linha in postagens]
+            alfaces = {linha[0] for linha in conn.execute("SELECT horta_id FROM hortas WHERE lower(especie) = 'alface'")}
+            assert alfaces
+            assert {linha[0] for linha in conn.execute(
+                "SELECT rowid FROM hortas_fts WHERE hortas_fts MATCH 'especie:alface'")} == alfaces
+            assert conn.execute("SELECT count(*) FROM hortas WHERE ativa = 1").fetchone()[0] == len(hortas)
+    finally:
+        banco.fechar()
@@ -0,0 +1,64 @@
+import pytest
+
+import senhas
+from senhas import Limitador, aguardar_tentativa, precisa_rehash
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Relógio controlado pelo teste no lugar de time.monotonic."""
+    agora = [1000.0]
+    monkeypatch.setattr(senhas.time, "monotonic", lambda: agora[0])
+    return agora
+
+
+def test_limitador_bloqueia_depois_do_maximo(relogio):
+    limitador = Limitador(maximo=3, janela=60)
+    assert [limitador.registrar("a@x") for _ in range(3)] == [0, 0, 0]
+    assert limitador.registrar("a@x") == 61
+    # Outra chave tem a própria janela
+    assert limitador.registrar("b@x") == 0
+
+
+def test_limitador_janela_deslizante(relogio):
+    limitador = Limitador(maximo=2, janela=60)
+    limitador.registrar("ip")
+    relogio[0] += 30
+    limitador.registrar("ip")
+    relogio[0] += 20
+    assert limitador.registrar("ip") == 11  # a primeira sai da janela em 10s
+    relogio[0] += 10
+    assert limitador.registrar("ip") == 0
+    # A tentativa recusada não conta
+    assert limitador.registrar("ip") == 31
+
+
+def test_limitador_limpar(relogio):
+    limitador = Limitador(maximo=1, janela=60)
+    limitador.registrar("ip")
+    assert limitador.registrar("ip") > 0
+    limitador.limpar("ip")
+    assert limitador.registrar("ip") == 0
+
+
+def test_sem_ip_vale_so_o_limite_por_email(relogio, monkeypatch):
+    monkeypatch.setattr(senhas, "limitador_ip", Limitador(maximo=1, janela=60))
+    monkeypatch.setattr(senhas, "limitador_email", Limitador(maximo=5, janela=60))
+    # Usuários diferentes sem IP conhecido não dividem um balde
+    assert [aguardar_tentativa(f"u{i}@x", None) for i in range(5)] == [0] * 5
+    assert aguardar_tentativa("a@x", "10.0.0.1") == 0
+    assert aguardar_tentativa("b@x", "10.0.0.1") > 0
+
+
+@pytest.mark.parametrize("metodo, hash_gravado, esperado", [
+    ("scrypt:32768:8:1", "scrypt:32768:8:1$s$h", False),
+    ("scrypt", "scrypt:32768:8:1$s$h", False),
+    ("scrypt:32768:8:1", "scrypt:16384:8:1$s$h", True),
+    ("pbkdf2:sha256", f"pbkdf2:sha256:{senhas.DEFAULT_PBKDF2_ITERATIONS}$s$h", False),
+    ("pbkdf2", f"pbkdf2:sha256:{senhas.DEFAULT_PBKDF2_ITERATIONS}$s$h", False),
+    ("pbkdf2:sha256:600000", "pbkdf2:sha256:1000$s$h", True),
+    ("scrypt:32768:8:1", f"pbkdf2:sha256:{senhas.DEFAULT_PBKDF2_ITERATIONS}$s$h", True),
+])
+def test_precisa_rehash(monkeypatch, metodo, hash_gravado, esperado):
+    monkeypatch.setattr(senhas, "METODO_HASH", metodo)
+    assert precisa_rehash(hash_gravado) is esperado